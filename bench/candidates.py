@@ -0,0 +1,113 @@
+""" -- bench/candidates.py
+
+Benchmarks scoring and ranking of candidate places as lists of dicts (the
+previous pipeline: sort by rating, add distance and travel totals to every
+dict, sort by total) against the columnar CandidateSet, which only
+materialises the dicts of the places that are returned.
+
+Use: python -m bench.candidates [candidates]
+
+[candidates] is the number of candidate places, default 10000. Time is the
+median of RUNS runs; memory is the peak traced allocation of one run.
+"""
+
+import sys
+import time
+import random
+import statistics
+import tracemalloc
+
+from convergence.core.candidates import CandidateSet
+from convergence.utils import geo
+from convergence.utils.point import Point
+
+USERS = 8
+TOP = 10
+RUNS = 5
+SEED = 20
+CENTRE = Point(51.5074, -0.1278)  # London
+
+
+def fake_places(rng, no_places):
+    return [{
+        "id": idx,
+        "gm_id": f"bench-{idx}",
+        "name": f"Place {idx}",
+        "lat": CENTRE.lat + rng.uniform(-0.1, 0.1),
+        "long": CENTRE.long + rng.uniform(-0.15, 0.15),
+        "gm_price": rng.choice([None, 1, 2, 3]),
+        "gm_rating": rng.choice([None, 0, 3.5, 4.0, 4.2, 4.5]),
+        "gm_types": ["bar", "restaurant"],
+        "address": "Fake Address"
+    } for idx in range(no_places)]
+
+
+def dict_pipeline(places, users, dist_matrix):
+    """Previous pipeline, each step walks (and mutates) every dict"""
+    for place in places:
+        if not place["gm_rating"]:
+            place["gm_rating"] = 1
+    places = sorted(places, key=lambda x: x["gm_rating"], reverse=True)
+    distances = geo.distance_matrix(
+        users,
+        [(place["lat"], place["long"]) for place in places]
+    )
+    for place, total in zip(places, distances.sum(axis=0)):
+        place["distance_total"] = float(total)
+    places = sorted(places, key=lambda x: x["distance_total"])
+    for place in places:
+        place["travel_total"] = 0
+    for user_to_places in dist_matrix:
+        for place_idx, duration in enumerate(user_to_places):
+            places[place_idx]["travel_total"] += duration
+    return sorted(places, key=lambda x: x["travel_total"])[:TOP]
+
+
+def columnar_pipeline(places, users, dist_matrix):
+    candidates = CandidateSet.from_places(places).top_by_rating(len(places))
+    candidates = candidates.take(
+        candidates.distance_totals(users).argsort(kind="stable")
+    )
+    return candidates.with_travel_totals(
+        dist_matrix
+    ).sorted_by_travel_total().take(slice(TOP)).to_dicts()
+
+
+def measure(pipeline, places, users, dist_matrix):
+    times = []
+    for _ in range(RUNS):
+        copies = [dict(place) for place in places]
+        start = time.perf_counter()
+        pipeline(copies, users, dist_matrix)
+        times.append(time.perf_counter() - start)
+    copies = [dict(place) for place in places]
+    tracemalloc.start()
+    result = pipeline(copies, users, dist_matrix)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak, result
+
+
+def main(no_places):
+    rng = random.Random(SEED)
+    places = fake_places(rng, no_places)
+    users = [Point(CENTRE.lat + rng.uniform(-0.2, 0.2),
+                   CENTRE.long + rng.uniform(-0.3, 0.3))
+             for _ in range(USERS)]
+    dist_matrix = [[rng.randint(300, 5400) for _ in places]
+                   for _ in users]
+    print(f"{no_places} candidates, {USERS} users, top {TOP}")
+    print(f"{'pipeline':>10} {'time (ms)':>10} {'peak memory (KiB)':>18}")
+    results = []
+    for name, pipeline in [("dicts", dict_pipeline),
+                           ("columnar", columnar_pipeline)]:
+        elapsed, peak, result = measure(pipeline, places, users,
+                                        dist_matrix)
+        results.append([place["gm_id"] for place in result])
+        print(f"{name:>10} {elapsed * 1000:>10.1f} {peak / 1024:>18.0f}")
+    if results[0] != results[1]:
+        print("Warning: pipelines returned different rankings")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
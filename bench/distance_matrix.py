@@ -0,0 +1,101 @@
+""" -- bench/distance_matrix.py
+
+Benchmarks google_maps.get_distance_matrix against a local stub of the
+Distance Matrix API, comparing sequential chunk requests (one worker, as
+before) with the concurrent, rate-limited requests.
+
+Use: python -m bench.distance_matrix [latency]
+
+[latency] is the simulated upstream latency per request in seconds,
+default 0.2. No Google API key or network access is needed.
+"""
+
+import sys
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+from convergence.apis import google_maps
+from convergence.utils.point import Point
+
+SIZES = [(10, 10), (10, 40), (25, 40), (40, 60)]  # (origins, destinations)
+WORKERS = [1, 2, 4, 8]
+PREVIOUS_SLEEP = 1  # seconds slept between chunks by the old implementation
+
+
+class StubDistanceMatrix(BaseHTTPRequestHandler):
+    latency = 0.2
+    requests = 0
+    elements = 0
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+        origins = list(filter(None, unquote(query["origins"][0]).split("|")))
+        destinations = list(filter(
+            None,
+            unquote(query["destinations"][0]).split("|")
+        ))
+        time.sleep(self.latency)
+        rows = [
+            {"elements": [
+                {"status": "OK", "duration": {"value": 60 * (i + j)}}
+                for j, _ in enumerate(destinations)
+            ]}
+            for i, _ in enumerate(origins)
+        ]
+        StubDistanceMatrix.requests += 1
+        StubDistanceMatrix.elements += len(origins) * len(destinations)
+        body = json.dumps({"status": "OK", "rows": rows}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def points(n, offset):
+    return [Point(51 + offset + i * 0.001, -0.1 + i * 0.001) for i in range(n)]
+
+
+def main(latency):
+    StubDistanceMatrix.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDistanceMatrix)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    google_maps.GM_TRAVEL_TIME_URL = \
+        f"http://127.0.0.1:{server.server_port}/distancematrix/json?" \
+        "origins={:s}&destinations={:s}&mode={:s}&key={:s}"
+
+    print(f"Stub latency: {latency * 1000:.0f}ms per request")
+    print(f"{'size':>8} {'requests':>9} {'old (s)':>8}" +
+          "".join(f" {f'{w} worker(s)':>12}" for w in WORKERS))
+    for n_origins, n_destinations in SIZES:
+        origins = points(n_origins, 0)
+        destinations = points(n_destinations, 0.5)
+        timings = []
+        expected = None
+        for workers in WORKERS:
+            google_maps.matrix_executor = ThreadPoolExecutor(workers)
+            StubDistanceMatrix.requests = 0
+            start = time.perf_counter()
+            matrix = google_maps.get_distance_matrix(
+                origins, destinations, "transit"
+            )
+            timings.append(time.perf_counter() - start)
+            if expected is None:
+                expected = matrix
+            assert matrix == expected, "output differs between worker counts"
+        no_requests = StubDistanceMatrix.requests
+        old = timings[0] + PREVIOUS_SLEEP * max(0, no_requests - 1)
+        print(f"{n_origins:>3}x{n_destinations:<4} {no_requests:>9} "
+              f"{old:>8.2f}" + "".join(f" {t:>12.2f}" for t in timings))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.2)
@@ -0,0 +1,98 @@
+""" -- bench/origin_clustering.py
+
+Benchmarks the Distance Matrix cost of a 200-member event with one origin
+per member (as before) against one origin per cluster of co-located
+members (location.cluster_points with ORIGIN_SNAP_DISTANCE), using the
+local stub of the Distance Matrix API from bench/distance_matrix.py.
+
+Use: python -m bench.origin_clustering [latency]
+
+[latency] is the simulated upstream latency per request in seconds,
+default 0.2. No Google API key or network access is needed.
+"""
+
+import sys
+import time
+import math
+import random
+import threading
+from http.server import ThreadingHTTPServer
+
+from bench.distance_matrix import StubDistanceMatrix
+from convergence.apis import google_maps
+from convergence.core import location
+from convergence.core.places import ORIGIN_SNAP_DISTANCE
+from convergence.utils.point import Point
+from convergence.utils.rate_limiter import TokenBucket
+
+MEMBERS = 200
+PLACES = 10
+CENTRE = Point(51.5074, -0.1278)  # London
+METRES_PER_DEGREE = 111195
+SEED = 16
+
+
+def offset(rng, point, spread):
+    """Random point within about spread metres of point"""
+    lat = point.lat + rng.gauss(0, spread) / METRES_PER_DEGREE
+    long = point.long + rng.gauss(0, spread) / (
+        METRES_PER_DEGREE * math.cos(math.radians(point.lat))
+    )
+    return Point(lat, long)
+
+
+def grouped_members(rng, no_groups, group_spread):
+    """Members around no_groups random addresses within ~10km of CENTRE"""
+    groups = [offset(rng, CENTRE, 10000) for _ in range(no_groups)]
+    return [offset(rng, rng.choice(groups), group_spread)
+            for _ in range(MEMBERS)]
+
+
+SCENARIOS = [
+    ("20 buildings", lambda rng: grouped_members(rng, 20, 20)),
+    ("50 streets", lambda rng: grouped_members(rng, 50, 60)),
+    ("100 streets", lambda rng: grouped_members(rng, 100, 60)),
+    ("scattered", lambda rng: grouped_members(rng, MEMBERS, 1000)),
+]
+
+
+def timed_matrix(origins, destinations):
+    StubDistanceMatrix.requests = 0
+    StubDistanceMatrix.elements = 0
+    # start every run with a full element quota
+    google_maps.element_limiter = TokenBucket(google_maps.element_limiter.rate)
+    start = time.perf_counter()
+    google_maps.get_distance_matrix(origins, destinations, "transit")
+    return (time.perf_counter() - start, StubDistanceMatrix.requests,
+            StubDistanceMatrix.elements)
+
+
+def main(latency):
+    StubDistanceMatrix.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDistanceMatrix)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    google_maps.GM_TRAVEL_TIME_URL = \
+        f"http://127.0.0.1:{server.server_port}/distancematrix/json?" \
+        "origins={:s}&destinations={:s}&mode={:s}&key={:s}"
+
+    rng = random.Random(SEED)
+    print(f"{MEMBERS} members, {PLACES} places, snap distance "
+          f"{ORIGIN_SNAP_DISTANCE}m, stub latency {latency * 1000:.0f}ms")
+    print(f"{'scenario':>14} {'origins':>8} {'cluster (ms)':>13} "
+          f"{'elements':>17} {'requests':>13} {'time (s)':>13}")
+    for name, make_members in SCENARIOS:
+        members = make_members(rng)
+        destinations = [offset(rng, CENTRE, 3000) for _ in range(PLACES)]
+        start = time.perf_counter()
+        origins, _ = location.cluster_points(members, ORIGIN_SNAP_DISTANCE)
+        cluster_ms = (time.perf_counter() - start) * 1000
+        old = timed_matrix(members, destinations)
+        new = timed_matrix(origins, destinations)
+        print(f"{name:>14} {len(origins):>8} {cluster_ms:>13.1f} "
+              f"{old[2]:>8} -> {new[2]:<5} {old[1]:>6} -> {new[1]:<4} "
+              f"{old[0]:>6.2f} -> {new[0]:<5.2f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.2)
@@ -0,0 +1,113 @@
+""" -- bench/places_radius.py
+
+Benchmarks PlaceStore.get_places_around_point against the previous
+full-scan query (great-circle expression only) for growing numbers of
+cached places.
+
+Use: python -m bench.places_radius <db_url> [sizes]
+
+<db_url> should point to a scratch PostgreSQL database: the script inserts
+synthetic places (gm_id prefixed with "bench-") and removes them when done.
+[sizes] is an optional comma-separated list, default 10000,100000,1000000.
+"""
+
+import sys
+import time
+import random
+import statistics
+
+from convergence.data.convergence_db import ConvergenceDB
+from convergence.data.models import Place
+from convergence.data.repo import PlaceStore
+from convergence.utils.point import Point
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+BATCH_SIZE = 10000
+QUERIES_PER_SIZE = 50
+RADII = [1500, 5000, 15000]
+GB_BOUNDS = (50.0, 58.5, -6.0, 1.8)  # min_lat, max_lat, min_long, max_long
+PLACE_TYPES = ["bar", "cafe", "restaurant", "art_gallery", "museum"]
+
+
+def random_point(rng):
+    return Point(rng.uniform(*GB_BOUNDS[:2]), rng.uniform(*GB_BOUNDS[2:]))
+
+
+def fill_places(session, rng, current, target):
+    """Insert synthetic places until there are target bench places"""
+    while current < target:
+        batch = min(BATCH_SIZE, target - current)
+        session.bulk_insert_mappings(Place, [
+            {
+                "gm_id": f"bench-{current + i}",
+                "name": f"Bench place {current + i}",
+                "lat": rng.uniform(*GB_BOUNDS[:2]),
+                "long": rng.uniform(*GB_BOUNDS[2:]),
+                "gm_rating": rng.randint(1, 5),
+                "gm_types": rng.sample(PLACE_TYPES, 2)
+            }
+            for i in range(batch)
+        ])
+        session.commit()
+        current += batch
+    session.execute("ANALYZE places")
+    session.commit()
+    return current
+
+
+def time_query(query, centres):
+    timings = []
+    for point, radius in centres:
+        start = time.perf_counter()
+        query(point, radius)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def full_scan(session):
+    def query(point, radius):
+        return session.query(Place) \
+                      .filter(Place.within_range(point, radius)) \
+                      .all()
+    return query
+
+
+def main(db_url, sizes):
+    db = ConvergenceDB(db_url)
+    db.initialise_tables()
+    for index in Place.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    session = db.create_session()
+    place_store = PlaceStore(session)
+    rng = random.Random(42)
+    centres = [(random_point(rng), rng.choice(RADII))
+               for _ in range(QUERIES_PER_SIZE)]
+
+    print(f"{'places':>10} {'full scan (ms)':>22} {'bbox + index (ms)':>22}")
+    print(f"{'':>10} {'median':>10} {'max':>11} {'median':>10} {'max':>11}")
+    current = 0
+    try:
+        for size in sorted(sizes):
+            current = fill_places(session, rng, current, size)
+            scan_median, scan_max = time_query(full_scan(session), centres)
+            bbox_median, bbox_max = time_query(
+                place_store.get_places_around_point,
+                centres
+            )
+            print(f"{size:>10} {scan_median:>10.2f} {scan_max:>11.2f} "
+                  f"{bbox_median:>10.2f} {bbox_max:>11.2f}")
+    finally:
+        session.rollback()
+        session.query(Place).filter(Place.gm_id.like("bench-%")) \
+                            .delete(synchronize_session=False)
+        session.commit()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    sizes = DEFAULT_SIZES
+    if len(sys.argv) > 2:
+        sizes = [int(size) for size in sys.argv[2].split(",")]
+    main(sys.argv[1], sizes)
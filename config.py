@@ -1,2 +1,101 @@
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 JWT_TOKEN_LOCATION = "cookies"
+
+# In-memory index of cached places, see convergence/data/place_index.py
+PLACE_INDEX_ENABLED = False
+PLACE_INDEX_MAX_PLACES = 250000
+PLACE_INDEX_REFRESH_INTERVAL = 60  # seconds
+
+# Places cache, see convergence/core/places.py
+PLACES_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+# wait for every page of a Nearby Places search, rather than fetching the
+# pages after the first in the background when there are enough places
+PLACES_SYNC_PAGINATION = False
+
+# Travel time cache, see convergence/core/travel_times.py
+TRAVEL_TIME_CACHE_CELL_SIZE = 0.005  # degrees, roughly 550m of latitude
+TRAVEL_TIME_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+TRAVEL_TIME_CACHE_MAX_ENTRIES = 1000000
+# expired and excess entries are evicted in the background at most once per
+# interval per worker (0: only by "python manage.py evict_travel_times")
+TRAVEL_TIME_CACHE_EVICT_INTERVAL = 60 * 60  # seconds
+
+# Suggestion cache, see convergence/core/suggestion_cache.py
+SUGGESTION_CACHE_TTL = 15 * 60  # seconds
+SUGGESTION_CACHE_MAX_ENTRIES = 10000
+# candidates and travel times per event/type/mode, updated per member
+SUGGESTION_STATE_TTL = 24 * 60 * 60  # seconds
+SUGGESTION_STATE_MAX_ENTRIES = 10000
+# full recompute when the search area moves or grows by more than this
+# fraction of its radius
+SUGGESTION_CENTROID_SHIFT_RATIO = 0.25
+
+# Candidate pruning before requesting travel times, see
+# convergence/core/places.py. Speeds are (slowest, fastest) effective speed
+# over the as-the-crow-flies distance, in metres per second.
+TRAVEL_SPEEDS = {
+    "walking": (0.5, 2.5),
+    "bicycling": (1.5, 9),
+    "transit": (0.5, 35),
+    "driving": (1.5, 40),
+}
+ORIGIN_SNAP_DISTANCE = 250  # metres, users this close share an origin
+SUGGESTION_PRUNE_KEEP = 5  # places guaranteed to survive pruning
+DISTANCE_MATRIX_ELEMENT_BUDGET = 100  # elements per suggestion
+
+# Travel time backend for suggestions, see
+# convergence/core/travel_time_backends.py: "google" (Distance Matrix API,
+# cached) or "estimate" (local estimate, no network). Requests with
+# ?degraded=true always use "estimate".
+TRAVEL_TIME_BACKEND = "google"
+# Estimate: overhead (seconds, e.g. waiting, parking) + detour * distance /
+# speed, where speed grows from near_speed to far_speed (metres per second)
+# with distance, reaching their mean at half_speed_distance (metres).
+# Effective speeds (speed / detour) must not exceed the fastest of
+# TRAVEL_SPEEDS, which bounds pruning.
+TRAVEL_TIME_ESTIMATES = {
+    "walking": {"overhead": 0, "detour": 1.3, "near_speed": 1.3,
+                "far_speed": 1.4, "half_speed_distance": 1000},
+    "bicycling": {"overhead": 60, "detour": 1.3, "near_speed": 3.5,
+                  "far_speed": 5.5, "half_speed_distance": 2000},
+    "transit": {"overhead": 600, "detour": 1.4, "near_speed": 3,
+                "far_speed": 12, "half_speed_distance": 5000},
+    "driving": {"overhead": 180, "detour": 1.35, "near_speed": 6,
+                "far_speed": 22, "half_speed_distance": 10000},
+}
+
+# Travel time calibration, see convergence/core/calibration.py. Samples
+# of Distance Matrix responses are fitted per region and mode with
+# "python manage.py fit_travel_time_models" (e.g. hourly from cron).
+CALIBRATION_ENABLED = False
+CALIBRATION_CELL_SIZE = 0.1  # degrees, region of the origin, roughly 11km
+CALIBRATION_SAMPLE_TTL = 30 * 24 * 60 * 60  # seconds
+CALIBRATION_HOLDOUT_RATIO = 0.2  # fraction of samples kept for validation
+CALIBRATION_MIN_SAMPLES = 50  # per region and mode, to fit a model
+CALIBRATION_MODEL_REFRESH_INTERVAL = 10 * 60  # seconds
+# travel times are predicted instead of requested when the prediction
+# interval is within this fraction of the prediction (0 to never skip)
+CALIBRATION_MAX_RELATIVE_INTERVAL = 0.15
+
+# Suggestion jobs, see convergence/core/suggestion_jobs.py
+SUGGESTION_JOB_WORKERS = 4
+SUGGESTION_JOB_RESULT_TTL = 15 * 60  # seconds
+
+# Google Maps API requests, see convergence/apis/google_maps.py
+GM_POOL_SIZE = 10  # pooled connections, >= DISTANCE_MATRIX_MAX_WORKERS
+GM_CONNECT_TIMEOUT = 3.05  # seconds
+GM_READ_TIMEOUT = 10  # seconds
+GM_MAX_RETRIES = 2
+DISTANCE_MATRIX_MAX_WORKERS = 4
+DISTANCE_MATRIX_ELEMENTS_PER_SECOND = 1000
+# identical concurrent requests share one upstream call, across worker
+# processes through lock files in this directory, relative to the instance
+# folder and only accessible by its owner (None: per process only)
+GM_SINGLE_FLIGHT_DIR = "single-flight"
+GM_SINGLE_FLIGHT_LOCK_SLOTS = 1024
+# after this many consecutive failures requests to an endpoint fail
+# immediately, and suggestions are served from stale data, until a
+# background probe (a request around GM_PROBE_LOCATION) succeeds
+GM_CIRCUIT_FAILURE_THRESHOLD = 5
+GM_CIRCUIT_RESET_TIMEOUT = 30  # seconds between probes
+GM_PROBE_LOCATION = (51.5074, -0.1278)
@@ -22,6 +22,14 @@ db = convergence_db.ConvergenceDB(db_url)
 
 logging.basicConfig(filename="logs/Convergence.log", level=logging.INFO)
 
+if app.config["PLACE_INDEX_ENABLED"]:
+    from convergence.data.place_index import place_index
+    place_index.start(
+        db.create_session,
+        max_places=app.config["PLACE_INDEX_MAX_PLACES"],
+        refresh_interval=app.config["PLACE_INDEX_REFRESH_INTERVAL"]
+    )
+
 
 from convergence.endpoints import user_bp, events_bp, suggestions_bp, \
                                   friends_bp
@@ -30,3 +38,8 @@ app.register_blueprint(user_bp)
 app.register_blueprint(events_bp)
 app.register_blueprint(suggestions_bp)
 app.register_blueprint(friends_bp)
+
+
+@app.teardown_appcontext
+def remove_sessions(exception=None):
+    db.remove_sessions()
@@ -0,0 +1,128 @@
+import time
+import threading
+
+from convergence.utils import logger
+from convergence.utils.exceptions import CircuitOpenError, ServerError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for an upstream endpoint, used as a context manager
+    around each request:
+    - closed: requests are sent; failure_threshold consecutive failures
+      (ServerErrors) open the breaker.
+    - open: requests fail immediately with CircuitOpenError, instead of
+      each waiting out its own timeouts and retries. The first request
+      after reset_timeout starts a probe in the background and moves the
+      breaker to half-open.
+    - half-open: requests still fail immediately while the probe runs. The
+      breaker closes if the probe succeeds and opens again if it fails.
+    """
+    def __init__(self, endpoint, probe, executor, failure_threshold=5,
+                 reset_timeout=30):
+        """
+        :param endpoint: endpoint name, used for logging and errors
+        :param probe: function without arguments sending a cheap request to
+                      the endpoint, raising ServerError if it fails
+        :param executor: executor to run the probe on
+        :param failure_threshold: consecutive failures opening the breaker
+        :param reset_timeout: seconds until the breaker is probed
+        """
+        self.endpoint = endpoint
+        self.probe = probe
+        self.executor = executor
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened = None
+        self._stats = {"opened": 0, "rejected": 0, "probes": 0}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.check()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.record_success()
+        elif issubclass(exc_type, ServerError) \
+                and not issubclass(exc_type, CircuitOpenError):
+            self.record_failure()
+        return False
+
+    def check(self):
+        """
+        Raise CircuitOpenError if requests fail immediately, starting a
+        probe if it is time for one. Unlike entering the breaker as a
+        context manager, this does not record the outcome of a request.
+        """
+        probe = False
+        with self._lock:
+            if self.state == CLOSED:
+                return None
+            self._stats["rejected"] += 1
+            if self.state == OPEN and \
+                    time.monotonic() - self._opened >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._stats["probes"] += 1
+                probe = True
+        if probe:
+            self.executor.submit(self._probe)
+        raise CircuitOpenError(f"{self.endpoint} is unavailable.")
+
+    def is_open(self):
+        """
+        :return: True if requests fail immediately (open or half-open)
+        """
+        with self._lock:
+            return self.state != CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self.state == CLOSED:
+                return None
+            self.state = CLOSED
+        logger.log_info(f"Circuit breaker for {self.endpoint} closed.")
+        return None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == OPEN or (
+                    self.state == CLOSED
+                    and self._failures < self.failure_threshold):
+                return None
+            self.state = OPEN
+            self._opened = time.monotonic()
+            self._stats["opened"] += 1
+        logger.log_error(
+            f"Circuit breaker for {self.endpoint} opened after "
+            f"{self._failures} failures."
+        )
+        return None
+
+    def get_stats(self):
+        """
+        :return: dict with state, and the number of times the breaker
+                 opened, requests it rejected and probes it sent
+        """
+        with self._lock:
+            return dict(self._stats, state=self.state)
+
+    def _probe(self):
+        try:
+            self.probe()
+        except Exception as e:
+            logger.log_error(
+                f"Probe of {self.endpoint} failed: {str(e)}"
+            )
+            self.record_failure()
+            return None
+        self.record_success()
+        return None
@@ -1,20 +1,60 @@
-import requests
+import os
 import sys
 import time
 import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import quote
 
 from convergence import app
+from convergence.apis.circuit_breaker import CircuitBreaker
+from convergence.apis.http_client import HttpClient
+from convergence.apis.single_flight import SingleFlight
 from convergence.utils import logger
 from convergence.utils.exceptions import ServerError
+from convergence.utils.rate_limiter import TokenBucket
 
 GM_PLACES_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/" \
                 "json?location={:f},{:f}&radius={:d}&type={:s}&key={:s}"
 GM_TRAVEL_TIME_URL = "https://maps.googleapis.com/maps/api/distancematrix/" \
                      "json?origins={:s}&destinations={:s}&mode={:s}&key={:s}"
 GM_API_KEY = app.config.get("GM_API_KEY")
+PROBE_LOCATION = app.config["GM_PROBE_LOCATION"]
+SINGLE_FLIGHT_DIR = app.config["GM_SINGLE_FLIGHT_DIR"]
 
 DISTANCE_MATRIX_MAX_ELEMENTS = 100
+DISTANCE_MATRIX_MAX_ORIGINS = 25
+DISTANCE_MATRIX_MAX_DESTINATIONS = 25
+PLACES_ENDPOINT = "Google Maps API (Places)"
+# any other status (e.g. OVER_QUERY_LIMIT, REQUEST_DENIED) is an error,
+# even though the response comes with an (empty) list of results
+PLACES_OK_STATUSES = ("OK", "ZERO_RESULTS")
+DISTANCE_MATRIX_ENDPOINT = "Google Maps API (Distance Matrix)"
+
+client = HttpClient(
+    pool_size=app.config["GM_POOL_SIZE"],
+    connect_timeout=app.config["GM_CONNECT_TIMEOUT"],
+    read_timeout=app.config["GM_READ_TIMEOUT"],
+    max_retries=app.config["GM_MAX_RETRIES"]
+)
+# identical requests in flight, e.g. from members of one event opening
+# their suggestions together, are sent upstream only once
+single_flight = SingleFlight(
+    lock_dir=os.path.join(app.instance_path, SINGLE_FLIGHT_DIR)
+    if SINGLE_FLIGHT_DIR else None,
+    lock_slots=app.config["GM_SINGLE_FLIGHT_LOCK_SLOTS"]
+)
+
+# Distance Matrix requests are shared by all request threads, so that
+# concurrency and the element quota are bounded per worker process
+matrix_executor = ThreadPoolExecutor(
+    max_workers=app.config["DISTANCE_MATRIX_MAX_WORKERS"],
+    thread_name_prefix="distance-matrix"
+)
+element_limiter = TokenBucket(
+    app.config["DISTANCE_MATRIX_ELEMENTS_PER_SECOND"]
+)
+probe_executor = ThreadPoolExecutor(max_workers=1,
+                                    thread_name_prefix="gm-probe")
 
 
 def get_places_around_point(point, radius, place_type):
@@ -26,6 +66,23 @@ def get_places_around_point(point, radius, place_type):
     :param place_type: place type to find
     :return: list of places around point
     """
+    places, page_token = get_places_page(point, radius, place_type)
+    if page_token:
+        places.extend(
+            get_remaining_pages(point, radius, place_type, page_token)
+        )
+    return places
+
+
+def get_places_page(point, radius, place_type, page_token=None):
+    """
+    Request a single page (up to 20 places) of a Nearby Places search.
+    :param point: centre point, type Point
+    :param radius: radius in metres
+    :param place_type: place type to find
+    :param page_token: token of the page to request, None for the first
+    :return: tuple (list of places, token of the next page or None)
+    """
     base_request = GM_PLACES_URL.format(
         point.lat,
         point.long,
@@ -33,24 +90,39 @@ def get_places_around_point(point, radius, place_type):
         place_type,
         GM_API_KEY
     )
-    response = requests.get(base_request).json()
-    if not response:
-        logger.log_error(
-            f"Invalid response from Google API. Request URL: {base_request}"
-        )
-        raise ServerError("Unable to reach Google Maps API (Places).")
-    places = _json_extract_places(response)
-    while "next_page_token" in response:
-        time.sleep(1)
-        response = requests.get(
-            base_request + "&pagetoken=" + quote(response["next_page_token"])
-        ).json()
-        if not response:
+    url = base_request
+    if page_token:
+        url += "&pagetoken=" + quote(page_token)
+
+    def validate(response):
+        if not response or response.get("status") not in PLACES_OK_STATUSES:
             logger.log_error(
-                f"Invalid response from Google API. Request URL: {base_request}"
+                f"Invalid response from Google API "
+                f"({(response or {}).get('status')}). "
+                f"Request URL: {base_request}"
             )
             raise ServerError("Unable to reach Google Maps API (Places).")
-        places.extend(_json_extract_places(response))
+    response = _get_json(url, PLACES_ENDPOINT, validate)
+    return _json_extract_places(response), response.get("next_page_token")
+
+
+def get_remaining_pages(point, radius, place_type, page_token):
+    """
+    Request all pages of a Nearby Places search from page_token onwards.
+    A next_page_token only becomes valid a short while after it is issued,
+    so this waits a second before each page.
+    :param point: centre point, type Point
+    :param radius: radius in metres
+    :param place_type: place type to find
+    :param page_token: token of the first page to request
+    :return: list of places on the remaining pages
+    """
+    places = []
+    while page_token:
+        time.sleep(1)
+        page, page_token = get_places_page(point, radius, place_type,
+                                           page_token)
+        places.extend(page)
     return places
 
 
@@ -60,9 +132,11 @@ def get_distance_matrix(origins, destinations, mode):
     and destinations, using specified mode of transportation.
 
     Given that Google Distance Matrix API is limited in the number of elements
-    it can return in any single request, this function calculates how many
-    requests are needed to include all elements of the matrix with size
-    (origins * destinations), and places multiple requests if needed.
+    and in the number of origins and destinations it can handle in any single
+    request, the matrix of size (origins * destinations) is split into tiles
+    that fit these limits (see _tile_matrix). The requests are sent
+    concurrently, throttled to the per-second element quota, and each tile
+    is copied into the matrix at its own offset.
 
     :param origins: list of origin Points
     :param destinations: list of destination Points
@@ -70,46 +144,182 @@ def get_distance_matrix(origins, destinations, mode):
     :return: distance matrix of dimension len(origins) * len(destinations)
     """
     dist_matrix = [[None] * len(destinations) for _ in range(len(origins))]
+    for origin_start, dest_start, durations in iter_distance_matrix(
+            origins, destinations, mode):
+        for row_idx, row in enumerate(durations, origin_start):
+            dist_matrix[row_idx][dest_start:dest_start + len(row)] = row
+    return dist_matrix
 
-    no_requests = math.ceil(
-        len(origins) * len(destinations) / DISTANCE_MATRIX_MAX_ELEMENTS
-    )
-    start = 0
-    for i in range(no_requests):
-        cutoff = min(
-            start + math.ceil(len(destinations) / no_requests),
-            len(destinations)
-        )
-        origins_list = [
-            ",".join([str(origin.lat), str(origin.long)])  # stringify coords
-            for origin in origins
-        ]
-        dest_list = [
-            ",".join([str(dest.lat), str(dest.long)])
-            for dest in destinations[start:cutoff]
-        ]
-        request = GM_TRAVEL_TIME_URL.format(
-            quote("|".join(origins_list)),  # Google format: x1,y1|x2,y2|xn,yn
-            quote("|".join(dest_list)),
-            mode,
-            GM_API_KEY
+
+def iter_distance_matrix(origins, destinations, mode):
+    """
+    Request the distance matrix between origins and destinations like
+    get_distance_matrix, yielding each tile as soon as its request returns.
+    :param origins: list of origin Points
+    :param destinations: list of destination Points
+    :param mode: mode of transportation
+    :return: generator of (origin_start, destination_start, durations),
+             with durations a list of rows of travel times in seconds
+             (sys.maxsize if unavailable) for the tile at that offset
+    """
+    futures = {
+        matrix_executor.submit(
+            _request_distance_matrix,
+            origins[origin_start:origin_end],
+            destinations[dest_start:dest_end],
+            mode
+        ): (origin_start, dest_start)
+        for origin_start, origin_end, dest_start, dest_end
+        in _tile_matrix(len(origins), len(destinations))
+    }
+    try:
+        for future in as_completed(futures):
+            origin_start, dest_start = futures[future]
+            yield origin_start, dest_start, [
+                [
+                    element["duration"]["value"]
+                    if element["status"] == "OK" else sys.maxsize
+                    for element in row["elements"]
+                ]
+                for row in future.result()
+            ]
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _tile_matrix(no_origins, no_destinations):
+    """
+    Split a matrix of no_origins * no_destinations elements into the fewest
+    equally sized tiles that fit the Distance Matrix API limits on elements,
+    origins and destinations per request.
+    :param no_origins: number of origins
+    :param no_destinations: number of destinations
+    :return: list of tiles as (origin_start, origin_end,
+             destination_start, destination_end)
+    """
+    if not no_origins or not no_destinations:
+        return []
+    best = None
+    for tile_origins in range(1, min(no_origins,
+                                     DISTANCE_MATRIX_MAX_ORIGINS) + 1):
+        tile_destinations = min(
+            no_destinations,
+            DISTANCE_MATRIX_MAX_DESTINATIONS,
+            DISTANCE_MATRIX_MAX_ELEMENTS // tile_origins
         )
-        response = requests.get(request).json()
-        if not response["rows"]:
+        no_tiles = (math.ceil(no_origins / tile_origins),
+                    math.ceil(no_destinations / tile_destinations))
+        if best is None or no_tiles[0] * no_tiles[1] < best[0] * best[1]:
+            best = no_tiles
+    # spread elements evenly over the tiles, without adding any
+    tile_origins = math.ceil(no_origins / best[0])
+    tile_destinations = math.ceil(no_destinations / best[1])
+    return [
+        (origin_start, min(origin_start + tile_origins, no_origins),
+         dest_start, min(dest_start + tile_destinations, no_destinations))
+        for origin_start in range(0, no_origins, tile_origins)
+        for dest_start in range(0, no_destinations, tile_destinations)
+    ]
+
+
+def _request_distance_matrix(origins, destinations, mode):
+    """
+    Place a single Distance Matrix API request, once the rate limiter
+    allows for its number of elements.
+    :param origins: list of origin Points
+    :param destinations: list of destination Points
+    :param mode: mode of transportation
+    :return: rows of the response
+    """
+    origins_list = [
+        ",".join([str(origin.lat), str(origin.long)])  # stringify coords
+        for origin in origins
+    ]
+    dest_list = [
+        ",".join([str(dest.lat), str(dest.long)])
+        for dest in destinations
+    ]
+    request = GM_TRAVEL_TIME_URL.format(
+        quote("|".join(origins_list)),  # Google format: x1,y1|x2,y2|xn,yn
+        quote("|".join(dest_list)),
+        mode,
+        GM_API_KEY
+    )
+
+    def validate(response):
+        if not response.get("rows"):
             logger.log_error(
                 f"Invalid response from Google API. Request URL: {request}"
             )
             raise ServerError("Error retrieving distance information")
-        for row_idx, row in enumerate(response["rows"]):
-            for el_idx, element in enumerate(row["elements"]):
-                if element["status"] != "OK":
-                    dist_matrix[row_idx][el_idx] = sys.maxsize
-                else:
-                    dist_matrix[row_idx][el_idx] = element["duration"]["value"]
-        if i < no_requests - 1:
-            start = cutoff
-            time.sleep(1)  # sleep before next request
-    return dist_matrix
+    response = _get_json(request, DISTANCE_MATRIX_ENDPOINT, validate,
+                         len(origins) * len(destinations))
+    return response["rows"]
+
+
+def _get_json(url, endpoint, validate, elements=0):
+    """
+    GET url, sharing the response with identical requests in flight (see
+    SingleFlight). Only the request sent upstream takes from the element
+    quota and counts towards the endpoint's circuit breaker; requests
+    joining it only fail immediately if the breaker is open.
+    :param url: request URL, with normalised parameters
+    :param endpoint: endpoint name
+    :param validate: function raising ServerError if the response is
+                     invalid
+    :param elements: number of Distance Matrix elements requested
+    :return: response JSON
+    """
+    breaker = breakers[endpoint]
+    breaker.check()
+
+    def request():
+        with breaker:
+            if elements:
+                element_limiter.acquire(elements)
+            response = client.get_json(url, endpoint)
+            validate(response)
+        return response
+    # the key is hashed into file names, leave the API key out
+    return single_flight.do(url.replace(f"key={GM_API_KEY}", "key="),
+                            request, endpoint)
+
+
+def _probe_places():
+    """Request places near GM_PROBE_LOCATION, raise ServerError if failed"""
+    response = client.get_json(
+        GM_PLACES_URL.format(*PROBE_LOCATION, 100, "cafe", GM_API_KEY),
+        PLACES_ENDPOINT
+    )
+    if not response or response.get("status") not in PLACES_OK_STATUSES:
+        raise ServerError("Unable to reach Google Maps API (Places).")
+
+
+def _probe_distance_matrix():
+    """Request a single element from GM_PROBE_LOCATION"""
+    location = quote(",".join(str(coord) for coord in PROBE_LOCATION))
+    element_limiter.acquire(1)
+    response = client.get_json(
+        GM_TRAVEL_TIME_URL.format(location, location, "walking", GM_API_KEY),
+        DISTANCE_MATRIX_ENDPOINT
+    )
+    if not response.get("rows"):
+        raise ServerError("Error retrieving distance information")
+
+
+breakers = {
+    endpoint: CircuitBreaker(
+        endpoint,
+        probe,
+        probe_executor,
+        failure_threshold=app.config["GM_CIRCUIT_FAILURE_THRESHOLD"],
+        reset_timeout=app.config["GM_CIRCUIT_RESET_TIMEOUT"]
+    )
+    for endpoint, probe in [(PLACES_ENDPOINT, _probe_places),
+                            (DISTANCE_MATRIX_ENDPOINT,
+                             _probe_distance_matrix)]
+}
 
 
 def _json_extract_places(response_string):
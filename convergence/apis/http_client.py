@@ -0,0 +1,119 @@
+import time
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from convergence.utils import logger
+from convergence.utils.exceptions import ServerError
+
+RETRY_HTTP_STATUSES = {429, 500, 502, 503, 504}
+RETRY_API_STATUSES = {"UNKNOWN_ERROR"}  # Google: "may succeed if you retry"
+
+
+class HttpClient:
+    """
+    Shared HTTP client for upstream JSON APIs: keeps connections alive in a
+    pool, applies connect/read timeouts, retries transient failures with
+    jittered exponential backoff and records latency per endpoint.
+    """
+    def __init__(self, pool_size=10, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff=0.5):
+        """
+        :param pool_size: maximum number of kept-alive connections per host
+        :param connect_timeout: seconds to wait for a connection
+        :param read_timeout: seconds to wait between bytes of the response
+        :param max_retries: retries after the first attempt
+        :param backoff: base delay in seconds, doubled on every retry
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip"
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get_json(self, url, endpoint):
+        """
+        GET url and return its decoded JSON body.
+        :param url: request URL
+        :param endpoint: endpoint name, used for latency stats and logging
+        :return: response JSON
+        """
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._record_retry(endpoint)
+                time.sleep(self.backoff * 2 ** (attempt - 1)
+                           * random.uniform(0.5, 1.5))
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code in RETRY_HTTP_STATUSES:
+                    error = f"HTTP {response.status_code}"
+                    self._record(endpoint, start, failed=True)
+                    continue
+                response.raise_for_status()
+                body = response.json()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+                self._record(endpoint, start, failed=True)
+                continue
+            except (requests.RequestException, ValueError) as e:
+                self._record(endpoint, start, failed=True)
+                logger.log_error(f"Request to {endpoint} failed: {str(e)}")
+                raise ServerError(f"Error response from {endpoint}.")
+            if isinstance(body, dict) and \
+                    body.get("status") in RETRY_API_STATUSES:
+                error = f"API status {body['status']}"
+                self._record(endpoint, start, failed=True)
+                continue
+            self._record(endpoint, start)
+            return body
+        logger.log_error(
+            f"Request to {endpoint} failed after "
+            f"{self.max_retries + 1} attempts: {error}"
+        )
+        raise ServerError(f"Unable to reach {endpoint}.")
+
+    def get_stats(self):
+        """
+        Return latency stats for each endpoint.
+        :return: dict of endpoint -> dict with requests, errors, retries,
+                 mean_ms and max_ms
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    "requests": stats["requests"],
+                    "errors": stats["errors"],
+                    "retries": stats["retries"],
+                    "mean_ms": stats["total_ms"] / max(1, stats["requests"]),
+                    "max_ms": stats["max_ms"]
+                }
+                for endpoint, stats in self._stats.items()
+            }
+
+    def _endpoint_stats(self, endpoint):
+        return self._stats.setdefault(endpoint, {
+            "requests": 0, "errors": 0, "retries": 0,
+            "total_ms": 0.0, "max_ms": 0.0
+        })
+
+    def _record(self, endpoint, start, failed=False):
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            stats = self._endpoint_stats(endpoint)
+            stats["requests"] += 1
+            stats["errors"] += failed
+            stats["total_ms"] += elapsed
+            stats["max_ms"] = max(stats["max_ms"], elapsed)
+
+    def _record_retry(self, endpoint):
+        with self._lock:
+            self._endpoint_stats(endpoint)["retries"] += 1
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # no file locks (Windows), coalesce within a process
+    fcntl = None
+
+from convergence.utils import logger
+
+
+class _Call:
+    """An upstream call in flight, shared by the threads waiting for it"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in
+    flight, further calls for that key wait for it and share its result
+    instead of calling upstream themselves.
+
+    Within a process, the first thread to call for a key makes the call and
+    the other threads wait on it. Across worker processes, calls take an
+    exclusive file lock on one of a fixed table of lock files (chosen by the
+    hash of the key) for the duration of the call, and write their result
+    to a file next to it. A process that had to wait for the lock reads that
+    result if it was written after it started waiting, and only calls
+    upstream itself if there is none (e.g. the call failed, or the lock was
+    held for another key). Results must be JSON serialisable.
+
+    Results are read back as upstream responses, so the directory must only
+    be writable by the user running the app: it is created with mode 0700,
+    and if it exists with wider permissions or another owner, calls are
+    only coalesced within the process.
+    """
+    def __init__(self, lock_dir=None, lock_slots=1024, result_ttl=60):
+        """
+        :param lock_dir: directory of the lock and result files, None to
+                         coalesce within a process only
+        :param lock_slots: number of lock files
+        :param result_ttl: seconds after which result files are deleted
+        """
+        self.lock_dir = lock_dir if fcntl else None
+        self._lock_dir_checked = False
+        self.lock_slots = lock_slots
+        self.result_ttl = result_ttl
+        self._calls = {}  # key -> _Call
+        self._stats = {}
+        self._swept = time.monotonic()
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, endpoint):
+        """
+        Call fn, unless a call for key is in flight, and return its result.
+        :param key: string identifying the call, e.g. the request URL
+        :param fn: function without arguments making the call
+        :param endpoint: endpoint name, used for stats
+        :return: result of fn, possibly of a call made by another thread or
+                 process
+        """
+        with self._lock:
+            stats = self._endpoint_stats(endpoint)
+            stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                stats["coalesced"] += 1
+                leader = False
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._call_locked(key, fn, endpoint)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def get_stats(self):
+        """
+        Return counters for each endpoint.
+        :return: dict of endpoint -> dict with calls, coalesced (calls that
+                 waited for another thread) and coalesced_processes (calls
+                 that used the result of another process)
+        """
+        with self._lock:
+            return {endpoint: dict(stats)
+                    for endpoint, stats in self._stats.items()}
+
+    def _call_locked(self, key, fn, endpoint):
+        """Call fn holding the file lock for key, if any"""
+        if self.lock_dir is None or not self._check_lock_dir():
+            return fn()
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        slot = int(digest[:8], 16) % self.lock_slots
+        result_path = os.path.join(self.lock_dir, f"{digest}.json")
+        try:
+            lock_file = os.fdopen(os.open(
+                os.path.join(self.lock_dir, f"{slot}.lock"),
+                os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                0o600
+            ), "a")
+        except OSError as e:
+            logger.log_error(f"Unable to open single flight lock: {str(e)}")
+            return fn()
+        started = time.time()
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:  # in flight in another process
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                result = self._read_result(result_path, started)
+                if result is not None:
+                    with self._lock:
+                        self._endpoint_stats(endpoint)[
+                            "coalesced_processes"] += 1
+                    return result
+            try:
+                result = fn()
+                self._write_result(result_path, result)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self._sweep()
+        return result
+
+    def _check_lock_dir(self):
+        """
+        Create lock_dir if needed, and check that only this user can access
+        it; if not, stop coalescing across processes.
+        :return: True if lock_dir can be used
+        """
+        if self._lock_dir_checked:
+            return self.lock_dir is not None
+        try:
+            os.makedirs(self.lock_dir, mode=0o700, exist_ok=True)
+            info = os.stat(self.lock_dir)
+            private = info.st_uid == os.getuid() \
+                and not info.st_mode & 0o077
+        except OSError as e:
+            logger.log_error(
+                f"Unable to create single flight directory: {str(e)}"
+            )
+            private = False
+        else:
+            if not private:
+                logger.log_error(
+                    f"Single flight directory {self.lock_dir} is accessible "
+                    f"by other users, not coalescing across processes."
+                )
+        if not private:
+            self.lock_dir = None
+        self._lock_dir_checked = True
+        return private
+
+    def _read_result(self, path, written_after):
+        try:
+            if os.path.getmtime(path) < written_after:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, path, result):
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with os.fdopen(os.open(temp_path,
+                                   os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                                   0o600), "w") as f:
+                json.dump(result, f)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.log_error(
+                f"Unable to write single flight result: {str(e)}"
+            )
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _sweep(self):
+        """Delete expired result files, at most once per result_ttl"""
+        with self._lock:
+            if time.monotonic() - self._swept < self.result_ttl:
+                return None
+            self._swept = time.monotonic()
+        expired = time.time() - self.result_ttl
+        try:
+            with os.scandir(self.lock_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json") \
+                            and entry.stat().st_mtime < expired:
+                        os.remove(entry.path)
+        except OSError:  # removed by another process meanwhile
+            pass
+        return None
+
+    def _endpoint_stats(self, endpoint):
+        return self._stats.setdefault(endpoint, {
+            "calls": 0, "coalesced": 0, "coalesced_processes": 0
+        })
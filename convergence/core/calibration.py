@@ -0,0 +1,318 @@
+"""
+Travel time model calibrated on Distance Matrix responses.
+
+Every travel time Google returns is recorded as a sample of (mode, region
+of the origin, distance as-the-crow-flies, duration). A batch job
+(fit_models, run by "python manage.py fit_travel_time_models") fits, per
+mode and region and per mode over all regions, the regression
+
+    log(duration) = intercept + slope * log(distance)
+
+on all samples but a held-out fraction, which is used to measure the
+model's errors. Travel times vary with the distance rather than by a fixed
+number of seconds, hence the fit on a log scale.
+
+The predictor returns the predicted travel time with a 95% prediction
+interval. Travel times are predicted instead of requested when the interval
+is within MAX_RELATIVE_INTERVAL of the prediction (see travel_times), and
+the interval narrows the bounds used for pruning candidates (see
+places.prune_candidate_set).
+"""
+import math
+import sys
+import time
+import random
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from convergence import app
+from convergence.data.repo import CalibrationStore
+from convergence.utils import geo
+from convergence.utils import logger
+
+ENABLED = app.config["CALIBRATION_ENABLED"]
+CELL_SIZE = app.config["CALIBRATION_CELL_SIZE"]
+SAMPLE_TTL = timedelta(seconds=app.config["CALIBRATION_SAMPLE_TTL"])
+HOLDOUT_RATIO = app.config["CALIBRATION_HOLDOUT_RATIO"]
+MIN_SAMPLES = app.config["CALIBRATION_MIN_SAMPLES"]
+MODEL_REFRESH_INTERVAL = app.config["CALIBRATION_MODEL_REFRESH_INTERVAL"]
+MAX_RELATIVE_INTERVAL = app.config["CALIBRATION_MAX_RELATIVE_INTERVAL"]
+ALL_REGIONS = "*"
+MIN_DISTANCE = 50  # metres, shorter distances are fitted as this
+PREDICTION_Z = 1.96  # 95% prediction interval
+
+Model = namedtuple("Model", ["intercept", "slope", "residual_std",
+                             "log_distance_mean", "log_distance_ss",
+                             "sample_count"])
+
+calibration_store = CalibrationStore()
+
+
+class TravelTimePredictor:
+    """Predicts travel times with the fitted models, reloaded periodically"""
+    def __init__(self, refresh_interval=MODEL_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._models = {}  # (mode, region) -> Model
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def predict(self, origins, distances, mode):
+        """
+        Predict travel times from each origin.
+        :param origins: list of origin Points
+        :param distances: array of shape (len(origins), m), distances from
+                          each origin in metres
+        :param mode: mode of transportation
+        :return: tuple of arrays (prediction, low, high) of the shape of
+                 distances, nan where there is no model, or None if there
+                 are no models for mode
+        """
+        models = self._get_models()
+        fallback = models.get((mode, ALL_REGIONS))
+        rows = [models.get((mode, get_region(origin)), fallback)
+                for origin in origins]
+        if not any(rows):
+            return None
+        params = Model(*np.array(
+            [row if row else [np.nan] * len(Model._fields) for row in rows],
+            dtype=float
+        ).reshape(-1, len(Model._fields)).T[:, :, np.newaxis])
+        return _predict(params, distances)
+
+    def reset(self):
+        """Reload the models on the next prediction"""
+        with self._lock:
+            self._loaded = None
+
+    def _get_models(self):
+        with self._lock:
+            if self._loaded is not None \
+                    and time.monotonic() - self._loaded < \
+                    self.refresh_interval:
+                return self._models
+            self._loaded = time.monotonic()
+            try:
+                self._models = {
+                    (model.mode, model.region): Model(
+                        model.intercept,
+                        model.slope,
+                        model.residual_std,
+                        model.log_distance_mean,
+                        model.log_distance_ss,
+                        model.sample_count
+                    )
+                    for model in calibration_store.get_models()
+                }
+            except SQLAlchemyError as e:
+                logger.log_error(
+                    f"Unable to load travel time models: {str(e)}"
+                )
+                calibration_store.session.rollback()
+            return self._models
+
+
+predictor = TravelTimePredictor()
+
+
+def get_region(point):
+    """
+    Return id of the calibration region containing point.
+    :param point: Point
+    :return: region id as string
+    """
+    return f"{math.floor(point.lat / CELL_SIZE)}:" \
+           f"{math.floor(point.long / CELL_SIZE)}"
+
+
+def predict(origins, distances, mode):
+    """
+    Predict travel times from origins (see TravelTimePredictor.predict).
+    :param origins: list of origin Points
+    :param distances: array of shape (len(origins), m) in metres
+    :param mode: mode of transportation
+    :return: tuple of arrays (prediction, low, high), or None if
+             calibration is disabled or there are no models for mode
+    """
+    if not ENABLED or not len(origins):
+        return None
+    return predictor.predict(origins, distances, mode)
+
+
+def predict_confident(origins, places, mode):
+    """
+    Predict travel times from origins to places where the prediction
+    interval is within MAX_RELATIVE_INTERVAL of the prediction.
+    :param origins: list of origin Points
+    :param places: list of places (each with lat and long)
+    :param mode: mode of transportation
+    :return: matrix of predicted seconds, None where not confident, or None
+             if there are no predictions
+    """
+    if not ENABLED or not MAX_RELATIVE_INTERVAL or not origins or not places:
+        return None
+    prediction = predict(
+        origins,
+        geo.distance_matrix(
+            origins,
+            [(place["lat"], place["long"]) for place in places]
+        ),
+        mode
+    )
+    if prediction is None:
+        return None
+    predicted, low, high = prediction
+    confident = (high - low) / 2 <= MAX_RELATIVE_INTERVAL * predicted
+    return [
+        [int(round(duration)) if is_confident else None
+         for duration, is_confident in zip(row, confident_row)]
+        for row, confident_row in zip(predicted.tolist(), confident.tolist())
+    ]
+
+
+def record_samples(origins, destinations, dist_matrix, mode):
+    """
+    Record travel times returned by the Distance Matrix API as samples.
+    :param origins: list of origin Points, one per row of dist_matrix
+    :param destinations: list of destination Points, one per column
+    :param dist_matrix: travel times in seconds, None or sys.maxsize where
+                        there is no route
+    :param mode: mode of transportation
+    """
+    if not ENABLED or not origins or not destinations:
+        return None
+    now = datetime.utcnow()
+    distances = geo.distance_matrix(origins, destinations).tolist()
+    samples = []
+    for origin, distance_row, row in zip(origins, distances, dist_matrix):
+        region = get_region(origin)
+        for distance, duration in zip(distance_row, row):
+            if duration is None or duration == sys.maxsize:
+                continue
+            samples.append({
+                "mode": mode,
+                "region": region,
+                "distance": distance,
+                "duration": duration,
+                "holdout": random.random() < HOLDOUT_RATIO,
+                "timestamp": now
+            })
+    calibration_store.add_samples(samples)
+    return None
+
+
+def fit_models(now=None):
+    """
+    Fit travel time models on the recorded samples, per mode and region
+    and per mode over all regions, and replace the current models. Expired
+    samples are deleted first.
+    :param now: current datetime, default utcnow
+    :return: list of fitted models as dicts, with their errors against the
+             held-out samples
+    """
+    now = now or datetime.utcnow()
+    calibration_store.delete_samples(now - SAMPLE_TTL)
+    groups = {}
+    for mode, region, distance, duration, holdout in \
+            calibration_store.get_samples(now - SAMPLE_TTL):
+        for key in [(mode, region), (mode, ALL_REGIONS)]:
+            groups.setdefault(key, []).append((distance, duration, holdout))
+    models = []
+    for (mode, region), samples in groups.items():
+        samples = np.array(samples, dtype=float)
+        holdout = samples[:, 2].astype(bool)
+        if (~holdout).sum() < MIN_SAMPLES:
+            continue
+        model = _fit(samples[~holdout, 0], samples[~holdout, 1])
+        models.append(dict(
+            model._asdict(),
+            mode=mode,
+            region=region,
+            timestamp=now,
+            **_evaluate(model, samples[holdout, 0], samples[holdout, 1])
+        ))
+    if calibration_store.replace_models(models):
+        predictor.reset()
+        logger.log_info(f"Fitted {len(models)} travel time models.")
+    return models
+
+
+def get_error_stats():
+    """
+    Return the errors of the current models against held-out samples.
+    :return: list of dicts with mode, region, sample_count, holdout_count,
+             mean_abs_error (seconds), mean_rel_error, interval_coverage
+             (fraction of held-out travel times within the prediction
+             interval) and timestamp
+    """
+    return [
+        {key: getattr(model, key) for key in [
+            "mode", "region", "sample_count", "holdout_count",
+            "mean_abs_error", "mean_rel_error", "interval_coverage",
+            "timestamp"
+        ]}
+        for model in calibration_store.get_models()
+    ]
+
+
+def _fit(distances, durations):
+    """
+    Fit log(duration) = intercept + slope * log(distance) by least squares.
+    :param distances: array of distances in metres
+    :param durations: array of durations in seconds
+    :return: Model
+    """
+    x = np.log(np.maximum(distances, MIN_DISTANCE))
+    y = np.log(np.maximum(durations, 1))
+    x_mean, y_mean = x.mean(), y.mean()
+    x_ss = float(((x - x_mean) ** 2).sum())
+    slope = float(((x - x_mean) * (y - y_mean)).sum() / x_ss) if x_ss else 0.
+    intercept = float(y_mean - slope * x_mean)
+    residuals = y - intercept - slope * x
+    residual_std = math.sqrt(
+        float((residuals ** 2).sum()) / max(1, len(x) - 2)
+    )
+    return Model(intercept, slope, residual_std, float(x_mean), x_ss, len(x))
+
+
+def _predict(model, distances):
+    """
+    Predict travel times and 95% prediction interval.
+    :param model: Model, fields may be arrays broadcasting with distances
+    :param distances: array of distances in metres
+    :return: tuple of arrays (prediction, low, high) in seconds
+    """
+    x = np.log(np.maximum(distances, MIN_DISTANCE))
+    y = model.intercept + model.slope * x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        leverage = np.where(model.log_distance_ss > 0,
+                            (x - model.log_distance_mean) ** 2
+                            / model.log_distance_ss,
+                            0)
+    margin = PREDICTION_Z * model.residual_std \
+        * np.sqrt(1 + 1 / model.sample_count + leverage)
+    return np.exp(y), np.exp(y - margin), np.exp(y + margin)
+
+
+def _evaluate(model, distances, durations):
+    """
+    Measure errors of a model against held-out samples.
+    :return: dict with holdout_count, mean_abs_error, mean_rel_error and
+             interval_coverage (None without held-out samples)
+    """
+    if not len(distances):
+        return {"holdout_count": 0, "mean_abs_error": None,
+                "mean_rel_error": None, "interval_coverage": None}
+    predicted, low, high = _predict(model, distances)
+    errors = np.abs(predicted - durations)
+    return {
+        "holdout_count": len(distances),
+        "mean_abs_error": float(errors.mean()),
+        "mean_rel_error": float((errors / np.maximum(durations, 1)).mean()),
+        "interval_coverage": float(
+            ((durations >= low) & (durations <= high)).mean()
+        )
+    }
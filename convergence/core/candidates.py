@@ -0,0 +1,219 @@
+"""
+Columnar container for candidate places.
+
+Suggestions score, filter and rank a set of candidate places several times
+(by rating, by distance, by travel time). CandidateSet keeps the numeric
+attributes of the candidates in parallel numpy arrays, so that each of
+these steps is a vectorised operation over index arrays; the place dicts
+themselves are never copied or mutated, and are only materialised, with
+their travel_total, by to_dicts.
+"""
+import math
+
+import numpy as np
+
+from convergence.utils import geo
+from convergence.utils import logger
+
+DEFAULT_RATING = 1  # rating used for ranking places without a rating
+
+
+class CandidateSet:
+    """Candidate places with parallel arrays of their numeric attributes"""
+    def __init__(self, places, lat, long, rating, price, travel_total=None,
+                 integer_totals=False):
+        """
+        Use CandidateSet.from_places to create a set from place dicts.
+        :param places: list of place dicts, shared between derived sets
+        :param lat: array of latitudes
+        :param long: array of longitudes
+        :param rating: array of ratings, nan if not rated
+        :param price: array of price levels, nan if unknown
+        :param travel_total: array of travel totals (nan if unknown), or
+                             None if not calculated
+        :param integer_totals: whether travel totals are whole seconds
+        """
+        self.places = places
+        self.lat = lat
+        self.long = long
+        self.rating = rating
+        self.price = price
+        self.travel_total = travel_total
+        self.integer_totals = integer_totals
+
+    @classmethod
+    def from_places(cls, places):
+        """
+        Create candidate set from place dicts.
+        :param places: list of place dicts (with lat, long, gm_rating and
+                       gm_price)
+        :return: CandidateSet
+        """
+        places = list(places or [])
+        return cls(
+            places,
+            cls._column(places, "lat"),
+            cls._column(places, "long"),
+            cls._column(places, "gm_rating"),
+            cls._column(places, "gm_price")
+        )
+
+    def __len__(self):
+        return len(self.places)
+
+    def take(self, indices):
+        """
+        Return the candidates at indices, in that order.
+        :param indices: array of indices or boolean mask
+        :return: CandidateSet
+        """
+        indices = np.arange(len(self))[indices]
+        return CandidateSet(
+            [self.places[idx] for idx in indices],
+            self.lat[indices],
+            self.long[indices],
+            self.rating[indices],
+            self.price[indices],
+            None if self.travel_total is None
+            else self.travel_total[indices],
+            self.integer_totals
+        )
+
+    def coordinates(self):
+        """
+        :return: array of shape (n, 2) of [lat, long] rows
+        """
+        return np.column_stack((self.lat, self.long))
+
+    def top_by_rating(self, k):
+        """
+        Return the k best rated candidates, highest rating first; places
+        without rating count as DEFAULT_RATING, ties keep their order.
+        :param k: number of candidates
+        :return: CandidateSet
+        """
+        rating = np.where(np.isnan(self.rating) | (self.rating == 0),
+                          DEFAULT_RATING, self.rating)
+        return self.take(np.argsort(-rating, kind="stable")[:k])
+
+    def sorted_by_travel_total(self):
+        """
+        :return: CandidateSet in order of travel total, lowest first,
+                 unknown totals last
+        """
+        return self.take(np.argsort(self.travel_total, kind="stable"))
+
+    def distance_totals(self, user_coordinates):
+        """
+        Calculate total distance as-the-crow-flies from all users to each
+        candidate.
+        :param user_coordinates: list of Points for relevant users
+        :return: array of totals in metres
+        """
+        if not len(self):
+            return np.zeros(0)
+        return geo.distance_matrix(
+            user_coordinates,
+            self.coordinates()
+        ).sum(axis=0)
+
+    def with_distance_totals(self, user_coordinates):
+        """
+        :param user_coordinates: list of Points for relevant users
+        :return: CandidateSet with travel_total set to total distance
+        """
+        return self._with_totals(self.distance_totals(user_coordinates),
+                                 integer_totals=False)
+
+    def with_travel_totals(self, dist_matrix):
+        """
+        Calculate total travel time to each candidate. Travel times that
+        are missing (None) are replaced by the mean of the known travel
+        times to the same candidate; if none are known, the total is
+        unknown.
+        :param dist_matrix: travel times, one row per user, one column per
+                            candidate
+        :return: CandidateSet with travel_total set to total travel time
+        """
+        durations = np.array(
+            [[np.nan if duration is None else duration for duration in row]
+             for row in dist_matrix],
+            dtype=float
+        ).reshape(-1, len(self))
+        missing = np.isnan(durations)
+        if missing.any():
+            known = (~missing).sum(axis=0)
+            means = np.where(
+                known > 0,
+                np.nansum(durations, axis=0) / np.maximum(known, 1),
+                np.nan
+            )
+            durations = np.where(missing, means, durations)
+        return self._with_totals(durations.sum(axis=0),
+                                 integer_totals=True)
+
+    def prune(self, lower_bounds, upper_bounds, no_origins, keep,
+              element_budget, mode):
+        """
+        Drop candidates that cannot be among the best keep candidates, see
+        places.prune_candidate_set.
+        :param lower_bounds: array of lower bounds of each candidate's total
+        :param upper_bounds: array of upper bounds of each candidate's total
+        :param no_origins: number of Distance Matrix origins (rows)
+        :param keep: number of candidates that are never pruned
+        :param element_budget: maximum number of Distance Matrix elements
+        :param mode: mode of transportation, for logging
+        :return: CandidateSet of remaining candidates, in their order
+        """
+        if not len(self) or not no_origins:
+            return self
+        remaining = np.ones(len(self), dtype=bool)
+        if len(self) > keep:
+            threshold = np.sort(upper_bounds)[max(keep, 1) - 1]
+            remaining = lower_bounds <= threshold
+        max_places = max(1, element_budget // no_origins)
+        if remaining.sum() > max_places:
+            candidates = np.flatnonzero(remaining)
+            best = np.argsort(lower_bounds[candidates], kind="stable")
+            remaining = np.zeros(len(self), dtype=bool)
+            remaining[candidates[best[:max_places]]] = True
+        pruned = len(self) - int(remaining.sum())
+        logger.log_info(
+            f"Pruned {pruned} of {len(self)} places ({mode}): "
+            f"{pruned * no_origins} of {len(self) * no_origins} Distance "
+            f"Matrix elements saved"
+        )
+        return self.take(remaining)
+
+    def to_dicts(self):
+        """
+        Materialise the candidates as place dicts, with travel_total (None
+        if unknown) if it has been calculated.
+        :return: list of new place dicts
+        """
+        if self.travel_total is None:
+            return [dict(place) for place in self.places]
+        places = []
+        for place, total in zip(self.places, self.travel_total.tolist()):
+            place = dict(place)
+            if math.isnan(total):
+                place["travel_total"] = None
+            elif self.integer_totals:
+                place["travel_total"] = int(round(total))
+            else:
+                place["travel_total"] = total
+            places.append(place)
+        return places
+
+    def _with_totals(self, totals, integer_totals):
+        return CandidateSet(self.places, self.lat, self.long, self.rating,
+                            self.price, np.asarray(totals, dtype=float),
+                            integer_totals)
+
+    @staticmethod
+    def _column(places, key):
+        return np.array(
+            [np.nan if place.get(key) is None else place[key]
+             for place in places],
+            dtype=float
+        )
@@ -1,5 +1,7 @@
 import datetime
 
+from convergence.core.suggestion_cache import suggestion_cache, \
+                                              suggestion_state
 from convergence.utils import exceptions
 from convergence.data.repo import EventStore, UserStore, UserEventStore, \
                                   UserInviteStore
@@ -41,6 +43,8 @@ def delete_event(request_id, event_id):
     if not to_delete or not to_delete.event_owner_id == request_id:
         raise exceptions.NotFoundError("Invalid event id.")
     event_store.delete_event(to_delete)
+    suggestion_cache.invalidate_event(event_id)
+    suggestion_state.invalidate_event(event_id)
     return None
 
 
@@ -56,6 +60,7 @@ def add_user_to_event(user_id, event_id):
         raise exceptions.NotFoundError("Invalid user id or event id.")
     userevent = UserEvent(user_id=user_id, event_id=event_id)
     userevent_store.add_userevent(userevent)
+    suggestion_cache.invalidate_event(event_id)
     return userevent.as_dict()
 
 
@@ -66,6 +71,7 @@ def add_user_to_event_from_invite(userinvite):
     :return: UserEvent as Dict
     """
     userevent = userevent_store.add_user_to_event_from_invite(userinvite)
+    suggestion_cache.invalidate_event(userinvite.event_id)
     return userevent.as_dict()
 
 
@@ -81,6 +87,7 @@ def leave_event(request_id, event_id):
     if request_id == event_store.get_owner_id(event_id):
         raise exceptions.InvalidRequestError("Cannot leave owned event.")
     userevent_store.delete_userevent(to_delete)
+    suggestion_cache.invalidate_event(event_id)
     return None
 
 
@@ -99,6 +106,7 @@ def remove_user_from_event(request_id, user_id, event_id):
     if user_id == event_store.get_owner_id(event_id):
         raise exceptions.InvalidRequestError("Cannot remove event owner.")
     userevent_store.delete_userevent(to_delete)
+    suggestion_cache.invalidate_event(event_id)
     return None
 
 
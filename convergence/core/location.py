@@ -1,5 +1,4 @@
-import math
-
+from convergence.utils import geo
 from convergence.utils.point import Point
 
 MIN_LAT = -90.0
@@ -19,18 +18,16 @@ def find_centroid(coordinates):
         if not MIN_LAT <= coordinate.lat <= MAX_LAT or \
            not MIN_LON <= coordinate.long <= MAX_LON:
             raise ValueError("Invalid coordinates.")
-        lat = math.radians(float(coordinate.lat))
-        lon = math.radians(float(coordinate.long))
-        x_total += math.cos(lat) * math.cos(lon)
-        y_total += math.cos(lat) * math.sin(lon)
-        z_total += math.sin(lat)
-    x = float(x_total / len(coordinates))
-    y = float(y_total / len(coordinates))
-    z = float(z_total / len(coordinates))
-    return Point(
-        math.degrees(math.atan2(z, math.sqrt(x * x + y * y))),
-        math.degrees(math.atan2(y, x))
-    )
+        x, y, z = geo.unit_vector(coordinate.lat, coordinate.long)
+        x_total += x
+        y_total += y
+        z_total += z
+    return Point(*geo.centroid_from_sums(
+        x_total,
+        y_total,
+        z_total,
+        len(coordinates)
+    ))
 
 
 def mean_dist_from_centroid(coordinates, centroid):
@@ -40,5 +37,29 @@ def mean_dist_from_centroid(coordinates, centroid):
     :param centroid: centroid as Point
     :return: mean distance between centroid and coordinates in metres
     """
-    dist = sum(coordinate.distance_to(centroid) for coordinate in coordinates)
-    return dist / len(coordinates)
+    return float(geo.distance_matrix(coordinates, [centroid]).mean())
+
+
+def cluster_points(coordinates, snap_distance):
+    """
+    Group coordinates that lie within snap_distance of each other, so that
+    co-located users can share a single origin. Each cluster is led by its
+    first coordinate, and every other member lies within snap_distance of
+    that leader.
+    :param coordinates: list of coordinates as Points
+    :param snap_distance: maximum distance to the cluster leader in metres
+    :return: tuple (list of cluster leaders as Points, list with the index
+             of the cluster of each coordinate)
+    """
+    if not coordinates or snap_distance <= 0:
+        return list(coordinates), list(range(len(coordinates)))
+    within = geo.distance_matrix(coordinates, coordinates) <= snap_distance
+    leaders, assignment = [], [None] * len(coordinates)
+    for idx, coordinate in enumerate(coordinates):
+        if assignment[idx] is not None:
+            continue
+        for member_idx in within[idx].nonzero()[0]:
+            if assignment[member_idx] is None:
+                assignment[member_idx] = len(leaders)
+        leaders.append(coordinate)
+    return leaders, assignment
@@ -1,48 +1,216 @@
-from datetime import datetime
+import math
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
+import numpy as np
+
+from convergence import app
 from convergence.apis import google_maps
-from convergence.data.models import Place
+from convergence.core import calibration
+from convergence.core import location
+from convergence.core import travel_time_backends
+from convergence.core import travel_times
+from convergence.core.candidates import CandidateSet
+from convergence.data.models import Place, PlaceFetch
 from convergence.data.repo import PlaceStore
+from convergence.data.place_index import place_index
+from convergence.utils import geo
+from convergence.utils import logger
 from convergence.utils.point import Point
 
 MIN_PLACES_FROM_DATABASE = 4
+PLACE_TILE_RADII = [1500, 5000, 15000, 50000]  # metres
+MAX_PLACE_TILES = 4  # Nearby searches per search circle, up to 50 km
+PLACES_CACHE_TTL = timedelta(seconds=app.config["PLACES_CACHE_TTL"])
+SYNC_PAGINATION = app.config["PLACES_SYNC_PAGINATION"]
+TRAVEL_SPEEDS = app.config["TRAVEL_SPEEDS"]
+PRUNE_KEEP = app.config["SUGGESTION_PRUNE_KEEP"]
+ELEMENT_BUDGET = app.config["DISTANCE_MATRIX_ELEMENT_BUDGET"]
+ORIGIN_SNAP_DISTANCE = app.config["ORIGIN_SNAP_DISTANCE"]
+
+Tile = namedtuple("Tile", ["id", "centre", "radius"])
 
+tile_executor = ThreadPoolExecutor(max_workers=4,
+                                   thread_name_prefix="places-tiles")
+# fetches the remaining pages of Nearby Places searches in the background;
+# a single worker, as it is the only user of page_store's session
+page_executor = ThreadPoolExecutor(max_workers=1,
+                                   thread_name_prefix="places-pages")
 
 place_store = PlaceStore()
+page_store = PlaceStore()
+# (tile id, tile radius, place type) of the tiles whose remaining pages are
+# being fetched in the background, not yet recorded as fetched
+pending_tiles = set()
+pending_lock = threading.Lock()
 
 
-def get_places_around_centroid(point, radius, place_type):
+def get_places_around_centroid(point, radius, place_type, all_pages=None,
+                               cached_only=False):
     """
     Find places of place_type within a radius around a centroid
     and add to database.
+
+    Google is only asked for places in the tiles covering the search circle
+    (see get_covering_tiles) that have not been fetched for place_type
+    within PLACES_CACHE_TTL; fetches which found nothing are remembered as
+    well, so that empty areas do not cost any requests either.
+
+    Google returns up to 20 places per page, and each next page is only
+    available after a delay. Unless all_pages is set, this returns once the
+    first pages are in if they bring the number of places to at least
+    MIN_PLACES_FROM_DATABASE; the remaining pages are then fetched in the
+    background and added to the database for later requests.
     :param point: the centroid, of type Point
     :param radius: radius (in metres)
     :param place_type: type of place to be searched for
+    :param all_pages: True to wait for all pages, default
+                      PLACES_SYNC_PAGINATION
+    :param cached_only: True to return the places in the database only,
+                        however long ago they were fetched
     :return: list of places around centroid
     """
-    places_query = place_store.get_places_around_point(point, radius)
-    if len(places_query) >= MIN_PLACES_FROM_DATABASE:
-        return [p.as_dict() for p in places_query if place_type in p.gm_types]
-    places_ids = {place.gm_id for place in places_query}
-    places = google_maps.get_places_around_point(point, radius, place_type)
-    for place in places:
-        if place["gm_id"] not in places_ids:
-            place_store.add_place(
-                Place(
-                    name=place["name"],
-                    gm_id=place["gm_id"],
-                    lat=place["lat"],
-                    long=place["long"],
-                    address=place["address"],
-                    gm_price=place["price_level"],
-                    gm_rating=place["gm_rating"],
-                    gm_types=place["types"],
-                    timestamp=datetime.utcnow()
-                )
-            )
+    if all_pages is None:
+        all_pages = SYNC_PAGINATION
+    places = place_index.query(point, radius, place_type)
+    if places is None:  # index not loaded, ask the database
+        places = [
+            p.as_dict() for p in
+            place_store.get_places_around_point(point, radius, place_type)
+        ]
+    if cached_only or len(places) >= MIN_PLACES_FROM_DATABASE:
+        return places
+    tiles = get_covering_tiles(point, radius)
+    fetched = place_store.get_fetched_tiles(
+        [tile.id for tile in tiles],
+        tiles[0].radius,
+        place_type,
+        datetime.utcnow() - PLACES_CACHE_TTL
+    )
+    with pending_lock:
+        missing = [tile for tile in tiles if tile.id not in fetched and
+                   (tile.id, tile.radius, place_type) not in pending_tiles]
+    if not missing:  # every tile is fresh (or being fetched)
+        return places
+
+    pages = list(tile_executor.map(
+        lambda tile: google_maps.get_places_page(
+            tile.centre, tile.radius, place_type
+        ),
+        missing
+    ))
+    # tiles with more pages are recorded as fetched once all are in
+    next_pages = [(tile, len(tile_places), page_token)
+                  for tile, (tile_places, page_token) in zip(missing, pages)
+                  if page_token]
+    new_places = _save_places(
+        place_store,
+        place_type,
+        [tile_places for tile_places, _ in pages],
+        [(tile, len(tile_places))
+         for tile, (tile_places, page_token) in zip(missing, pages)
+         if not page_token]
+    )
+    _add_places_in_circle(places, new_places, point, radius, place_type)
+    if not next_pages:
+        return places
+    if all_pages or len(places) < MIN_PLACES_FROM_DATABASE:
+        remaining = list(tile_executor.map(
+            lambda next_page: google_maps.get_remaining_pages(
+                next_page[0].centre, next_page[0].radius, place_type,
+                next_page[2]
+            ),
+            next_pages
+        ))
+        new_places = _save_places(
+            place_store,
+            place_type,
+            remaining,
+            [(tile, first_count + len(tile_places))
+             for (tile, first_count, _), tile_places
+             in zip(next_pages, remaining)]
+        )
+        _add_places_in_circle(places, new_places, point, radius, place_type)
+    else:
+        with pending_lock:  # another request may have got here first
+            next_pages = [
+                next_page for next_page in next_pages
+                if (next_page[0].id, next_page[0].radius, place_type)
+                not in pending_tiles
+            ]
+            pending_tiles.update((tile.id, tile.radius, place_type)
+                                 for tile, _, _ in next_pages)
+        if next_pages:
+            page_executor.submit(_fetch_remaining_pages, next_pages,
+                                 place_type)
     return places
 
 
+def get_covering_tiles(point, radius):
+    """
+    Quantise a search circle to the fixed grid of Places API tiles.
+
+    Tiles are squares inscribed in a circle of one of PLACE_TILE_RADII,
+    so that a nearby search around a tile's centre covers the whole tile:
+    the smallest level that is at least radius and covers the search
+    circle with at most MAX_PLACE_TILES tiles. Nearby search circles,
+    whatever their exact centre and radius, thus map onto a small set of
+    tiles that can be fetched and cached independently. Radii beyond the
+    largest level (the Places API maximum) are clamped to it, which bounds
+    the number of tiles for spread-out events.
+    :param point: centre of search circle, type Point
+    :param radius: radius of search circle in metres
+    :return: list of Tiles intersecting the search circle's bounding box
+    """
+    radius = min(radius, PLACE_TILE_RADII[-1])
+    for tile_radius in [level for level in PLACE_TILE_RADII
+                        if level >= radius]:
+        tiles = _get_tiles_in_box(point, radius, tile_radius)
+        if len(tiles) <= MAX_PLACE_TILES:
+            break
+    return tiles
+
+
+def _get_tiles_in_box(point, radius, tile_radius):
+    """
+    Return the tiles of level tile_radius intersecting the bounding box of
+    a search circle.
+    """
+    side = tile_radius * math.sqrt(2)
+    tile_height = math.degrees(side / geo.EARTH_RADIUS)
+    min_lat, max_lat, min_long, max_long = point.bounding_box(radius)
+    if min_long > max_long:  # bounding box crosses the antimeridian
+        max_long += 360
+    tiles = []
+    for row in range(math.floor((min_lat + 90) / tile_height),
+                     math.floor((max_lat + 90) / tile_height) + 1):
+        row_min_lat = max(-90, row * tile_height - 90)
+        row_max_lat = min(90, row_min_lat + tile_height)
+        if row_min_lat < 0 < row_max_lat:
+            widest_lat = 0
+        else:
+            widest_lat = min(abs(row_min_lat), abs(row_max_lat))
+        tile_width = math.degrees(
+            side / (geo.EARTH_RADIUS * max(0.01, math.cos(
+                math.radians(widest_lat)
+            )))
+        )
+        no_cols = math.ceil(360 / tile_width)
+        tile_width = 360 / no_cols  # columns must wrap around evenly
+        for col in range(math.floor((min_long + 180) / tile_width),
+                         math.floor((max_long + 180) / tile_width) + 1):
+            col %= no_cols
+            tiles.append(Tile(
+                id=f"{row}:{col}",
+                centre=Point((row_min_lat + row_max_lat) / 2,
+                             (col + 0.5) * tile_width - 180),
+                radius=tile_radius
+            ))
+    return list({tile.id: tile for tile in tiles}.values())
+
+
 def get_distance_for_places(user_coordinates, places):
     """
     Calculate distance between each user and each place, add them
@@ -51,44 +219,299 @@ def get_distance_for_places(user_coordinates, places):
     :param places: list of places
     :return: list of places with added travel_total key
     """
-    places_coordinates = [
-        Point(place["lat"], place["long"]) for place in places
-    ]
-    for place in places:
-        place["travel_total"] = 0
-    for user in user_coordinates:
-        for i, place in enumerate(places_coordinates):
-            places[i]["travel_total"] += user.distance_to(place)
-    return places
+    if not places:
+        return places
+    return CandidateSet.from_places(places).with_distance_totals(
+        user_coordinates
+    ).to_dicts()
 
 
-def get_travel_time_for_places(user_coordinates, places, mode):
+def prune_candidates(user_coordinates, places, mode, keep=PRUNE_KEEP,
+                     element_budget=ELEMENT_BUDGET):
     """
-    Query Google Distance Matrix API for travel times for each user
-    to each place, and calculate total travel time for each place.
+    Drop places that cannot be among the best keep places for mode, before
+    requesting their travel times (see prune_candidate_set).
     :param user_coordinates: list of Points for relevant users
     :param places: list of places
     :param mode: mode of transportation
-    :return: list of places with added travel_total key
+    :param keep: number of places that are never pruned
+    :param element_budget: maximum number of Distance Matrix elements
+    :return: list of remaining places, in their original order
     """
-    places_coordinates = []
-    for place in places:
-        places_coordinates.append(Point(place["lat"], place["long"]))
-        place["travel_total"] = 0
-    dist_matrix = google_maps.get_distance_matrix(
+    if mode not in TRAVEL_SPEEDS or not places:
+        return places
+    return prune_candidate_set(
         user_coordinates,
-        places_coordinates,
+        CandidateSet.from_places(places),
+        mode,
+        keep,
+        element_budget
+    ).places
+
+
+def prune_candidate_set(user_coordinates, candidates, mode, keep=PRUNE_KEEP,
+                        element_budget=ELEMENT_BUDGET):
+    """
+    Drop candidates that cannot be among the best keep candidates for mode,
+    before requesting their travel times.
+
+    Total travel time to a place is bounded from below by the total
+    as-the-crow-flies distance at the fastest speed for mode, and from above
+    (optimistically, as detours are unbounded) at the slowest speed. Places
+    whose lower bound exceeds the keep-th best upper bound are dropped. If
+    the remaining places would still take more than element_budget
+    Distance Matrix elements for this group (one row per origin, see
+    get_travel_times), only the places with the lowest lower bounds are
+    kept. Where a calibrated model exists (see
+    calibration), both bounds are narrowed to its prediction interval.
+    :param user_coordinates: list of Points for relevant users
+    :param candidates: CandidateSet
+    :param mode: mode of transportation
+    :param keep: number of places that are never pruned
+    :param element_budget: maximum number of Distance Matrix elements
+    :return: CandidateSet of remaining places, in their original order
+    """
+    if mode not in TRAVEL_SPEEDS or not len(candidates) \
+            or not user_coordinates:
+        return candidates
+    slowest, fastest = TRAVEL_SPEEDS[mode]
+    distances = geo.distance_matrix(user_coordinates,
+                                    candidates.coordinates())
+    lower_bounds, upper_bounds = distances / fastest, distances / slowest
+    prediction = calibration.predict(user_coordinates, distances, mode)
+    if prediction is not None:  # narrow to the prediction intervals
+        _, low, high = prediction
+        lower_bounds = np.fmax(lower_bounds, low)
+        upper_bounds = np.fmax(np.fmin(upper_bounds, high), lower_bounds)
+    origins, _ = location.cluster_points(user_coordinates,
+                                         ORIGIN_SNAP_DISTANCE)
+    return candidates.prune(
+        lower_bounds.sum(axis=0),
+        upper_bounds.sum(axis=0),
+        len(origins),
+        keep,
+        element_budget,
         mode
     )
-    for user_idx, user_to_places in enumerate(dist_matrix):
-        for place_idx, duration in enumerate(user_to_places):
-            if duration:
-                places[place_idx]["travel_total"] += duration
-            else:
-                # if Google Distance matrix couldn't provide duration, use avg
-                places[place_idx]["travel_total"] \
-                    += places[place_idx]["travel_total"] / user_idx + 1
-    return places
+
+
+def get_travel_time_for_places(user_coordinates, places, mode,
+                               backend=None):
+    """
+    Get travel times for each user to each place (from the travel time cache
+    or Google Distance Matrix API, or estimated, see travel_time_backends),
+    and calculate total travel time for each place.
+    :param user_coordinates: list of Points for relevant users
+    :param places: list of places
+    :param mode: mode of transportation
+    :param backend: TravelTimeBackend, default as configured
+    :return: list of places with added travel_total key
+    """
+    return add_travel_totals(
+        places,
+        get_travel_times(user_coordinates, places, mode, backend)
+    )
+
+
+def get_travel_times(user_coordinates, places, mode, backend=None):
+    """
+    Get travel times for each user to each place. Users within
+    ORIGIN_SNAP_DISTANCE of each other share an origin, so the matrix grows
+    with the number of distinct locations rather than with the number of
+    users.
+    :param user_coordinates: list of Points for relevant users
+    :param places: list of places
+    :param mode: mode of transportation
+    :param backend: TravelTimeBackend, default as configured
+    :return: travel times, one row per user, one column per place
+    """
+    backend = backend or travel_time_backends.get_backend()
+    origins, assignment = location.cluster_points(
+        user_coordinates,
+        ORIGIN_SNAP_DISTANCE
+    )
+    dist_matrix = backend.get_distance_matrix(origins, places, mode)
+    return [dist_matrix[cluster] for cluster in assignment]
+
+
+def get_stale_travel_times(user_coordinates, places, mode):
+    """
+    Get cached travel times for each user to each place however long ago
+    they were requested (see travel_times.get_stale_distance_matrix), for
+    when the Distance Matrix API is unavailable.
+    :param user_coordinates: list of Points for relevant users
+    :param places: list of places
+    :param mode: mode of transportation
+    :return: travel times, one row per user, one column per place, or None
+             if any of them is not cached
+    """
+    origins, assignment = location.cluster_points(
+        user_coordinates,
+        ORIGIN_SNAP_DISTANCE
+    )
+    dist_matrix = travel_times.get_stale_distance_matrix(origins, places,
+                                                         mode)
+    if any(duration is None for row in dist_matrix for duration in row):
+        return None
+    return [dist_matrix[cluster] for cluster in assignment]
+
+
+def iter_travel_times(user_coordinates, places, mode, backend=None):
+    """
+    Get travel times for each user to each place like
+    get_travel_time_for_places, but incrementally (see
+    travel_times.iter_distance_matrix).
+    :param user_coordinates: list of Points for relevant users
+    :param places: list of places
+    :param mode: mode of transportation
+    :param backend: TravelTimeBackend, default as configured
+    :return: generator of lists of (user index, place index, duration)
+    """
+    backend = backend or travel_time_backends.get_backend()
+    origins, assignment = location.cluster_points(
+        user_coordinates,
+        ORIGIN_SNAP_DISTANCE
+    )
+    users_by_origin = [[] for _ in origins]
+    for user_idx, cluster in enumerate(assignment):
+        users_by_origin[cluster].append(user_idx)
+    for updates in backend.iter_distance_matrix(origins, places, mode):
+        yield [
+            (user_idx, place_idx, duration)
+            for origin_idx, place_idx, duration in updates
+            for user_idx in users_by_origin[origin_idx]
+        ]
+
+
+def add_travel_totals(places, dist_matrix):
+    """
+    Calculate total travel time for each place. A travel time the Distance
+    Matrix could not provide counts as the mean of the place's other travel
+    times; if there are none, travel_total is None.
+    :param places: list of places
+    :param dist_matrix: travel times, one row per user, one column per place
+    :return: list of places with added travel_total key
+    """
+    return CandidateSet.from_places(places).with_travel_totals(
+        dist_matrix
+    ).to_dicts()
+
+
+def estimate_travel_totals(places, dist_matrix, place_indices):
+    """
+    Estimate total travel time for places of which only some travel times
+    are known yet, extrapolating from the mean of the known ones.
+    :param places: list of places
+    :param dist_matrix: travel times, one row per user, one column per place,
+                        None where not known yet
+    :param place_indices: indices of the places to estimate
+    :return: list of dicts with gm_id, travel_total and complete (True if
+             all travel times for the place are known)
+    """
+    estimates = []
+    for place_idx in place_indices:
+        known = [user_to_places[place_idx] for user_to_places in dist_matrix
+                 if user_to_places[place_idx] is not None]
+        estimates.append({
+            "gm_id": places[place_idx]["gm_id"],
+            "travel_total": sum(known) * len(dist_matrix) / len(known)
+            if known else None,
+            "complete": len(known) == len(dist_matrix)
+        })
+    return estimates
+
+
+def _save_places(store, place_type, tile_places, completed_tiles):
+    """
+    Add or update places fetched from Google in the database, and record
+    the tiles of which all pages have been fetched.
+    :param store: PlaceStore
+    :param place_type: type of place searched for
+    :param tile_places: lists of places (as returned by google_maps)
+    :param completed_tiles: list of (Tile, number of places found)
+    :return: list of the fetched places as dicts
+    """
+    fetched_places = {}
+    for places in tile_places:
+        for place in places:
+            fetched_places[place["gm_id"]] = Place(
+                name=place["name"],
+                gm_id=place["gm_id"],
+                lat=place["lat"],
+                long=place["long"],
+                address=place["address"],
+                gm_price=place["price_level"],
+                gm_rating=place["gm_rating"],
+                gm_types=place["types"],
+                timestamp=datetime.utcnow()
+            )
+    fetched = [place.as_dict() for place in fetched_places.values()]
+    counts = store.upsert_places(list(fetched_places.values()))
+    if counts is None:  # not stored, so the tiles are not fresh either
+        return fetched
+    inserted, updated = counts
+    logger.log_info(
+        f"Places fetched for {place_type}: {inserted} inserted, "
+        f"{updated} updated."
+    )
+    store.add_place_fetches([
+        PlaceFetch(
+            tile=tile.id,
+            radius=tile.radius,
+            place_type=place_type,
+            result_count=result_count,
+            timestamp=datetime.utcnow()
+        )
+        for tile, result_count in completed_tiles
+    ])
+    return fetched
+
+
+def _add_places_in_circle(places, new_places, point, radius, place_type):
+    """
+    Add the new places within the search circle (tiles extend beyond it)
+    and of place_type to places.
+    """
+    places_ids = {place["gm_id"] for place in places}
+    new_places = [place for place in new_places
+                  if place["gm_id"] not in places_ids]
+    if not new_places:
+        return None
+    distances = geo.distance_matrix(
+        [point],
+        [(place["lat"], place["long"]) for place in new_places]
+    )[0]
+    places.extend(
+        place for place, distance in zip(new_places, distances)
+        if distance < radius and place_type in place["gm_types"]
+    )
+    return None
+
+
+def _fetch_remaining_pages(next_pages, place_type):
+    """
+    Fetch the remaining pages of Nearby Places searches and add them to the
+    database, in the background.
+    :param next_pages: list of (Tile, number of places on the first page,
+                       token of the next page)
+    :param place_type: type of place searched for
+    """
+    for tile, first_count, page_token in next_pages:
+        try:
+            remaining = google_maps.get_remaining_pages(
+                tile.centre, tile.radius, place_type, page_token
+            )
+            _save_places(page_store, place_type, [remaining],
+                         [(tile, first_count + len(remaining))])
+        except Exception as e:
+            logger.log_error(
+                f"Unable to fetch remaining places for tile {tile.id} "
+                f"({place_type}): {str(e)}"
+            )
+        finally:
+            with pending_lock:
+                pending_tiles.discard((tile.id, tile.radius, place_type))
+    return None
 
 
 def sort_places_by_travel_total(places):
@@ -97,12 +520,9 @@ def sort_places_by_travel_total(places):
 
 def sort_places_by_rating(places):
     """
-    Return list of places, sorted by ranking (highest to lowest)
+    Return list of places, sorted by ranking (highest to lowest); places
+    without a rating count as rated 1
     :param places: list of places
     :return: list of places, sorted by rating
     """
-    for place in places:
-        if not place["gm_rating"]:
-            place["gm_rating"] = 1
-    places = sorted(places, key=lambda x: x["gm_rating"], reverse=True)
-    return places
+    return CandidateSet.from_places(places).top_by_rating(len(places)).places
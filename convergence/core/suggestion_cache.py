@@ -0,0 +1,111 @@
+"""
+In-process cache of computed suggestions.
+
+Entries are keyed on event, place type, suggestions mode and a fingerprint
+of the members' coordinates, so a stale entry can never be served for a
+changed event. Entries are also dropped as soon as their event's membership
+changes or one of their members moves, and expire after a TTL so that
+upstream data (ratings, travel times) is refreshed.
+
+The suggestion state keeps the candidate places and each member's travel
+times per event, place type and mode, so that when members join, leave or
+move only their travel times need to be requested. It is only dropped when
+the event is deleted or the TTL expires.
+"""
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from convergence import app
+
+CACHE_TTL = app.config["SUGGESTION_CACHE_TTL"]
+MAX_CACHE_ENTRIES = app.config["SUGGESTION_CACHE_MAX_ENTRIES"]
+STATE_TTL = app.config["SUGGESTION_STATE_TTL"]
+MAX_STATE_ENTRIES = app.config["SUGGESTION_STATE_MAX_ENTRIES"]
+
+
+class SuggestionCache:
+    """LRU cache of suggestions with per-event and per-user invalidation"""
+    def __init__(self, ttl=CACHE_TTL, max_entries=MAX_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expiry, user_ids, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return cached value for key.
+        :param key: key as returned by make_key
+        :return: copy of cached value, or None if not cached or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(entry[2])
+
+    def put(self, key, user_ids, value):
+        """
+        Cache value for key.
+        :param key: key as returned by make_key
+        :param user_ids: ids of the members the value was computed for
+        :param value: value to cache
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl,
+                                  frozenset(user_ids),
+                                  copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return None
+
+    def invalidate_event(self, event_id):
+        """
+        Drop all entries for an event, e.g. when its membership changes.
+        :param event_id: event id
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == event_id]:
+                del self._entries[key]
+        return None
+
+    def invalidate_user(self, user_id):
+        """
+        Drop all entries computed for a user, e.g. when the user moves.
+        :param user_id: user id
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if user_id in entry[1]]:
+                del self._entries[key]
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def make_key(event_id, place_type, mode, members):
+    """
+    Build cache key for suggestions.
+    :param event_id: event id
+    :param place_type: type of place
+    :param mode: suggestions mode
+    :param members: list of (user_id, lat, long) for all event members
+    :return: hashable key
+    """
+    fingerprint = hashlib.sha1(
+        repr(sorted(members)).encode()
+    ).hexdigest()
+    return event_id, place_type, mode, fingerprint
+
+
+suggestion_cache = SuggestionCache()
+suggestion_state = SuggestionCache(STATE_TTL, MAX_STATE_ENTRIES)
@@ -0,0 +1,147 @@
+"""
+Background computation of suggestions.
+
+Suggestions that need Google Maps (places pagination, Distance Matrix) can
+take several seconds; running them as jobs on a small worker pool keeps the
+Flask workers free. A job is identified by a random id which the client
+polls. Submitting the same event/type/mode while a job is still queued or
+running attaches to that job. Finished jobs are kept for JOB_RESULT_TTL
+seconds, and their results are reused through the suggestion cache.
+
+Jobs use the same stores as requests, whose sessions are scoped per thread
+(see Store), so each worker has its own sessions; they are closed after
+every job, so that a job does not see the state of an earlier one.
+"""
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from convergence import app, db
+from convergence.core import events
+from convergence.core import suggestions
+from convergence.utils import logger
+from convergence.utils import exceptions
+
+MAX_JOB_WORKERS = app.config["SUGGESTION_JOB_WORKERS"]
+JOB_RESULT_TTL = app.config["SUGGESTION_JOB_RESULT_TTL"]
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+job_executor = ThreadPoolExecutor(MAX_JOB_WORKERS,
+                                  thread_name_prefix="suggestion-job")
+jobs = {}  # job id -> SuggestionJob
+active_jobs = {}  # (event_id, place_type, mode) -> job id
+jobs_lock = threading.Lock()
+
+
+class SuggestionJob:
+    """State of a single suggestions computation"""
+    def __init__(self, request_id, event_id, place_type, mode):
+        self.id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.event_id = event_id
+        self.place_type = place_type
+        self.mode = mode
+        self.status = QUEUED
+        self.result = None
+        self.meta = {}
+        self.error = None
+        self.finished = None
+
+    @property
+    def key(self):
+        return self.event_id, self.place_type, self.mode
+
+    def as_dict(self):
+        job = {
+            "job_id": self.id,
+            "event_id": self.event_id,
+            "place_type": self.place_type,
+            "mode": self.mode,
+            "status": self.status
+        }
+        if self.status == DONE:
+            job["result"] = self.result
+            job.update(self.meta)
+        elif self.status == FAILED:
+            job["error"] = self.error
+        return job
+
+
+def submit_job(request_id, event_id, place_type, suggestions_mode):
+    """
+    Queue computation of suggestions, or attach to the job already computing
+    them.
+    :param request_id: requesting user (must be event member)
+    :param event_id: event
+    :param place_type: type of place to suggest
+    :param suggestions_mode: suggestions mode (e.g. "distance" or "transit")
+    :return: job info as dict
+    """
+    events.get_members(request_id, event_id)  # raises if not a member
+    key = (event_id, place_type, suggestions_mode)
+    with jobs_lock:
+        _purge_finished_jobs()
+        job_id = active_jobs.get(key)
+        if job_id:
+            return jobs[job_id].as_dict()
+        job = SuggestionJob(request_id, event_id, place_type,
+                            suggestions_mode)
+        jobs[job.id] = job
+        active_jobs[key] = job.id
+    job_executor.submit(_run_job, job)
+    return job.as_dict()
+
+
+def get_job(request_id, job_id):
+    """
+    Get status (and, once done, result) of a job.
+    :param request_id: requesting user (must be member of the job's event)
+    :param job_id: job id
+    :return: job info as dict
+    """
+    with jobs_lock:
+        _purge_finished_jobs()
+        job = jobs.get(job_id)
+    if not job:
+        raise exceptions.NotFoundError("Invalid job id.")
+    try:
+        events.get_members(request_id, job.event_id)
+    except exceptions.NotFoundError:
+        raise exceptions.NotFoundError("Invalid job id.")
+    with jobs_lock:
+        return job.as_dict()
+
+
+def _run_job(job):
+    with jobs_lock:
+        job.status = RUNNING
+    try:
+        result, meta = suggestions.get_suggestions(
+            job.request_id,
+            job.event_id,
+            job.place_type,
+            job.mode
+        )
+    except Exception as e:
+        logger.log_error(f"Suggestion job {job.id} failed: {str(e)}")
+        error = getattr(e, "message", "Unable to compute suggestions.")
+        result, meta, status = None, {}, FAILED
+    else:
+        error, status = None, DONE
+    finally:
+        db.remove_sessions()
+    with jobs_lock:
+        job.result, job.meta, job.error = result, meta, error
+        job.status = status
+        job.finished = time.monotonic()
+        if active_jobs.get(job.key) == job.id:
+            del active_jobs[job.key]
+
+
+def _purge_finished_jobs():
+    expired = time.monotonic() - JOB_RESULT_TTL
+    for job_id in [job_id for job_id, job in jobs.items()
+                   if job.finished is not None and job.finished < expired]:
+        del jobs[job_id]
@@ -1,18 +1,45 @@
 import math
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
+from convergence import app, db
 from convergence.core import location
 from convergence.core import places
-from convergence.core import events
+from convergence.core import suggestion_cache
+from convergence.core import travel_time_backends
+from convergence.core.candidates import CandidateSet
+from convergence.utils import logger
 from convergence.utils.point import Point
-from convergence.data.repo import UserStore
+from convergence.utils import exceptions
+from convergence.data.repo import EventStore, UserEventStore
 
 MEAN_DIST_TO_RADIUS_RATIO = 0.25
 MAX_PLACES_PER_SUGGESTION = 10
+CENTROID_SHIFT_RATIO = app.config["SUGGESTION_CENTROID_SHIFT_RATIO"]
+# travel times of members who have not moved are requested again (mostly
+# from the travel time cache) once they are as old as cached suggestions
+ROW_TTL = app.config["SUGGESTION_CACHE_TTL"]
 
-user_store = UserStore()
+event_store = EventStore()
+userevent_store = UserEventStore()
 
 
-def get_suggestions(request_id, event_id, place_type, suggestions_mode):
+class Member(namedtuple("Member", ["id", "latitude", "longitude"])):
+    """Id and location of an event member"""
+    __slots__ = ()
+
+    def get_location(self):
+        return self.latitude, self.longitude
+
+
+# separate from google_maps.matrix_executor, which each mode submits to
+mode_executor = ThreadPoolExecutor(max_workers=5,
+                                   thread_name_prefix="suggestion-mode")
+
+
+def get_suggestions(request_id, event_id, place_type, suggestions_mode,
+                    degraded=False):
     """
     Calculate meeting place suggestions of place_type for an event, based on
     requested suggestion mode.
@@ -20,41 +47,505 @@ def get_suggestions(request_id, event_id, place_type, suggestions_mode):
     :param event_id: event
     :param place_type: type of place to suggest
     :param suggestions_mode: suggestions mode (e.g. "distance" or "transit")
-    :return: list of places in requested order (e.g. distance, transit time)
+    :param degraded: True to estimate travel times without network access
+                     (see travel_time_backends)
+    :return: tuple (list of places in requested order (e.g. distance,
+             transit time), dict with response metadata: "cached" is True
+             if the places were served from the suggestion cache,
+             "degraded" is True if travel times are estimates, "stale" is
+             True if a Google API is unavailable and the places were
+             ranked on stale data (see _get_stale_suggestions))
     """
-    ids = [
-        member["user_id"] for member in events.get_members(
-            request_id, event_id
-        )
+    backend = travel_time_backends.get_backend(degraded)
+    ids, users = _get_event_users(request_id, event_id)
+    cache_key = _get_cache_key(event_id, place_type, suggestions_mode, users,
+                               backend)
+    meta = {"degraded": _is_degraded(suggestions_mode, backend),
+            "stale": False}
+    result = suggestion_cache.suggestion_cache.get(cache_key)
+    if result is not None:
+        return result, {"cached": True, **meta}
+    try:
+        if suggestions_mode == "distance":
+            result = _compute_suggestions(
+                event_id,
+                users,
+                place_type,
+                suggestions_mode
+            )
+        else:
+            result = _update_suggestions(
+                event_id,
+                users,
+                place_type,
+                suggestions_mode,
+                backend
+            )
+    except exceptions.CircuitOpenError as e:
+        result = _get_stale_suggestions(event_id, users, place_type,
+                                        suggestions_mode, backend, str(e))
+        return result, {"cached": False, **meta, "stale": True}
+    suggestion_cache.suggestion_cache.put(cache_key, ids, result)
+    return result, {"cached": False, **meta}
+
+
+def stream_suggestions(request_id, event_id, place_type, suggestions_mode,
+                       degraded=False):
+    """
+    Calculate meeting place suggestions like get_suggestions, producing
+    intermediate results while travel times are requested:
+    - "ranking": places ordered by total distance as-the-crow-flies
+    - "travel_times": estimated travel_total of the places for which new
+      travel times came in (see places.estimate_travel_totals)
+    - "result": the final list of places, as returned by get_suggestions,
+      or stale suggestions if a Google API is unavailable
+    Membership is checked before this function returns.
+    :param request_id: requesting user
+    :param event_id: event
+    :param place_type: type of place to suggest
+    :param suggestions_mode: suggestions mode (e.g. "distance" or "transit")
+    :param degraded: True to estimate travel times without network access
+    :return: generator of (event name, dict with "data" and metadata)
+    """
+    backend = travel_time_backends.get_backend(degraded)
+    ids, users = _get_event_users(request_id, event_id)
+    cache_key = _get_cache_key(event_id, place_type, suggestions_mode, users,
+                               backend)
+    return _stream_suggestions(
+        event_id,
+        ids,
+        users,
+        cache_key,
+        place_type,
+        suggestions_mode,
+        backend
+    )
+
+
+def compare_suggestions(request_id, event_id, place_type, suggestions_modes,
+                        degraded=False):
+    """
+    Calculate meeting place suggestions of place_type for an event for
+    several suggestion modes at once. Members and candidate places are
+    looked up once and shared by all modes; the travel times for each mode
+    are requested concurrently.
+    :param request_id: requesting user
+    :param event_id: event
+    :param place_type: type of place to suggest
+    :param suggestions_modes: list of suggestions modes
+    :param degraded: True to estimate travel times without network access
+    :return: tuple (dict with "modes": places in order for each mode, and
+             "combined": places in all modes ordered by average rank, with
+             their rank and travel_total per mode; dict with response
+             metadata: "cached" per mode, "degraded", "stale")
+    """
+    backend = travel_time_backends.get_backend(degraded)
+    ids, users = _get_event_users(request_id, event_id)
+    results, meta = {}, {"cached": {}, "degraded": any(
+        _is_degraded(mode, backend) for mode in suggestions_modes
+    ), "stale": False}
+    for mode in suggestions_modes:
+        cache_key = _get_cache_key(event_id, place_type, mode, users,
+                                   backend)
+        results[mode] = suggestion_cache.suggestion_cache.get(cache_key)
+        meta["cached"][mode] = results[mode] is not None
+    missing = [mode for mode in suggestions_modes if results[mode] is None]
+    if missing:
+        try:
+            user_coordinates, candidates = _get_candidates(
+                event_id,
+                users,
+                place_type
+            )
+            places_stale = False
+        except exceptions.CircuitOpenError:
+            user_coordinates, candidates = _get_candidates(
+                event_id,
+                users,
+                place_type,
+                cached_only=True
+            )
+            places_stale = True
+
+        def rank(mode):
+            try:
+                if not places_stale:
+                    try:
+                        return _rank_candidates(user_coordinates,
+                                                candidates, mode,
+                                                backend), False
+                    except exceptions.CircuitOpenError:
+                        pass
+                return _rank_stale_candidates(user_coordinates, candidates,
+                                              mode, backend), True
+            finally:  # stores read on mode_executor's threads
+                db.remove_sessions()
+
+        for mode, (result, stale) in zip(missing,
+                                         mode_executor.map(rank, missing)):
+            results[mode] = result
+            if stale:  # ranked again once the API is available
+                meta["stale"] = True
+                continue
+            suggestion_cache.suggestion_cache.put(
+                _get_cache_key(event_id, place_type, mode, users, backend),
+                ids,
+                result
+            )
+    return {
+        "modes": results,
+        "combined": _combine_rankings(results)
+    }, meta
+
+
+def _get_event_users(request_id, event_id):
+    """
+    Return ids of all members of an event, and the members with a location.
+    :param request_id: requesting user (must be event member)
+    :param event_id: event
+    :return: tuple (list of member ids, list of Members with a location)
+    """
+    rows = userevent_store.get_member_locations(request_id, event_id)
+    if not rows:
+        raise exceptions.NotFoundError("Invalid user id or event id.")
+    members = [
+        Member(*row) for row in rows
+        if row.latitude is not None and row.longitude is not None
     ]
-    users = user_store.get_users_by_ids(ids)
+    if not members:
+        raise exceptions.InvalidRequestError(
+            "No event members with a location."
+        )
+    return [row.user_id for row in rows], members
+
+
+def _get_cache_key(event_id, place_type, suggestions_mode, users, backend):
+    return suggestion_cache.make_key(
+        event_id,
+        place_type,
+        _get_backend_mode(suggestions_mode, backend),
+        [(user.id, *user.get_location()) for user in users]
+    )
+
+
+def _get_backend_mode(suggestions_mode, backend):
+    """
+    Suggestions mode qualified by travel time backend, so that estimated
+    travel times are never cached as, or mixed with, requested ones.
+    """
+    if suggestions_mode == "distance":
+        return suggestions_mode
+    return f"{suggestions_mode}:{backend.name}"
+
+
+def _is_degraded(suggestions_mode, backend):
+    return suggestions_mode != "distance" and backend.estimated
+
+
+def _get_candidates(event_id, users, place_type, cached_only=False):
     user_coordinates = [Point(*user.get_location()) for user in users]
-    centroid = location.find_centroid(user_coordinates)
+    centroid, radius = _get_search_area(event_id, user_coordinates)
+    return user_coordinates, _find_places(centroid, radius, place_type,
+                                          cached_only)
+
+
+def _get_search_area(event_id, user_coordinates):
+    centroid = event_store.get_centroid(event_id, len(user_coordinates))
+    if centroid is None:  # no location sums, or out of date
+        centroid = location.find_centroid(user_coordinates)
+    else:
+        centroid = Point(*centroid)
     mean_dist = location.mean_dist_from_centroid(
         user_coordinates,
         centroid
     )
     radius = max(1500, math.ceil(mean_dist * MEAN_DIST_TO_RADIUS_RATIO))
-    potential_places = places.get_places_around_centroid(
+    return centroid, radius
+
+
+def _find_places(centroid, radius, place_type, cached_only=False):
+    candidates = CandidateSet.from_places(places.get_places_around_centroid(
         centroid,
         radius,
+        place_type,
+        cached_only=cached_only
+    ))
+    if len(candidates) > MAX_PLACES_PER_SUGGESTION:
+        candidates = candidates.top_by_rating(MAX_PLACES_PER_SUGGESTION)
+    return candidates
+
+
+def _compute_suggestions(event_id, users, place_type, suggestions_mode):
+    user_coordinates, candidates = _get_candidates(
+        event_id,
+        users,
         place_type
     )
-    if not potential_places:
+    return _rank_candidates(user_coordinates, candidates, suggestions_mode)
+
+
+def _update_suggestions(event_id, users, place_type, suggestions_mode,
+                        backend):
+    """
+    Calculate suggestions for a travel time mode, reusing the candidate
+    places and travel times of the previous calculation for this event,
+    place type and mode (see suggestion_cache.suggestion_state). Travel
+    times are only requested for members who joined or moved since, or
+    whose travel times are older than ROW_TTL; the candidates are only
+    looked up again when the search area has moved or grown by more than
+    CENTROID_SHIFT_RATIO of its radius, and pruned again when members
+    joined or left.
+    :param event_id: event
+    :param users: event members
+    :param place_type: type of place to suggest
+    :param suggestions_mode: suggestions mode (e.g. "transit")
+    :param backend: TravelTimeBackend
+    :return: list of places in order of total travel time
+    """
+    user_coordinates = [Point(*user.get_location()) for user in users]
+    centroid, radius = _get_search_area(event_id, user_coordinates)
+    key = (event_id, place_type,
+           _get_backend_mode(suggestions_mode, backend))
+    state = suggestion_cache.suggestion_state.get(key)
+    if state is None or _search_area_moved(state, centroid, radius):
+        candidates = _find_places(centroid, radius, place_type)
+        if not len(candidates):
+            return []
+        state = {
+            "centroid": (centroid.lat, centroid.long),
+            "radius": radius,
+            "candidates": candidates.places,
+            "members": None,  # ids of the members places were pruned for
+            "places": None,
+            "rows": {}  # user id -> {"location", "durations", "fetched"}
+        }
+    member_ids = sorted(user.id for user in users)
+    if state["members"] != member_ids:
+        pruned = places.prune_candidate_set(
+            user_coordinates,
+            CandidateSet.from_places(state["candidates"]),
+            suggestions_mode
+        ).places
+        if state["places"] is None or \
+                [place["gm_id"] for place in pruned] != \
+                [place["gm_id"] for place in state["places"]]:
+            state["rows"] = {}  # durations are per place
+        state["places"] = pruned
+        state["members"] = member_ids
+    rows = state["rows"]
+    now = time.monotonic()
+    stale = [
+        idx for idx, user in enumerate(users)
+        if user.id not in rows
+        or tuple(rows[user.id]["location"]) != tuple(user.get_location())
+        or now - rows[user.id]["fetched"] >= ROW_TTL
+    ]
+    if stale:
+        dist_matrix = places.get_travel_times(
+            [user_coordinates[idx] for idx in stale],
+            state["places"],
+            suggestions_mode,
+            backend
+        )
+        for idx, durations in zip(stale, dist_matrix):
+            rows[users[idx].id] = {
+                "location": users[idx].get_location(),
+                "durations": durations,
+                "fetched": now
+            }
+    logger.log_info(
+        f"Suggestions ({suggestions_mode}) for event {event_id}: "
+        f"requested travel times for {len(stale)} of {len(users)} members"
+    )
+    state["rows"] = {user.id: rows[user.id] for user in users}
+    suggestion_cache.suggestion_state.put(key, [], state)
+    return CandidateSet.from_places(state["places"]).with_travel_totals(
+        [rows[user.id]["durations"] for user in users]
+    ).sorted_by_travel_total().to_dicts()
+
+
+def _search_area_moved(state, centroid, radius):
+    shift = Point(*state["centroid"]).distance_to(centroid)
+    return shift > CENTROID_SHIFT_RATIO * state["radius"] \
+        or abs(radius - state["radius"]) > CENTROID_SHIFT_RATIO * \
+        state["radius"]
+
+
+def _rank_candidates(user_coordinates, candidates, suggestions_mode,
+                     backend=None):
+    if not len(candidates):
         return []
-    if len(potential_places) > MAX_PLACES_PER_SUGGESTION:
-        potential_places = places.sort_places_by_rating(
-            potential_places
-        )[:MAX_PLACES_PER_SUGGESTION]
     if suggestions_mode == "distance":
-        potential_places = places.get_distance_for_places(
+        candidates = candidates.with_distance_totals(user_coordinates)
+    else:
+        candidates = places.prune_candidate_set(
             user_coordinates,
-            potential_places
+            candidates,
+            suggestions_mode
         )
-    else:
-        potential_places = places.get_travel_time_for_places(
+        candidates = candidates.with_travel_totals(places.get_travel_times(
             user_coordinates,
-            potential_places,
+            candidates.places,
+            suggestions_mode,
+            backend
+        ))
+    return candidates.sorted_by_travel_total().to_dicts()
+
+
+def _get_stale_suggestions(event_id, users, place_type, suggestions_mode,
+                           backend, reason):
+    """
+    Calculate suggestions while a Google API is unavailable (its circuit
+    breaker is open, see google_maps.breakers), without sending any
+    requests: from the places in the database however long ago they were
+    fetched, ranked by cached travel times however long ago they were
+    requested, or by distance as-the-crow-flies if not all of them are
+    cached. In degraded mode, they are ranked by estimated travel times as
+    usual. These are not cached, so that the suggestions are calculated
+    again once the API is available.
+    :param event_id: event
+    :param users: event members
+    :param place_type: type of place to suggest
+    :param suggestions_mode: suggestions mode (e.g. "transit")
+    :param backend: TravelTimeBackend
+    :param reason: error message, for logging
+    :return: list of places in order
+    """
+    logger.log_info(
+        f"Stale suggestions ({suggestions_mode}) for event {event_id}: "
+        f"{reason}"
+    )
+    user_coordinates, candidates = _get_candidates(
+        event_id,
+        users,
+        place_type,
+        cached_only=True
+    )
+    return _rank_stale_candidates(user_coordinates, candidates,
+                                  suggestions_mode, backend)
+
+
+def _rank_stale_candidates(user_coordinates, candidates, suggestions_mode,
+                           backend):
+    if not len(candidates):
+        return []
+    dist_matrix = None
+    if suggestions_mode != "distance":
+        candidates = places.prune_candidate_set(
+            user_coordinates,
+            candidates,
             suggestions_mode
         )
-    return places.sort_places_by_travel_total(potential_places)
+        if backend.estimated:  # no requests, and no need for stale data
+            dist_matrix = places.get_travel_times(
+                user_coordinates,
+                candidates.places,
+                suggestions_mode,
+                backend
+            )
+        else:
+            dist_matrix = places.get_stale_travel_times(
+                user_coordinates,
+                candidates.places,
+                suggestions_mode
+            )
+    if dist_matrix is None:
+        candidates = candidates.with_distance_totals(user_coordinates)
+    else:
+        candidates = candidates.with_travel_totals(dist_matrix)
+    return candidates.sorted_by_travel_total().to_dicts()
+
+
+def _combine_rankings(results):
+    """
+    Combine per-mode rankings into a single ranking by average rank (ties
+    broken by best rank), over the places that appear in every mode.
+    :param results: dict of mode -> list of places in order
+    :return: list of places with ranks and travel_totals per mode
+    """
+    ranks = {}
+    for mode, ranking in results.items():
+        for rank, place in enumerate(ranking, 1):
+            ranks.setdefault(place["gm_id"], {})[mode] = (
+                rank,
+                place["travel_total"]
+            )
+    combined = []
+    for ranking in results.values():
+        for place in ranking:
+            by_mode = ranks.pop(place["gm_id"], None)
+            if not by_mode or len(by_mode) < len(results):
+                continue
+            place = {key: value for key, value in place.items()
+                     if key != "travel_total"}
+            place["ranks"] = {mode: rank
+                              for mode, (rank, _) in by_mode.items()}
+            place["travel_totals"] = {mode: total
+                                      for mode, (_, total) in by_mode.items()}
+            combined.append(place)
+    return sorted(
+        combined,
+        key=lambda x: (sum(x["ranks"].values()) / len(x["ranks"]),
+                       min(x["ranks"].values()))
+    )
+
+
+def _stream_suggestions(event_id, ids, users, cache_key, place_type,
+                        suggestions_mode, backend):
+    degraded = _is_degraded(suggestions_mode, backend)
+    result = suggestion_cache.suggestion_cache.get(cache_key)
+    if result is not None:
+        yield "result", {"data": result, "cached": True,
+                         "degraded": degraded, "stale": False}
+        return
+    try:
+        result = yield from _stream_ranking(event_id, users, place_type,
+                                            suggestions_mode, backend)
+    except exceptions.CircuitOpenError as e:
+        yield "result", {"data": _get_stale_suggestions(
+            event_id, users, place_type, suggestions_mode, backend, str(e)
+        ), "cached": False, "degraded": degraded, "stale": True}
+        return
+    suggestion_cache.suggestion_cache.put(cache_key, ids, result)
+    yield "result", {"data": result, "cached": False,
+                     "degraded": degraded, "stale": False}
+
+
+def _stream_ranking(event_id, users, place_type, suggestions_mode, backend):
+    """
+    Yield the intermediate results of stream_suggestions.
+    :return: the final list of places
+    """
+    user_coordinates, candidates = _get_candidates(
+        event_id,
+        users,
+        place_type
+    )
+    if not len(candidates):
+        return []
+    ranking = candidates.with_distance_totals(
+        user_coordinates
+    ).sorted_by_travel_total().to_dicts()
+    yield "ranking", {"data": ranking}
+    if suggestions_mode == "distance":
+        return ranking
+    candidates = places.prune_candidate_set(
+        user_coordinates,
+        candidates,
+        suggestions_mode
+    )
+    dist_matrix = [[None] * len(candidates) for _ in user_coordinates]
+    for updates in places.iter_travel_times(
+            user_coordinates, candidates.places, suggestions_mode, backend):
+        if not updates:
+            continue
+        for row_idx, col_idx, duration in updates:
+            dist_matrix[row_idx][col_idx] = duration
+        yield "travel_times", {"data": places.estimate_travel_totals(
+            candidates.places,
+            dist_matrix,
+            sorted({col_idx for _, col_idx, _ in updates})
+        )}
+    return candidates.with_travel_totals(
+        dist_matrix
+    ).sorted_by_travel_total().to_dicts()
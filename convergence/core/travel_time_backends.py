@@ -0,0 +1,118 @@
+"""
+Sources of travel times for suggestions.
+
+The "google" backend asks the Google Distance Matrix API, through the
+travel time cache (see travel_times). The "estimate" backend needs no
+network: it estimates travel times from the distance as-the-crow-flies, a
+mode-specific detour factor and a speed that grows with distance (short
+trips spend relatively more time at lights, stops and junctions), for the
+whole matrix at once. It is used for every request when TRAVEL_TIME_BACKEND
+is "estimate", and for single requests in degraded mode.
+"""
+import numpy as np
+
+from convergence import app
+from convergence.core import calibration
+from convergence.core import travel_times
+from convergence.utils import geo
+from convergence.utils import exceptions
+
+ESTIMATES = app.config["TRAVEL_TIME_ESTIMATES"]
+
+
+class TravelTimeBackend:
+    """Interface of travel time backends"""
+    name = None
+    estimated = False  # True if travel times are estimates
+
+    def get_distance_matrix(self, origins, places, mode):
+        """
+        Return travel times between origins and places.
+        :param origins: list of origin Points
+        :param places: list of places (each with gm_id, lat and long)
+        :param mode: mode of transportation
+        :return: distance matrix of dimension len(origins) * len(places),
+                 in seconds
+        """
+        raise NotImplementedError
+
+    def iter_distance_matrix(self, origins, places, mode):
+        """
+        Return travel times like get_distance_matrix, but incrementally.
+        :param origins: list of origin Points
+        :param places: list of places (each with gm_id, lat and long)
+        :param mode: mode of transportation
+        :return: generator of lists of (origin index, place index, duration)
+        """
+        dist_matrix = self.get_distance_matrix(origins, places, mode)
+        yield [
+            (row_idx, col_idx, duration)
+            for row_idx, row in enumerate(dist_matrix)
+            for col_idx, duration in enumerate(row)
+        ]
+
+
+class GoogleBackend(TravelTimeBackend):
+    """Travel times from the Google Distance Matrix API, cached"""
+    name = "google"
+
+    def get_distance_matrix(self, origins, places, mode):
+        return travel_times.get_distance_matrix(origins, places, mode)
+
+    def iter_distance_matrix(self, origins, places, mode):
+        return travel_times.iter_distance_matrix(origins, places, mode)
+
+
+class EstimateBackend(TravelTimeBackend):
+    """
+    Travel times estimated locally from distance as-the-crow-flies, or
+    predicted by the calibrated model where there is one
+    """
+    name = "estimate"
+    estimated = True
+
+    def __init__(self, estimates=ESTIMATES):
+        """
+        :param estimates: dict of mode -> dict with overhead, detour,
+                          near_speed, far_speed and half_speed_distance
+                          (see TRAVEL_TIME_ESTIMATES in config.py)
+        """
+        self.estimates = estimates
+
+    def get_distance_matrix(self, origins, places, mode):
+        if mode not in self.estimates:
+            raise exceptions.InvalidRequestError(
+                "Invalid mode of transportation."
+            )
+        if not origins or not places:
+            return [[] for _ in origins]
+        model = self.estimates[mode]
+        distances = geo.distance_matrix(
+            origins,
+            [(place["lat"], place["long"]) for place in places]
+        )
+        speeds = model["near_speed"] \
+            + (model["far_speed"] - model["near_speed"]) \
+            * distances / (distances + model["half_speed_distance"])
+        durations = model["overhead"] \
+            + model["detour"] * distances / speeds
+        prediction = calibration.predict(origins, distances, mode)
+        if prediction is not None:  # calibrated where there is a model
+            durations = np.where(np.isnan(prediction[0]), durations,
+                                 prediction[0])
+        return np.rint(durations).astype(int).tolist()
+
+
+backends = {
+    backend.name: backend for backend in [GoogleBackend(), EstimateBackend()]
+}
+default_backend = backends[app.config["TRAVEL_TIME_BACKEND"]]
+
+
+def get_backend(degraded=False):
+    """
+    Return backend to use for a request.
+    :param degraded: True to estimate travel times without network access
+    :return: TravelTimeBackend
+    """
+    return backends["estimate"] if degraded else default_backend
@@ -0,0 +1,291 @@
+import sys
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from convergence import app
+from convergence.apis import google_maps
+from convergence.core import calibration
+from convergence.data.repo import TravelTimeStore
+from convergence.utils import logger
+from convergence.utils.point import Point
+
+CELL_SIZE = app.config["TRAVEL_TIME_CACHE_CELL_SIZE"]
+CACHE_TTL = timedelta(seconds=app.config["TRAVEL_TIME_CACHE_TTL"])
+MAX_CACHE_ENTRIES = app.config["TRAVEL_TIME_CACHE_MAX_ENTRIES"]
+EVICT_INTERVAL = app.config["TRAVEL_TIME_CACHE_EVICT_INTERVAL"]
+
+travel_time_store = TravelTimeStore()
+cache_stats = {}  # mode -> {"hits": int, "misses": int}
+# eviction deletes and counts over the whole table, off the request path
+evict_executor = ThreadPoolExecutor(max_workers=1,
+                                    thread_name_prefix="travel-time-evict")
+last_evicted = None
+evict_lock = threading.Lock()
+
+
+def get_distance_matrix(origins, places, mode):
+    """
+    Return travel times between origins and places, using cached values
+    where possible and requesting only the missing ones from Google.
+
+    Origins are snapped to a grid of CELL_SIZE degrees, so that members who
+    have not moved (or have moved only slightly) reuse earlier results.
+    Travel times that the calibrated model predicts confidently are not
+    requested either (see calibration.predict_confident).
+    :param origins: list of origin Points
+    :param places: list of places (each with gm_id, lat and long)
+    :param mode: mode of transportation
+    :return: distance matrix of dimension len(origins) * len(places)
+    """
+    now = datetime.utcnow()
+    dist_matrix = [[None] * len(places) for _ in range(len(origins))]
+    cells, hits, missing_cells, missing_places = _lookup(
+        origins, places, mode, now
+    )
+    for row_idx, col_idx, duration in hits:
+        dist_matrix[row_idx][col_idx] = duration
+    if not missing_cells:
+        return dist_matrix
+
+    # request only the rows and columns with missing values
+    fresh_cells = list(missing_cells)
+    fresh_cols = list(missing_places.values())
+    fresh_origins = [missing_cells[cell] for cell in fresh_cells]
+    fresh_destinations = [Point(places[col_idx]["lat"],
+                                places[col_idx]["long"])
+                          for col_idx in fresh_cols]
+    fresh_matrix = google_maps.get_distance_matrix(
+        fresh_origins,
+        fresh_destinations,
+        mode
+    )
+    calibration.record_samples(fresh_origins, fresh_destinations,
+                               fresh_matrix, mode)
+    fresh = {}
+    for cell, row in zip(fresh_cells, fresh_matrix):
+        for col_idx, duration in zip(fresh_cols, row):
+            fresh[(cell, places[col_idx]["gm_id"])] = duration
+    for row_idx, col_idx, duration in _expand(cells, places, fresh):
+        dist_matrix[row_idx][col_idx] = duration
+    _store(fresh, mode, now)
+    return dist_matrix
+
+
+def iter_distance_matrix(origins, places, mode):
+    """
+    Return travel times between origins and places like get_distance_matrix,
+    but incrementally: cached values first, then the values of each
+    Distance Matrix tile as soon as it is returned.
+    :param origins: list of origin Points
+    :param places: list of places (each with gm_id, lat and long)
+    :param mode: mode of transportation
+    :return: generator of lists of (origin index, place index, duration)
+    """
+    now = datetime.utcnow()
+    cells, hits, missing_cells, missing_places = _lookup(
+        origins, places, mode, now
+    )
+    yield hits
+    if not missing_cells:
+        return
+
+    fresh_cells = list(missing_cells)
+    fresh_cols = list(missing_places.values())
+    fresh_origins = [missing_cells[cell] for cell in fresh_cells]
+    fresh_destinations = [Point(places[col_idx]["lat"],
+                                places[col_idx]["long"])
+                          for col_idx in fresh_cols]
+    fresh = {}
+    for origin_start, dest_start, durations in \
+            google_maps.iter_distance_matrix(fresh_origins,
+                                             fresh_destinations, mode):
+        calibration.record_samples(
+            fresh_origins[origin_start:origin_start + len(durations)],
+            fresh_destinations[dest_start:dest_start + len(durations[0])],
+            durations,
+            mode
+        )
+        tile = {}
+        for cell, row in zip(fresh_cells[origin_start:], durations):
+            for col_idx, duration in zip(fresh_cols[dest_start:], row):
+                tile[(cell, places[col_idx]["gm_id"])] = duration
+        fresh.update(tile)
+        yield _expand(cells, places, tile)
+    _store(fresh, mode, now)
+
+
+def get_stale_distance_matrix(origins, places, mode):
+    """
+    Return cached travel times between origins and places however long ago
+    they were requested, for when the Distance Matrix API is unavailable.
+    :param origins: list of origin Points
+    :param places: list of places (each with gm_id, lat and long)
+    :param mode: mode of transportation
+    :return: distance matrix of dimension len(origins) * len(places), None
+             where there is no cached travel time
+    """
+    cells = [snap_to_cell(origin) for origin in origins]
+    cached = {
+        (travel_time.origin_cell, travel_time.gm_id): travel_time
+        for travel_time in travel_time_store.get_travel_times(
+            set(cells), {place["gm_id"] for place in places}, mode,
+            datetime.min
+        )
+    }
+    return [
+        [
+            _from_cache(cached[(cell, place["gm_id"])])
+            if (cell, place["gm_id"]) in cached else None
+            for place in places
+        ]
+        for cell in cells
+    ]
+
+
+def evict_travel_times(now=None):
+    """
+    Delete expired travel times, then the least recently used ones until
+    at most MAX_CACHE_ENTRIES are left.
+    :param now: current datetime, default utcnow
+    :return: number of deleted entries
+    """
+    now = now or datetime.utcnow()
+    deleted = travel_time_store.evict_travel_times(now - CACHE_TTL,
+                                                   MAX_CACHE_ENTRIES)
+    logger.log_info(f"Travel time cache: evicted {deleted} entries.")
+    return deleted
+
+
+def get_hit_rates():
+    """
+    Return travel time cache statistics for each mode of transportation.
+    :return: dict of mode -> dict with hits, misses, predicted (travel
+             times predicted by the calibrated model, not requested) and
+             hit_rate
+    """
+    return {
+        mode: dict(stats, hit_rate=stats["hits"] /
+                   max(1, stats["hits"] + stats["misses"]))
+        for mode, stats in cache_stats.items()
+    }
+
+
+def snap_to_cell(point):
+    """
+    Return id of the grid cell containing point.
+    :param point: Point
+    :return: cell id as string
+    """
+    return f"{math.floor(point.lat / CELL_SIZE)}:" \
+           f"{math.floor(point.long / CELL_SIZE)}"
+
+
+def _lookup(origins, places, mode, now):
+    """
+    Look up cached (or confidently predicted) travel times between origins
+    and places.
+    :return: tuple (cell of each origin, list of (origin index, place index,
+             duration) for cached values, dict of missing cells to a
+             representative origin, dict of missing gm_ids to place index)
+    """
+    cells = [snap_to_cell(origin) for origin in origins]
+    gm_ids = [place["gm_id"] for place in places]
+    cached = {
+        (travel_time.origin_cell, travel_time.gm_id): travel_time
+        for travel_time in travel_time_store.get_travel_times(
+            set(cells), set(gm_ids), mode, now - CACHE_TTL
+        )
+    }
+    predicted = calibration.predict_confident(origins, places, mode)
+    hits = []
+    no_predicted = 0
+    missing_cells, missing_places = {}, {}
+    for row_idx, cell in enumerate(cells):
+        for col_idx, gm_id in enumerate(gm_ids):
+            travel_time = cached.get((cell, gm_id))
+            if travel_time:
+                hits.append((row_idx, col_idx, _from_cache(travel_time)))
+            elif predicted and predicted[row_idx][col_idx] is not None:
+                hits.append((row_idx, col_idx, predicted[row_idx][col_idx]))
+                no_predicted += 1
+            else:
+                missing_cells.setdefault(cell, origins[row_idx])
+                missing_places.setdefault(gm_id, col_idx)
+    _record_stats(mode, len(hits) - no_predicted,
+                  len(origins) * len(places) - len(hits), no_predicted)
+    travel_time_store.touch_travel_times(cached.values(), now)
+    return cells, hits, missing_cells, missing_places
+
+
+def _expand(cells, places, fresh):
+    """
+    Map fresh travel times per (cell, gm_id) onto every origin in that cell.
+    :return: list of (origin index, place index, duration)
+    """
+    return [
+        (row_idx, col_idx, fresh[(cell, place["gm_id"])])
+        for row_idx, cell in enumerate(cells)
+        for col_idx, place in enumerate(places)
+        if (cell, place["gm_id"]) in fresh
+    ]
+
+
+def _store(fresh, mode, now):
+    """
+    Add fresh travel times per (cell, gm_id) to the cache, and schedule
+    eviction if it has not run for EVICT_INTERVAL.
+    """
+    travel_time_store.add_travel_times([
+        {
+            "origin_cell": cell,
+            "gm_id": gm_id,
+            "mode": mode,
+            "duration": _to_cache(duration),
+            "timestamp": now,
+            "last_used": now
+        }
+        for (cell, gm_id), duration in fresh.items()
+        if duration is not None
+    ])
+    _schedule_eviction()
+
+
+def _schedule_eviction():
+    global last_evicted
+    if not EVICT_INTERVAL:
+        return None
+    with evict_lock:
+        if last_evicted is not None \
+                and time.monotonic() - last_evicted < EVICT_INTERVAL:
+            return None
+        last_evicted = time.monotonic()
+    evict_executor.submit(evict_travel_times)
+    return None
+
+
+def _record_stats(mode, hits, misses, predicted=0):
+    stats = cache_stats.setdefault(mode, {"hits": 0, "misses": 0,
+                                          "predicted": 0})
+    stats["hits"] += hits
+    stats["misses"] += misses
+    stats["predicted"] += predicted
+    rate = get_hit_rates()[mode]["hit_rate"]
+    logger.log_info(
+        f"Travel time cache ({mode}): {hits} hits, {misses} misses, "
+        f"{predicted} predicted, hit rate {rate:.1%}"
+    )
+
+
+def _from_cache(travel_time):
+    if travel_time.duration is None:
+        return sys.maxsize
+    return travel_time.duration
+
+
+def _to_cache(duration):
+    if duration == sys.maxsize:
+        return None
+    return duration
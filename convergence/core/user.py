@@ -1,6 +1,7 @@
 from convergence.utils import logger
 
 from convergence.core import location
+from convergence.core.suggestion_cache import suggestion_cache
 from convergence.utils import exceptions
 from convergence.utils import validators
 from convergence.data.models import User
@@ -63,6 +64,7 @@ def delete_user(user_id):
     if not user:
         raise exceptions.NotFoundError("Invalid user id.")
     user_store.delete_user(user)
+    suggestion_cache.invalidate_user(user_id)
     return None
 
 
@@ -92,6 +94,8 @@ def update_location(user_id, lat, long):
     user = user_store.get_user_by_id(user_id)
     if not user:
         raise exceptions.NotFoundError("Invalid user id.")
+    old_location = user.get_location()
     user.latitude, user.longitude = lat, long
-    user_store.commit_changes()
+    user_store.update_location(user, old_location)
+    suggestion_cache.invalidate_user(user_id)
     return user.get_location()
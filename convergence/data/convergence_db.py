@@ -1,3 +1,5 @@
+import threading
+
 import sqlalchemy
 
 from convergence.utils import logger
@@ -15,6 +17,8 @@ class ConvergenceDB:
         self.base = models.base
         self.metadata = models.base.metadata
         self._SessionMaker = sqlalchemy.orm.sessionmaker(bind=self.engine)
+        self._scoped_sessions = []
+        self._lock = threading.Lock()
 
     def initialise_tables(self):
         """Initialise all tables defined in models.py"""
@@ -24,3 +28,21 @@ class ConvergenceDB:
 
     def create_session(self):
         return self._SessionMaker()
+
+    def create_scoped_session(self):
+        """
+        Create a session that is used like a session, but gives each thread
+        its own (see sqlalchemy.orm.scoped_session), so that it can be used
+        from request threads and worker threads alike.
+        """
+        session = sqlalchemy.orm.scoped_session(self._SessionMaker)
+        with self._lock:
+            self._scoped_sessions.append(session)
+        return session
+
+    def remove_sessions(self):
+        """Close the current thread's sessions of all scoped sessions"""
+        with self._lock:
+            scoped_sessions = list(self._scoped_sessions)
+        for session in scoped_sessions:
+            session.remove()
@@ -1,13 +1,18 @@
 import math
 import sqlalchemy as sa
 
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.hybrid import hybrid_method
 from sqlalchemy.ext import declarative
 from passlib.apps import custom_app_context as pwd_context
 
+from convergence.utils import geo
+
 
 base = declarative.declarative_base()
 
+LOCATION_SUM_COLUMNS = ("x_sum", "y_sum", "z_sum", "location_count")
+
 
 class User(base):
     __tablename__ = "users"
@@ -52,12 +57,39 @@ class Event(base):
                                index=True)
     creation_date = sa.Column(sa.DateTime)
     event_date = sa.Column(sa.DateTime)
+    # sums of the unit vectors of the members' locations (see
+    # geo.unit_vector), maintained by UserEventStore and UserStore
+    x_sum = sa.Column(sa.Float, nullable=False, default=0, server_default="0")
+    y_sum = sa.Column(sa.Float, nullable=False, default=0, server_default="0")
+    z_sum = sa.Column(sa.Float, nullable=False, default=0, server_default="0")
+    location_count = sa.Column(sa.Integer, nullable=False, default=0,
+                               server_default="0")
 
     rel_userinvites = sa.orm.relation("UserInvite", backref="rel_events")
     rel_userevents = sa.orm.relation("UserEvent", backref="rel_events")
 
     def as_dict(self):
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns
+                if c.name not in LOCATION_SUM_COLUMNS}
+
+    @classmethod
+    def location_sums_delta(cls, location, sign):
+        """
+        Return update values that add (sign 1) or remove (sign -1) a member
+        location from the location sums.
+        :param location: (lat, long); members without location are ignored
+        :param sign: 1 or -1
+        :return: dict of column -> expression, or None
+        """
+        if location is None or None in location:
+            return None
+        x, y, z = geo.unit_vector(*location)
+        return {
+            cls.x_sum: cls.x_sum + sign * x,
+            cls.y_sum: cls.y_sum + sign * y,
+            cls.z_sum: cls.z_sum + sign * z,
+            cls.location_count: cls.location_count + sign
+        }
 
 
 class UserInvite(base):
@@ -146,9 +178,13 @@ class Place(base):
     long = sa.Column(sa.Float)
     gm_price = sa.Column(sa.Integer)
     gm_rating = sa.Column(sa.Float)
-    gm_types = sa.Column(sa.ARRAY(sa.String()))
+    gm_types = sa.Column(postgresql.ARRAY(sa.String()))
     address = sa.Column(sa.String(128))
     timestamp = sa.Column(sa.DateTime)
+    __table_args__ = (
+        sa.Index("ix_places_lat_long", "lat", "long"),
+        sa.Index("ix_places_gm_types", "gm_types", postgresql_using="gin"),
+    )
 
     @hybrid_method
     def within_range(self, point, radius):
@@ -178,3 +214,70 @@ class Place(base):
 
     def as_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class PlaceFetch(base):
+    __tablename__ = "place_fetches"
+    id = sa.Column(sa.Integer, primary_key=True)
+    tile = sa.Column(sa.String(32), nullable=False)
+    radius = sa.Column(sa.Integer, nullable=False)
+    place_type = sa.Column(sa.String(64), nullable=False)
+    result_count = sa.Column(sa.Integer)
+    timestamp = sa.Column(sa.DateTime)
+    __table_args__ = (sa.UniqueConstraint("tile", "radius", "place_type"),)
+
+    def as_dict(self):
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class TravelTime(base):
+    __tablename__ = "travel_times"
+    id = sa.Column(sa.Integer, primary_key=True)
+    origin_cell = sa.Column(sa.String(32), nullable=False)
+    gm_id = sa.Column(sa.String(), nullable=False)
+    mode = sa.Column(sa.String(16), nullable=False)
+    duration = sa.Column(sa.Integer)  # seconds, None if no route found
+    timestamp = sa.Column(sa.DateTime, index=True)  # fetched from Google
+    last_used = sa.Column(sa.DateTime, index=True)
+    __table_args__ = (sa.UniqueConstraint("origin_cell", "gm_id", "mode"),)
+
+    def as_dict(self):
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class TravelTimeSample(base):
+    __tablename__ = "travel_time_samples"
+    id = sa.Column(sa.Integer, primary_key=True)
+    mode = sa.Column(sa.String(16), nullable=False)
+    region = sa.Column(sa.String(32), nullable=False)  # cell of the origin
+    distance = sa.Column(sa.Float, nullable=False)  # as-the-crow-flies, m
+    duration = sa.Column(sa.Integer, nullable=False)  # seconds
+    holdout = sa.Column(sa.Boolean, nullable=False, default=False)
+    timestamp = sa.Column(sa.DateTime, index=True)
+
+    def as_dict(self):
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class TravelTimeModel(base):
+    __tablename__ = "travel_time_models"
+    id = sa.Column(sa.Integer, primary_key=True)
+    mode = sa.Column(sa.String(16), nullable=False)
+    region = sa.Column(sa.String(32), nullable=False)  # "*" for all regions
+    # log(duration) = intercept + slope * log(distance), see core/calibration
+    intercept = sa.Column(sa.Float, nullable=False)
+    slope = sa.Column(sa.Float, nullable=False)
+    residual_std = sa.Column(sa.Float, nullable=False)
+    log_distance_mean = sa.Column(sa.Float, nullable=False)
+    log_distance_ss = sa.Column(sa.Float, nullable=False)
+    sample_count = sa.Column(sa.Integer, nullable=False)
+    # errors against held-out samples
+    holdout_count = sa.Column(sa.Integer, nullable=False)
+    mean_abs_error = sa.Column(sa.Float)  # seconds
+    mean_rel_error = sa.Column(sa.Float)
+    interval_coverage = sa.Column(sa.Float)
+    timestamp = sa.Column(sa.DateTime)
+    __table_args__ = (sa.UniqueConstraint("mode", "region"),)
+
+    def as_dict(self):
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
@@ -0,0 +1,198 @@
+"""
+In-memory grid index of cached places.
+
+The places table is read-mostly and small enough to keep in RAM, so each
+worker can load it once and answer radius (and type) queries without a
+database round trip. The index only answers queries while it is warm, i.e.
+while it holds every cached place; callers fall back to the database when
+a query returns None.
+"""
+import math
+import time
+import threading
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from convergence.utils import logger
+from convergence.data.models import Place
+
+CELL_SIZE = 0.05  # degrees, roughly 5.5km of latitude
+DEFAULT_MAX_PLACES = 250000
+DEFAULT_REFRESH_INTERVAL = 60  # seconds
+LOAD_BATCH_SIZE = 5000
+EARTH_RADIUS = 6371000  # metres
+
+COLD, LOADING, WARM = "cold", "loading", "warm"
+
+
+class PlaceIndex:
+    """Grid of places, bucketed by (lat, long) cells of CELL_SIZE degrees"""
+    def __init__(self, max_places=DEFAULT_MAX_PLACES, cell_size=CELL_SIZE):
+        self.max_places = max_places
+        self.cell_size = cell_size
+        self.state = COLD
+        self.hits = 0
+        self.misses = 0
+        self._cells = {}  # (row, col) -> {gm_id: entry}
+        self._cell_by_id = {}  # gm_id -> (row, col)
+        self._last_timestamp = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cell_by_id)
+
+    def stats(self):
+        """
+        Return index state and usage counters
+        :return: dict with state, size, hits and misses
+        """
+        with self._lock:
+            return {"state": self.state, "size": len(self),
+                    "hits": self.hits, "misses": self.misses}
+
+    def add(self, place):
+        """
+        Add or replace a place in the index. Ignored while the index is cold.
+        :param place: place as dict (see Place.as_dict)
+        """
+        with self._lock:
+            if self.state == COLD:
+                return None
+            self._add(place)
+            if len(self) > self.max_places:
+                logger.log_error(
+                    f"Place index exceeds {self.max_places} places, disabled."
+                )
+                self._clear()
+        return None
+
+    def add_many(self, places):
+        """
+        Add or replace multiple places in the index.
+        :param places: sequence of places as dicts
+        """
+        for place in places:
+            self.add(place)
+        return None
+
+    def query(self, point, radius, place_type=None):
+        """
+        Return cached places within radius of point.
+        :param point: centre point, type Point
+        :param radius: radius in metres
+        :param place_type: only return places of this type, if specified
+        :return: list of places as dicts, or None if the index is not warm
+        """
+        min_lat, max_lat, min_long, max_long = point.bounding_box(radius)
+        if min_long <= max_long:
+            col_ranges = [self._col_range(min_long, max_long)]
+        else:  # bounding box crosses the antimeridian
+            col_ranges = [self._col_range(min_long, 180),
+                          self._col_range(-180, max_long)]
+        lat = math.radians(point.lat)
+        long = math.radians(point.long)
+        sin_lat, cos_lat = math.sin(lat), math.cos(lat)
+        max_cos = math.cos(radius / EARTH_RADIUS)
+        rows = range(self._cell(min_lat), self._cell(max_lat) + 1)
+        places = []
+        with self._lock:
+            if self.state != WARM:
+                self.misses += 1
+                return None
+            self.hits += 1
+            cells = [self._cells.get((row, col))
+                     for row in rows for cols in col_ranges for col in cols]
+            for cell in filter(None, cells):
+                for sin_p, cos_p, long_p, types, place in cell.values():
+                    if place_type is not None and place_type not in types:
+                        continue
+                    # spherical law of cosines, as in Place.within_range
+                    cos_dist = sin_lat * sin_p \
+                        + cos_lat * cos_p * math.cos(long - long_p)
+                    if cos_dist > max_cos:
+                        places.append(dict(place))
+        return places
+
+    def start(self, session_factory, max_places=DEFAULT_MAX_PLACES,
+              refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        """
+        Load all places in a background thread, then keep polling the
+        database for places added or updated by other workers.
+        :param session_factory: callable returning a new db session
+        :param max_places: memory cap, index is disabled when exceeded
+        :param refresh_interval: seconds between refreshes
+        """
+        with self._lock:
+            self.max_places = max_places
+            self.state = LOADING
+        thread = threading.Thread(
+            target=self._run,
+            args=(session_factory, refresh_interval),
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def load(self, session):
+        """
+        Load places added since the last load into the index.
+        :param session: db session
+        """
+        query = session.query(Place)
+        if self._last_timestamp is not None:
+            query = query.filter(Place.timestamp >= self._last_timestamp)
+        for place in query.yield_per(LOAD_BATCH_SIZE):
+            if self.state == COLD:
+                return None
+            self.add(place.as_dict())
+            if place.timestamp and (self._last_timestamp is None or
+                                    place.timestamp > self._last_timestamp):
+                self._last_timestamp = place.timestamp
+        session.rollback()  # end read transaction
+        with self._lock:
+            if self.state == LOADING:
+                self.state = WARM
+                logger.log_info(f"Place index loaded: {len(self)} places.")
+        return None
+
+    def _run(self, session_factory, refresh_interval):
+        session = session_factory()
+        while self.state != COLD:
+            try:
+                self.load(session)
+            except SQLAlchemyError as e:
+                logger.log_error(f"Error loading place index: {str(e)}")
+                session.rollback()
+            time.sleep(refresh_interval)
+        session.close()
+
+    def _add(self, place):
+        gm_id = place["gm_id"]
+        old_cell = self._cell_by_id.pop(gm_id, None)
+        if old_cell is not None:
+            del self._cells[old_cell][gm_id]
+        lat = math.radians(place["lat"])
+        cell = (self._cell(place["lat"]), self._cell(place["long"]))
+        self._cells.setdefault(cell, {})[gm_id] = (
+            math.sin(lat),
+            math.cos(lat),
+            math.radians(place["long"]),
+            frozenset(place["gm_types"] or ()),
+            place
+        )
+        self._cell_by_id[gm_id] = cell
+
+    def _clear(self):
+        self.state = COLD
+        self._cells = {}
+        self._cell_by_id = {}
+        self._last_timestamp = None
+
+    def _cell(self, degrees):
+        return math.floor(degrees / self.cell_size)
+
+    def _col_range(self, min_long, max_long):
+        return range(self._cell(min_long), self._cell(max_long) + 1)
+
+
+place_index = PlaceIndex()
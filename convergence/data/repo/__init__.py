@@ -5,3 +5,5 @@ from .userinvite_store import UserInviteStore
 from .userevent_store import UserEventStore
 from .user_store import UserStore
 from .friend_store import FriendStore
+from .travel_time_store import TravelTimeStore
+from .calibration_store import CalibrationStore
@@ -0,0 +1,93 @@
+from sqlalchemy.exc import SQLAlchemyError
+
+from convergence.utils import logger
+from convergence.data.repo import Store
+from convergence.data.models import TravelTimeSample, TravelTimeModel
+
+
+class CalibrationStore(Store):
+
+    def __init__(self, session=None):
+        super().__init__(session)
+
+    def add_samples(self, samples):
+        """
+        Insert travel time samples.
+        :param samples: list of dicts with TravelTimeSample column values
+        """
+        if not samples:
+            return None
+        try:
+            self.session.bulk_insert_mappings(TravelTimeSample, samples)
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.log_error(
+                f"Database Error while adding travel time samples: {str(e)}"
+            )
+            self.session.rollback()
+        return None
+
+    def get_samples(self, sampled_after):
+        """
+        Return travel time samples, in order of mode and region.
+        :param sampled_after: ignore samples taken before this datetime
+        :return: list of (mode, region, distance, duration, holdout)
+        """
+        return self.session.query(TravelTimeSample.mode,
+                                  TravelTimeSample.region,
+                                  TravelTimeSample.distance,
+                                  TravelTimeSample.duration,
+                                  TravelTimeSample.holdout) \
+            .filter(TravelTimeSample.timestamp >= sampled_after) \
+            .order_by(TravelTimeSample.mode, TravelTimeSample.region) \
+            .all()
+
+    def delete_samples(self, sampled_before):
+        """
+        Delete expired travel time samples.
+        :param sampled_before: delete samples taken before this datetime
+        :return: number of deleted samples
+        """
+        try:
+            deleted = self.session.query(TravelTimeSample) \
+                .filter(TravelTimeSample.timestamp < sampled_before) \
+                .delete(synchronize_session=False)
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.log_error(
+                f"Database Error while deleting travel time samples: "
+                f"{str(e)}"
+            )
+            self.session.rollback()
+            return 0
+        return deleted
+
+    def get_models(self):
+        """
+        Return all fitted travel time models.
+        :return: list of TravelTimeModel objects
+        """
+        return self.session.query(TravelTimeModel) \
+                           .order_by(TravelTimeModel.mode,
+                                     TravelTimeModel.region) \
+                           .all()
+
+    def replace_models(self, models):
+        """
+        Replace all travel time models in a single transaction.
+        :param models: list of dicts with TravelTimeModel column values
+        :return: True if the models were replaced
+        """
+        try:
+            self.session.query(TravelTimeModel) \
+                        .delete(synchronize_session=False)
+            self.session.bulk_insert_mappings(TravelTimeModel, models)
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.log_error(
+                f"Database Error while replacing travel time models: "
+                f"{str(e)}"
+            )
+            self.session.rollback()
+            return False
+        return True
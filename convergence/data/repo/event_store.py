@@ -1,10 +1,12 @@
+import sqlalchemy as sa
 from sqlalchemy.exc import SQLAlchemyError
 
 
 from convergence.utils import exceptions
+from convergence.utils import geo
 from convergence.utils import logger
 from convergence.data.repo import Store
-from convergence.data.models import Event
+from convergence.data.models import Event, User, UserEvent
 
 
 class EventStore(Store):
@@ -68,3 +70,75 @@ class EventStore(Store):
             self.session.rollback()
             raise exceptions.ServerError("Error deleting event.")
         return None
+
+    def get_centroid(self, event_id, location_count=None):
+        """
+        Return centroid of the locations of the members of an event, from
+        the event's location sums.
+        :param event_id: event id
+        :param location_count: number of members with a location, if known
+        :return: centroid as (lat, long), or None if no member has a
+                 location or the sums do not cover location_count members
+                 (e.g. events created before the sums were added)
+        """
+        sums = self.session.query(Event.x_sum, Event.y_sum, Event.z_sum,
+                                  Event.location_count) \
+                           .filter(Event.id == event_id) \
+                           .first()
+        if not sums or not sums.location_count:
+            return None
+        if location_count is not None \
+                and sums.location_count != location_count:
+            return None
+        return geo.centroid_from_sums(*sums)
+
+    def check_location_sums(self, fix=False, tolerance=1e-6):
+        """
+        Recompute the location sums of all events from their members and
+        compare them with the stored sums.
+        :param fix: overwrite the stored sums that differ
+        :param tolerance: maximum difference for each vector component
+        :return: list of (event id, stored sums, recomputed sums)
+        """
+        lat = sa.func.radians(User.latitude)
+        long = sa.func.radians(User.longitude)
+        recomputed = {
+            row.event_id: (row.x_sum, row.y_sum, row.z_sum,
+                           row.location_count)
+            for row in self.session.query(
+                UserEvent.event_id,
+                sa.func.sum(sa.func.cos(lat) * sa.func.cos(long))
+                  .label("x_sum"),
+                sa.func.sum(sa.func.cos(lat) * sa.func.sin(long))
+                  .label("y_sum"),
+                sa.func.sum(sa.func.sin(lat)).label("z_sum"),
+                sa.func.count(User.id).label("location_count")
+            ).join(User, User.id == UserEvent.user_id)
+             .filter(User.latitude.isnot(None), User.longitude.isnot(None))
+             .group_by(UserEvent.event_id)
+        }
+        mismatches = []
+        for event in self.session.query(Event.id, Event.x_sum, Event.y_sum,
+                                        Event.z_sum, Event.location_count):
+            stored = tuple(event[1:])
+            expected = recomputed.get(event.id, (0.0, 0.0, 0.0, 0))
+            if stored[3] != expected[3] or any(
+                    abs(a - b) > tolerance
+                    for a, b in zip(stored[:3], expected[:3])):
+                mismatches.append((event.id, stored, expected))
+        if fix and mismatches:
+            for event_id, _, expected in mismatches:
+                self.session.query(Event) \
+                            .filter(Event.id == event_id) \
+                            .update(dict(zip(
+                                (Event.x_sum, Event.y_sum, Event.z_sum,
+                                 Event.location_count),
+                                expected
+                            )), synchronize_session=False)
+            try:
+                self.session.commit()
+            except SQLAlchemyError as e:
+                logger.log_error(f"Database Error: {str(e)}")
+                self.session.rollback()
+                raise exceptions.ServerError("Error updating events.")
+        return mismatches
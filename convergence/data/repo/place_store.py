@@ -1,9 +1,12 @@
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError
 
 from convergence.utils import exceptions
 from convergence.utils import logger
 from convergence.data.repo import Store
-from convergence.data.models import Place
+from convergence.data.models import Place, PlaceFetch
+from convergence.data.place_index import place_index
 
 
 class PlaceStore(Store):
@@ -11,17 +14,32 @@ class PlaceStore(Store):
     def __init__(self, session=None):
         super().__init__(session)
 
-    def get_places_around_point(self, point, radius):
+    def get_places_around_point(self, point, radius, place_type=None):
         """
         Return a list of places around a specified point,
         within a specified radius.
+
+        Candidates are first narrowed down to the bounding box of the search
+        circle, which can be served by the (lat, long) index, and only those
+        are checked against the exact great-circle distance.
         :param point: Point object
         :param radius: radius in metres
+        :param place_type: only return places of this type, if specified
         :return: list of Place objects
         """
-        return self.session.query(Place) \
-                           .filter(Place.within_range(point, radius)) \
-                           .all()
+        min_lat, max_lat, min_long, max_long = point.bounding_box(radius)
+        if min_long <= max_long:
+            long_filter = Place.long.between(min_long, max_long)
+        else:  # bounding box crosses the antimeridian
+            long_filter = sa.or_(Place.long >= min_long,
+                                 Place.long <= max_long)
+        query = self.session.query(Place) \
+                            .filter(Place.lat.between(min_lat, max_lat),
+                                    long_filter,
+                                    Place.within_range(point, radius))
+        if place_type is not None:  # served by the gm_types GIN index
+            query = query.filter(Place.gm_types.contains([place_type]))
+        return query.all()
 
     def add_place(self, place):
         """
@@ -36,4 +54,99 @@ class PlaceStore(Store):
                 f"Database Error while adding place: {str(e)}"
             )
             self.session.rollback()
+            return None
+        place_index.add(place.as_dict())
+        return None
+
+    def upsert_places(self, places):
+        """
+        Add places to database in a single statement. Places which are
+        already in the database (same gm_id) get their rating, price level,
+        types and timestamp refreshed instead.
+        :param places: list of Place objects
+        :return: tuple (number of places inserted, number of places updated),
+                 or None if the places could not be stored
+        """
+        values = {
+            place.gm_id: {c.name: getattr(place, c.name)
+                          for c in Place.__table__.columns if c.name != "id"}
+            for place in places
+        }  # a statement may only update each row once
+        if not values:
+            return 0, 0
+        statement = insert(Place).values(list(values.values()))
+        statement = statement.on_conflict_do_update(
+            index_elements=["gm_id"],
+            set_={
+                "gm_rating": statement.excluded.gm_rating,
+                "gm_price": statement.excluded.gm_price,
+                "gm_types": statement.excluded.gm_types,
+                "timestamp": statement.excluded.timestamp
+            }
+        ).returning(  # the rows as stored, for the index
+            *Place.__table__.columns,
+            sa.literal_column("xmax = 0").label("inserted")
+        )
+        try:
+            rows = self.session.execute(statement).fetchall()
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.log_error(
+                f"Database Error while adding places: {str(e)}"
+            )
+            self.session.rollback()
+            return None
+        for row in rows:
+            place_index.add({c.name: row[c.name]
+                             for c in Place.__table__.columns})
+        inserted = sum(1 for row in rows if row.inserted)
+        return inserted, len(rows) - inserted
+
+    def get_fetched_tiles(self, tiles, radius, place_type, fetched_after):
+        """
+        Return which of the tiles have been fetched from Google for
+        place_type since fetched_after.
+        :param tiles: tile ids
+        :param radius: tile radius in metres
+        :param place_type: place type
+        :param fetched_after: datetime
+        :return: set of tile ids
+        """
+        return {
+            fetch.tile for fetch in
+            self.session.query(PlaceFetch.tile)
+                        .filter(PlaceFetch.tile.in_(tiles),
+                                PlaceFetch.radius == radius,
+                                PlaceFetch.place_type == place_type,
+                                PlaceFetch.timestamp >= fetched_after)
+        }
+
+    def add_place_fetches(self, place_fetches):
+        """
+        Record fetches of places for tiles, replacing previous records
+        for the same (tile, radius, place type).
+        :param place_fetches: list of PlaceFetch objects
+        """
+        if not place_fetches:
+            return None
+        statement = insert(PlaceFetch).values([
+            {c.name: getattr(place_fetch, c.name)
+             for c in PlaceFetch.__table__.columns if c.name != "id"}
+            for place_fetch in place_fetches
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=["tile", "radius", "place_type"],
+            set_={
+                "result_count": statement.excluded.result_count,
+                "timestamp": statement.excluded.timestamp
+            }
+        )
+        try:
+            self.session.execute(statement)
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.log_error(
+                f"Database Error while adding place fetches: {str(e)}"
+            )
+            self.session.rollback()
         return None
@@ -2,6 +2,7 @@
 Store base class
 """
 from convergence import db
+from convergence.data.models import Event
 
 
 class Store:
@@ -9,7 +10,25 @@ class Store:
     def __init__(self, session):
         """
         Initialise class instance using session (if provided),
-        otherwise create new session.
+        otherwise create a new session, scoped per thread: module-level
+        stores are used from request threads and from worker threads (e.g.
+        suggestions.mode_executor) at the same time.
         :param session: session object or None
         """
-        self.session = session if session else db.create_session()
+        self.session = session if session else db.create_scoped_session()
+
+    def _update_location_sums(self, event_ids, location, sign):
+        """
+        Add (sign 1) or remove (sign -1) a member location from the location
+        sums of events, in the current transaction.
+        :param event_ids: list of event ids
+        :param location: (lat, long) of the member
+        :param sign: 1 or -1
+        """
+        delta = Event.location_sums_delta(location, sign)
+        if not delta or not event_ids:
+            return None
+        self.session.query(Event) \
+                    .filter(Event.id.in_(event_ids)) \
+                    .update(delta, synchronize_session=False)
+        return None
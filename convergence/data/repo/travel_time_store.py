@@ -0,0 +1,109 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from convergence.utils import logger
+from convergence.data.repo import Store
+from convergence.data.models import TravelTime
+
+
+class TravelTimeStore(Store):
+
+    def __init__(self, session=None):
+        super().__init__(session)
+
+    def get_travel_times(self, origin_cells, gm_ids, mode, fetched_after):
+        """
+        Return cached travel times between origin cells and places.
+        :param origin_cells: origin cell ids
+        :param gm_ids: Google ids of destination places
+        :param mode: mode of transportation
+        :param fetched_after: ignore entries fetched before this datetime
+        :return: list of TravelTime objects
+        """
+        return self.session.query(TravelTime) \
+                           .filter(TravelTime.origin_cell.in_(origin_cells),
+                                   TravelTime.gm_id.in_(gm_ids),
+                                   TravelTime.mode == mode,
+                                   TravelTime.timestamp >= fetched_after) \
+                           .all()
+
+    def touch_travel_times(self, travel_times, last_used):
+        """
+        Mark cached travel times as used, for LRU eviction.
+        :param travel_times: TravelTime objects
+        :param last_used: datetime of use
+        """
+        ids = [travel_time.id for travel_time in travel_times]
+        if not ids:
+            return None
+        try:
+            self.session.query(TravelTime) \
+                        .filter(TravelTime.id.in_(ids)) \
+                        .update({TravelTime.last_used: last_used},
+                                synchronize_session=False)
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.log_error(
+                f"Database Error while updating travel times: {str(e)}"
+            )
+            self.session.rollback()
+        return None
+
+    def add_travel_times(self, travel_times):
+        """
+        Insert travel times, replacing existing entries for the same
+        (origin cell, place, mode).
+        :param travel_times: list of dicts with TravelTime column values
+        """
+        if not travel_times:
+            return None
+        statement = insert(TravelTime).values(travel_times)
+        statement = statement.on_conflict_do_update(
+            index_elements=["origin_cell", "gm_id", "mode"],
+            set_={
+                "duration": statement.excluded.duration,
+                "timestamp": statement.excluded.timestamp,
+                "last_used": statement.excluded.last_used
+            }
+        )
+        try:
+            self.session.execute(statement)
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.log_error(
+                f"Database Error while adding travel times: {str(e)}"
+            )
+            self.session.rollback()
+        return None
+
+    def evict_travel_times(self, fetched_before, max_entries):
+        """
+        Delete expired travel times, then the least recently used ones
+        until at most max_entries are left.
+        :param fetched_before: delete entries fetched before this datetime
+        :param max_entries: maximum number of entries to keep
+        :return: number of deleted entries
+        """
+        try:
+            deleted = self.session.query(TravelTime) \
+                .filter(TravelTime.timestamp < fetched_before) \
+                .delete(synchronize_session=False)
+            excess = self.session.query(func.count(TravelTime.id)).scalar() \
+                - max_entries
+            if excess > 0:
+                lru = self.session.query(TravelTime.id) \
+                                  .order_by(TravelTime.last_used) \
+                                  .limit(excess) \
+                                  .subquery()
+                deleted += self.session.query(TravelTime) \
+                                       .filter(TravelTime.id.in_(lru)) \
+                                       .delete(synchronize_session=False)
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.log_error(
+                f"Database Error while evicting travel times: {str(e)}"
+            )
+            self.session.rollback()
+            return 0
+        return deleted
@@ -3,7 +3,7 @@ from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from convergence.utils import exceptions
 from convergence.utils import logger
 from convergence.data.repo import Store
-from convergence.data.models import User
+from convergence.data.models import User, UserEvent
 
 
 class UserStore(Store):
@@ -66,8 +66,13 @@ class UserStore(Store):
         Delete user from database
         :param user: User object
         """
-        self.session.delete(user)
         try:
+            self._update_location_sums(
+                self._get_event_ids(user.id),
+                user.get_location(),
+                -1
+            )
+            self.session.delete(user)
             self.session.commit()
         except SQLAlchemyError as e:
             self.session.rollback()
@@ -75,6 +80,24 @@ class UserStore(Store):
             raise exceptions.ServerError("Error deleting user")
         return None
 
+    def update_location(self, user, old_location):
+        """
+        Commit a change of user location, moving the user's location in the
+        location sums of their events in the same transaction.
+        :param user: User object with updated latitude and longitude
+        :param old_location: (lat, long) before the change
+        """
+        try:
+            event_ids = self._get_event_ids(user.id)
+            self._update_location_sums(event_ids, old_location, -1)
+            self._update_location_sums(event_ids, user.get_location(), 1)
+            self.session.commit()
+        except SQLAlchemyError as e:
+            logger.log_error(f"Database Error: {str(e)}")
+            self.session.rollback()
+            raise exceptions.ServerError("Error updating user info")
+        return None
+
     def commit_changes(self):
         """Commit changes in session object to database"""
         try:
@@ -82,3 +105,9 @@ class UserStore(Store):
         except SQLAlchemyError as e:
             logger.log_error(f"Database Error: {str(e)}")
             raise exceptions.ServerError("Error updating user info")
+
+    def _get_event_ids(self, user_id):
+        return [
+            userevent.event_id for userevent in
+            self.session.query(UserEvent.event_id).filter_by(user_id=user_id)
+        ]
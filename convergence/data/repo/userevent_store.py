@@ -1,4 +1,5 @@
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import aliased
 
 from convergence.utils import exceptions
 from convergence.utils import logger
@@ -35,6 +36,29 @@ class UserEventStore(Store):
                            .filter(UserEvent.event_id == event_id) \
                            .all()
 
+    def get_member_locations(self, request_id, event_id):
+        """
+        Return ids and locations of all members of an event, in a single
+        query which also checks that request_id is a member.
+        :param request_id: user id of requesting user
+        :param event_id: event id
+        :return: list of (user_id, latitude, longitude) rows, empty if
+                 request_id is not a member of the event
+        """
+        requester = aliased(UserEvent)
+        return self.session.query(UserEvent.user_id,
+                                  User.latitude,
+                                  User.longitude) \
+                           .join(User, User.id == UserEvent.user_id) \
+                           .filter(UserEvent.event_id == event_id) \
+                           .filter(
+                               self.session.query(requester)
+                                   .filter(requester.user_id == request_id,
+                                           requester.event_id == event_id)
+                                   .exists()
+                           ) \
+                           .all()
+
     def get_userevent(self, user_id, event_id):
         """
         Return UserEvent by (user id, event id)
@@ -51,8 +75,13 @@ class UserEventStore(Store):
         Add UserEvent to database
         :param userevent: UserEvent object
         """
-        self.session.add(userevent)
         try:
+            self.session.add(userevent)
+            self._update_location_sums(
+                [userevent.event_id],
+                self._get_location(userevent.user_id),
+                1
+            )
             self.session.commit()
         except SQLAlchemyError as e:
             logger.log_error(f"Database Error: {str(e)}")
@@ -71,6 +100,11 @@ class UserEventStore(Store):
         )
         try:
             self.session.add(userevent)
+            self._update_location_sums(
+                [userevent.event_id],
+                self._get_location(userevent.user_id),
+                1
+            )
             local_object = self.session.merge(userinvite)  # merge into session
             self.session.delete(local_object)
             self.session.commit()
@@ -85,11 +119,21 @@ class UserEventStore(Store):
         Delete UserEvent from database
         :param userevent: UserEvent object
         """
-        self.session.delete(userevent)
         try:
+            self.session.delete(userevent)
+            self._update_location_sums(
+                [userevent.event_id],
+                self._get_location(userevent.user_id),
+                -1
+            )
             self.session.commit()
         except SQLAlchemyError as e:
             logger.log_error(f"Database Error: {str(e)}")
             self.session.rollback()
             raise exceptions.ServerError("Error removing user from event")
         return None
+
+    def _get_location(self, user_id):
+        return self.session.query(User.latitude, User.longitude) \
+                           .filter(User.id == user_id) \
+                           .first()
@@ -1,10 +1,33 @@
 import flask_jwt_extended
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, json, jsonify, request, \
+    stream_with_context
 
 from convergence.core import suggestions
+from convergence.core import suggestion_jobs
+from convergence.utils import logger
+from convergence.utils import exceptions
 
 suggestions_bp = Blueprint("suggestions", __name__)
 
+# URL name -> suggestions mode
+SUGGESTION_MODES = {
+    "distance": "distance",
+    "transit": "transit",
+    "drive": "driving",
+    "walk": "walking",
+    "cycle": "bicycling"
+}
+
+
+def _is_degraded():
+    """
+    ?degraded=true estimates travel times locally instead of requesting them
+    (see core/travel_time_backends.py), e.g. when Google Maps is slow or out
+    of quota. Responses say whether travel times are estimates in
+    "degraded".
+    """
+    return request.args.get("degraded", "").lower() in ("1", "true", "yes")
+
 
 @suggestions_bp.route(
     "/events/<int:event_id>/<string:place_type>/distance",
@@ -20,13 +43,14 @@ def suggestions_distance(event_id, place_type):
     :return: list of Places ordered by avg distance
     """
     request_id = flask_jwt_extended.get_jwt_identity()
-    result = suggestions.get_suggestions(
+    result, meta = suggestions.get_suggestions(
         request_id,
         event_id,
         place_type,
-        "distance"
+        "distance",
+        _is_degraded()
     )
-    return jsonify({"data": result}), 200
+    return jsonify({"data": result, **meta}), 200
 
 
 @suggestions_bp.route(
@@ -43,13 +67,14 @@ def suggestions_transit(event_id, place_type):
     :return: list of Places ordered by avg transit time
     """
     request_id = flask_jwt_extended.get_jwt_identity()
-    result = suggestions.get_suggestions(
+    result, meta = suggestions.get_suggestions(
         request_id,
         event_id,
         place_type,
-        "transit"
+        "transit",
+        _is_degraded()
     )
-    return jsonify({"data": result}), 200
+    return jsonify({"data": result, **meta}), 200
 
 
 @suggestions_bp.route(
@@ -66,13 +91,14 @@ def suggestions_driving(event_id, place_type):
     :return: list of Places ordered by avg driving time
     """
     request_id = flask_jwt_extended.get_jwt_identity()
-    result = suggestions.get_suggestions(
+    result, meta = suggestions.get_suggestions(
         request_id,
         event_id,
         place_type,
-        "driving"
+        "driving",
+        _is_degraded()
     )
-    return jsonify({"data": result}), 200
+    return jsonify({"data": result, **meta}), 200
 
 
 @suggestions_bp.route(
@@ -89,13 +115,14 @@ def suggestions_walking(event_id, place_type):
     :return: list of Places ordered by avg walking time
     """
     request_id = flask_jwt_extended.get_jwt_identity()
-    result = suggestions.get_suggestions(
+    result, meta = suggestions.get_suggestions(
         request_id,
         event_id,
         place_type,
-        "walking"
+        "walking",
+        _is_degraded()
     )
-    return jsonify({"data": result}), 200
+    return jsonify({"data": result, **meta}), 200
 
 
 @suggestions_bp.route(
@@ -112,10 +139,124 @@ def suggestions_bicycling(event_id, place_type):
     :return: list of Places ordered by avg cycling time
     """
     request_id = flask_jwt_extended.get_jwt_identity()
-    result = suggestions.get_suggestions(
+    result, meta = suggestions.get_suggestions(
+        request_id,
+        event_id,
+        place_type,
+        "bicycling",
+        _is_degraded()
+    )
+    return jsonify({"data": result, **meta}), 200
+
+
+@suggestions_bp.route(
+    "/events/<int:event_id>/<string:place_type>/<string:mode>/jobs",
+    methods=["POST"]
+)
+@flask_jwt_extended.jwt_required
+def suggestions_job_submit(event_id, place_type, mode):
+    """
+    Queue computation of meeting place suggestions in the background.
+    Submitting the same event, place type and mode while a job is running
+    returns that job.
+    :param event_id: event to request suggestions for
+    :param place_type: type of place
+    :param mode: distance, transit, drive, walk or cycle
+    :return: job info, poll /suggestions/jobs/<job_id> for the result
+    """
+    request_id = flask_jwt_extended.get_jwt_identity()
+    if mode not in SUGGESTION_MODES:
+        raise exceptions.InvalidRequestError("Invalid suggestions mode.")
+    job = suggestion_jobs.submit_job(
+        request_id,
+        event_id,
+        place_type,
+        SUGGESTION_MODES[mode]
+    )
+    return jsonify({"data": job}), 202
+
+
+@suggestions_bp.route("/suggestions/jobs/<string:job_id>", methods=["GET"])
+@flask_jwt_extended.jwt_required
+def suggestions_job_status(job_id):
+    """
+    Get status of a suggestions job, including its result once done.
+    :param job_id: job id as returned on submission
+    :return: job info
+    """
+    request_id = flask_jwt_extended.get_jwt_identity()
+    job = suggestion_jobs.get_job(request_id, job_id)
+    return jsonify({"data": job}), 200
+
+
+@suggestions_bp.route(
+    "/events/<int:event_id>/<string:place_type>/<string:mode>/stream",
+    methods=["GET"]
+)
+@flask_jwt_extended.jwt_required
+def suggestions_stream(event_id, place_type, mode):
+    """
+    Stream meeting place suggestions as server-sent events: "ranking" (by
+    distance as-the-crow-flies) first, then "travel_times" with estimated
+    totals as travel times come in, and finally "result". On failure an
+    "error" event is sent instead of "result".
+    :param event_id: event to request suggestions for
+    :param place_type: type of place
+    :param mode: distance, transit, drive, walk or cycle
+    :return: text/event-stream response
+    """
+    request_id = flask_jwt_extended.get_jwt_identity()
+    if mode not in SUGGESTION_MODES:
+        raise exceptions.InvalidRequestError("Invalid suggestions mode.")
+    stream = suggestions.stream_suggestions(
+        request_id,
+        event_id,
+        place_type,
+        SUGGESTION_MODES[mode],
+        _is_degraded()
+    )
+
+    def generate():
+        try:
+            for event, data in stream:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            logger.log_error(f"Suggestions stream failed: {str(e)}")
+            if not hasattr(e, "message"):
+                e = exceptions.ServerError("Unable to compute suggestions.")
+            error = {"error": {"type": type(e).__name__,
+                               "message": e.message}}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@suggestions_bp.route(
+    "/events/<int:event_id>/<string:place_type>/compare",
+    methods=["GET"]
+)
+@flask_jwt_extended.jwt_required
+def suggestions_compare(event_id, place_type):
+    """
+    Get meeting place suggestions for several modes at once, e.g.
+    ?modes=walk,transit,cycle (default: all modes).
+    :param event_id: event to request suggestions for
+    :param place_type: type of place
+    :return: places ordered for each mode, and combined by average rank
+    """
+    request_id = flask_jwt_extended.get_jwt_identity()
+    modes = request.args.get("modes", ",".join(SUGGESTION_MODES)).split(",")
+    if not all(mode in SUGGESTION_MODES for mode in modes):
+        raise exceptions.InvalidRequestError("Invalid suggestions mode.")
+    result, meta = suggestions.compare_suggestions(
         request_id,
         event_id,
         place_type,
-        "bicycling"
+        list(dict.fromkeys(SUGGESTION_MODES[mode] for mode in modes)),
+        _is_degraded()
     )
-    return jsonify({"data": result}), 200
+    return jsonify({"data": result, **meta}), 200
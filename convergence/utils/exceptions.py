@@ -68,3 +68,9 @@ class DatabaseError(Exception):
 
     def __str__(self):
         return str(self.message)
+
+
+class CircuitOpenError(ServerError):
+    """Upstream API is failing, requests are not sent until it recovers"""
+    def __init__(self, message):
+        super().__init__(message)
@@ -0,0 +1,73 @@
+"""
+Vectorised great-circle calculations on arrays of coordinates.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS = 6371000  # metres
+
+
+def to_array(points):
+    """
+    Convert coordinates to an array of shape (n, 2).
+    :param points: sequence of Points or (lat, long) pairs
+    :return: numpy array of [lat, long] rows, in degrees
+    """
+    return np.array(
+        [(p.lat, p.long) if hasattr(p, "lat") else p for p in points],
+        dtype=float
+    ).reshape(-1, 2)
+
+
+def distance_matrix(origins, destinations):
+    """
+    Calculate the great-circle distance between every origin and every
+    destination using the haversine formula, which, unlike the spherical law
+    of cosines, stays accurate for very short and near-antipodal distances.
+    :param origins: sequence of Points or (lat, long) pairs, length n
+    :param destinations: sequence of Points or (lat, long) pairs, length m
+    :return: numpy array of shape (n, m), distances in metres
+    """
+    origins = np.radians(to_array(origins))
+    destinations = np.radians(to_array(destinations))
+    lat_a = origins[:, 0, np.newaxis]
+    lat_b = destinations[np.newaxis, :, 0]
+    d_lat = lat_b - lat_a
+    d_long = destinations[np.newaxis, :, 1] - origins[:, 1, np.newaxis]
+    a = np.sin(d_lat / 2) ** 2 \
+        + np.cos(lat_a) * np.cos(lat_b) * np.sin(d_long / 2) ** 2
+    a = np.clip(a, 0.0, 1.0)
+    return 2 * EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def unit_vector(lat, long):
+    """
+    Convert coordinates to a 3-D unit vector. The centroid of a set of
+    coordinates is the direction of the sum of their unit vectors, so it can
+    be maintained incrementally by adding and subtracting vectors.
+    :param lat: latitude in degrees
+    :param long: longitude in degrees
+    :return: tuple (x, y, z)
+    """
+    lat = math.radians(float(lat))
+    long = math.radians(float(long))
+    return (
+        math.cos(lat) * math.cos(long),
+        math.cos(lat) * math.sin(long),
+        math.sin(lat)
+    )
+
+
+def centroid_from_sums(x_total, y_total, z_total, count):
+    """
+    Find centroid from the sums of the unit vectors of count coordinates.
+    :return: tuple (lat, long) in degrees
+    """
+    x = float(x_total / count)
+    y = float(y_total / count)
+    z = float(z_total / count)
+    return (
+        math.degrees(math.atan2(z, math.sqrt(x * x + y * y))),
+        math.degrees(math.atan2(y, x))
+    )
@@ -2,6 +2,8 @@ import math
 
 from convergence.core import location
 
+EARTH_RADIUS = 6371  # km
+
 
 class Point:
     """ Point class, used for coordinates"""
@@ -31,7 +33,7 @@ class Point:
         self_long = math.radians(self.long)
         other_lat = math.radians(other.lat)
         other_long = math.radians(other.long)
-        R = 6371
+        R = EARTH_RADIUS
         dist = math.acos(
             math.sin(self_lat) * math.sin(other_lat)
             + math.cos(self_lat) * math.cos(other_lat)
@@ -39,3 +41,38 @@ class Point:
         ) * R
 
         return dist * 1000
+
+    def bounding_box(self, radius):
+        """
+        Return the smallest latitude/longitude box that contains every point
+        within radius of this Point. Used to prefilter spatial queries on
+        indexed coordinates before the exact great-circle check.
+        :param radius: radius in metres
+        :return: tuple (min_lat, max_lat, min_long, max_long) in degrees;
+                 min_long > max_long when the box crosses the antimeridian
+        """
+        angular_radius = radius / (EARTH_RADIUS * 1000)
+        lat = math.radians(self.lat)
+        long = math.radians(self.long)
+        min_lat = lat - angular_radius
+        max_lat = lat + angular_radius
+        if min_lat <= -math.pi / 2 or max_lat >= math.pi / 2:
+            # box contains a pole, so every longitude is in range
+            return (
+                math.degrees(max(min_lat, -math.pi / 2)),
+                math.degrees(min(max_lat, math.pi / 2)),
+                location.MIN_LON,
+                location.MAX_LON
+            )
+        delta_long = math.asin(
+            min(1.0, math.sin(angular_radius) / math.cos(lat))
+        )
+        min_long = math.degrees(long - delta_long)
+        max_long = math.degrees(long + delta_long)
+        if max_long - min_long >= 360:
+            min_long, max_long = location.MIN_LON, location.MAX_LON
+        elif min_long < location.MIN_LON:
+            min_long += 360
+        elif max_long > location.MAX_LON:
+            max_long -= 360
+        return math.degrees(min_lat), math.degrees(max_lat), min_long, max_long
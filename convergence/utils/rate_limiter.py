@@ -0,0 +1,43 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter. Tokens are added at a constant
+    rate, up to capacity; callers block until enough tokens are available.
+    """
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: tokens added per second
+        :param capacity: maximum number of tokens (defaults to rate)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens from the bucket, waiting until they are available.
+        :param tokens: number of tokens to take
+        :return: seconds spent waiting
+        """
+        if tokens > self.capacity:
+            raise ValueError("Cannot acquire more tokens than capacity.")
+        waited = 0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
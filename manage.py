@@ -2,11 +2,58 @@ from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
 from convergence import app, db
+from convergence.core import calibration
+from convergence.core import travel_times
+from convergence.data.repo import EventStore
 
 migrate = Migrate(app, db)
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
 
+
+@manager.option('--fix', dest='fix', action='store_true',
+                help='Overwrite location sums that have drifted')
+def check_location_sums(fix=False):
+    """Recompute event location sums (centroids) from event members"""
+    mismatches = EventStore().check_location_sums(fix=fix)
+    for event_id, stored, expected in mismatches:
+        print(f"Event {event_id}: stored {stored}, recomputed {expected}")
+    print(f"{len(mismatches)} event(s) with drifted location sums" +
+          (", fixed." if fix and mismatches else "."))
+
+
+@manager.command
+def evict_travel_times():
+    """Delete expired and least recently used cached travel times"""
+    deleted = travel_times.evict_travel_times()
+    print(f"Evicted {deleted} travel time(s).")
+
+
+@manager.command
+def fit_travel_time_models():
+    """Fit travel time models on recorded Distance Matrix samples"""
+    models = calibration.fit_models()
+    print(f"Fitted {len(models)} travel time model(s).")
+    travel_time_model_stats()
+
+
+@manager.command
+def travel_time_model_stats():
+    """Show errors of the travel time models against held-out samples"""
+    for stats in calibration.get_error_stats():
+        print(f"{stats['mode']:>10} {stats['region']:>10}: "
+              f"{stats['sample_count']} samples, "
+              f"{stats['holdout_count']} held out, "
+              f"mean error {_format(stats['mean_abs_error'], '.0f')}s "
+              f"({_format(stats['mean_rel_error'], '.1%')}), "
+              f"interval coverage "
+              f"{_format(stats['interval_coverage'], '.1%')}")
+
+
+def _format(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
 if __name__ == '__main__':
     manager.run()
@@ -19,6 +19,7 @@ import faker
 import random
 from convergence.data.convergence_db import ConvergenceDB
 from convergence.data.models import *
+from convergence.data.repo import EventStore
 
 
 def generate_users(n_users=100, password="testing", country_code="GB"):
@@ -114,6 +115,8 @@ print("[+] Generation complete.")
 print("[o] Committing to database.")
 try:
     session.commit()
+    # UserEvents were added directly, so compute event centroids afterwards
+    EventStore(session).check_location_sums(fix=True)
     print("[+] Database write completed. Script finished.")
     print(f"\tSeed used: {seed}. Please note for reproducibility.")
 except:
@@ -0,0 +1,168 @@
+import sys
+import random
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from convergence.core import calibration
+from convergence.core import places
+from convergence.core import travel_times
+from convergence.data.models import TravelTimeModel
+from convergence.utils.point import Point
+
+origin = Point(51.5, -0.1)
+fake_places = [
+    {"gm_id": "a", "lat": 51.51, "long": -0.11},
+    {"gm_id": "b", "lat": 51.6, "long": -0.2},
+]
+
+
+def fake_samples(rng, mode, region, no_samples, noise):
+    """Travel times of 0.2 * distance ^ 0.9 seconds, with noise"""
+    samples = []
+    for _ in range(no_samples):
+        distance = rng.uniform(200, 20000)
+        samples.append((mode, region, distance,
+                        int(0.2 * distance ** 0.9 * rng.uniform(*noise)),
+                        rng.random() < 0.2))
+    return samples
+
+
+def fake_model(mode, region, **params):
+    model = calibration._fit(np.array([1000, 2000, 4000, 8000]),
+                             np.array([500, 900, 1700, 3300]))
+    return TravelTimeModel(mode=mode, region=region,
+                           **dict(model._asdict(), **params))
+
+
+@patch.object(calibration, "ENABLED", True)
+@patch.object(calibration, "calibration_store")
+class TestCalibration(unittest.TestCase):
+
+    def setUp(self):
+        calibration.predictor.reset()
+        self.addCleanup(calibration.predictor.reset)
+
+    def test_fit(self, mock_cs):
+        rng = random.Random(22)
+        samples = fake_samples(rng, "walking", "1:2", 200, (0.97, 1.03))
+        model = calibration._fit(np.array([s[2] for s in samples]),
+                                 np.array([s[3] for s in samples]))
+        self.assertAlmostEqual(model.slope, 0.9, places=1)
+        self.assertAlmostEqual(np.exp(model.intercept), 0.2, places=1)
+        self.assertLess(model.residual_std, 0.05)
+
+    def test_fit_models(self, mock_cs):
+        rng = random.Random(22)
+        mock_cs.get_samples.return_value = \
+            fake_samples(rng, "transit", "1:2", 100, (0.9, 1.1)) \
+            + fake_samples(rng, "transit", "3:4", 20, (0.9, 1.1))
+        mock_cs.replace_models.return_value = True
+        with patch.object(calibration, "MIN_SAMPLES", 50):
+            models = calibration.fit_models()
+        self.assertEqual({(model["mode"], model["region"])
+                          for model in models},
+                         {("transit", "1:2"), ("transit", "*")})
+        mock_cs.delete_samples.assert_called_once()
+        mock_cs.replace_models.assert_called_once_with(models)
+        for model in models:
+            self.assertGreater(model["holdout_count"], 0)
+            self.assertLess(model["mean_rel_error"], 0.1)
+            self.assertGreater(model["interval_coverage"], 0.8)
+
+    def test_predict(self, mock_cs):
+        mock_cs.get_models.return_value = [
+            fake_model("driving", calibration.get_region(origin)),
+        ]
+        distances = np.array([[1000, 3000]])
+        predicted, low, high = calibration.predict([origin], distances,
+                                                   "driving")
+        self.assertTrue(np.all(low < predicted))
+        self.assertTrue(np.all(predicted < high))
+        self.assertTrue(abs(predicted[0][0] - 500) < 50)
+        # no model for the region or mode
+        predicted, _, _ = calibration.predict(
+            [origin, Point(-33.9, 151.2)], np.vstack([distances] * 2),
+            "driving"
+        )
+        self.assertTrue(np.all(np.isnan(predicted[1])))
+        self.assertIsNone(calibration.predict([origin], distances,
+                                              "walking"))
+        mock_cs.get_models.assert_called_once()
+
+    def test_predict_confident(self, mock_cs):
+        mock_cs.get_models.return_value = [
+            fake_model("driving", calibration.ALL_REGIONS),
+            fake_model("walking", calibration.ALL_REGIONS, residual_std=1)
+        ]
+        predicted = calibration.predict_confident([origin], fake_places,
+                                                  "driving")
+        self.assertTrue(all(isinstance(duration, int)
+                            for duration in predicted[0]))
+        self.assertEqual(
+            calibration.predict_confident([origin], fake_places, "walking"),
+            [[None, None]]
+        )
+
+    def test_record_samples(self, mock_cs):
+        calibration.record_samples(
+            [origin, Point(51.4, 0.1)],
+            [Point(51.51, -0.11)],
+            [[600], [sys.maxsize]],
+            "transit"
+        )
+        samples = mock_cs.add_samples.call_args[0][0]
+        self.assertEqual(len(samples), 1)
+        self.assertEqual(samples[0]["region"],
+                         calibration.get_region(origin))
+        self.assertEqual(samples[0]["duration"], 600)
+        self.assertAlmostEqual(samples[0]["distance"], 1310, delta=5)
+
+
+class TestCalibratedTravelTimes(unittest.TestCase):
+
+    @patch.object(travel_times, "calibration")
+    @patch.object(travel_times, "google_maps")
+    @patch.object(travel_times, "travel_time_store")
+    def test_predicted_not_requested(self, mock_tts, mock_gm, mock_cal):
+        mock_tts.get_travel_times.return_value = []
+        mock_cal.predict_confident.return_value = [[450, None]]
+        mock_gm.get_distance_matrix.return_value = [[900]]
+        matrix = travel_times.get_distance_matrix([origin], fake_places,
+                                                  "driving")
+        self.assertEqual(matrix, [[450, 900]])
+        self.assertEqual(len(mock_gm.get_distance_matrix.call_args[0][1]),
+                         1)
+        mock_cal.record_samples.assert_called_once()
+        stored = mock_tts.add_travel_times.call_args[0][0]
+        self.assertEqual([entry["gm_id"] for entry in stored], ["b"])
+        self.assertEqual(travel_times.cache_stats["driving"]["predicted"],
+                         1)
+
+    @patch.object(places, "calibration")
+    def test_prune_with_prediction(self, mock_cal):
+        users = [origin]
+        candidates = [
+            {"gm_id": "near", "lat": 51.51, "long": -0.11},
+            {"gm_id": "far", "lat": 51.53, "long": -0.13},
+        ]
+        mock_cal.predict.return_value = None
+        self.assertEqual(
+            places.prune_candidates(users, candidates, "walking", keep=1),
+            candidates
+        )
+        # tight intervals tell the places apart
+        mock_cal.predict.return_value = (
+            np.array([[1000., 3000.]]),
+            np.array([[900., 2700.]]),
+            np.array([[1100., 3300.]])
+        )
+        self.assertEqual(
+            places.prune_candidates(users, candidates, "walking", keep=1),
+            candidates[:1]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+from convergence.core.candidates import CandidateSet
+from convergence.utils.point import Point
+
+fake_places = [
+    {"gm_id": "a", "lat": 51.51, "long": -0.11, "gm_rating": 3.5,
+     "gm_price": 2},
+    {"gm_id": "b", "lat": 51.6, "long": -0.2, "gm_rating": None,
+     "gm_price": None},
+    {"gm_id": "c", "lat": 51.55, "long": -0.15, "gm_rating": 4.5,
+     "gm_price": 1},
+    {"gm_id": "d", "lat": 51.5, "long": -0.1, "gm_rating": 0,
+     "gm_price": 3},
+]
+
+
+def gm_ids(candidates):
+    return [place["gm_id"] for place in candidates.places]
+
+
+class TestCandidateSet(unittest.TestCase):
+
+    def setUp(self):
+        self.candidates = CandidateSet.from_places(fake_places)
+
+    def test_from_places(self):
+        self.assertEqual(len(self.candidates), 4)
+        self.assertEqual(self.candidates.lat.tolist()[0], 51.51)
+        self.assertEqual(self.candidates.price.tolist()[2], 1)
+        self.assertIsNone(self.candidates.travel_total)
+        self.assertEqual(len(CandidateSet.from_places([])), 0)
+
+    def test_top_by_rating(self):
+        self.assertEqual(gm_ids(self.candidates.top_by_rating(3)),
+                         ["c", "a", "b"])
+        self.assertEqual(fake_places[1]["gm_rating"], None)
+        self.assertEqual(fake_places[3]["gm_rating"], 0)
+
+    def test_with_travel_totals(self):
+        candidates = self.candidates.with_travel_totals([
+            [100, 200, None, None],
+            [300, None, 50, None]
+        ])
+        result = candidates.sorted_by_travel_total().to_dicts()
+        self.assertEqual([place["gm_id"] for place in result],
+                         ["c", "a", "b", "d"])
+        self.assertEqual([place["travel_total"] for place in result],
+                         [100, 400, 400, None])
+        self.assertTrue(all(isinstance(place["travel_total"], int)
+                            for place in result[:3]))
+        self.assertNotIn("travel_total", fake_places[0])
+
+    def test_with_distance_totals(self):
+        users = [Point(51.5, -0.1), Point(51.52, -0.12)]
+        result = self.candidates.with_distance_totals(
+            users
+        ).sorted_by_travel_total().to_dicts()
+        self.assertEqual([place["gm_id"] for place in result],
+                         ["d", "a", "c", "b"])
+        self.assertIsInstance(result[0]["travel_total"], float)
+
+    def test_take(self):
+        candidates = self.candidates.with_travel_totals([[1, 2, 3, 4]])
+        subset = candidates.take([3, 0])
+        self.assertEqual(gm_ids(subset), ["d", "a"])
+        self.assertEqual(subset.travel_total.tolist(), [4, 1])
+        subset = candidates.take(candidates.travel_total > 2)
+        self.assertEqual(gm_ids(subset), ["c", "d"])
+
+    def test_to_dicts_without_totals(self):
+        self.assertEqual(self.candidates.to_dicts(), fake_places)
+        self.assertIsNot(self.candidates.to_dicts()[0], fake_places[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import time
+import unittest
+import threading
+from unittest.mock import patch, MagicMock
+
+from convergence.apis import circuit_breaker
+from convergence.apis import google_maps
+from convergence.apis.single_flight import SingleFlight
+from convergence.utils.exceptions import CircuitOpenError, ServerError
+from convergence.utils.point import Point
+
+
+class ImmediateExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def fail():
+    raise ServerError("upstream")
+
+
+@patch.object(circuit_breaker, "time")
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.probe = MagicMock()
+        self.breaker = circuit_breaker.CircuitBreaker(
+            "fake", self.probe, ImmediateExecutor(), failure_threshold=2,
+            reset_timeout=30
+        )
+
+    def call(self, fn):
+        with self.breaker:
+            return fn()
+
+    def open_breaker(self):
+        for _ in range(2):
+            with self.assertRaises(ServerError):
+                self.call(fail)
+
+    def test_opens_after_failures(self, mock_time):
+        mock_time.monotonic.return_value = 0
+        with self.assertRaises(ServerError):
+            self.call(fail)
+        self.assertEqual(self.call(lambda: 1), 1)  # success resets count
+        self.assertFalse(self.breaker.is_open())
+        self.open_breaker()
+        self.assertTrue(self.breaker.is_open())
+        with self.assertRaises(CircuitOpenError):
+            self.call(lambda: 1)
+        self.probe.assert_not_called()
+        self.assertEqual(self.breaker.get_stats(),
+                         {"state": "open", "opened": 1, "rejected": 1,
+                          "probes": 0})
+
+    def test_probe_closes(self, mock_time):
+        mock_time.monotonic.return_value = 0
+        self.open_breaker()
+        mock_time.monotonic.return_value = 30
+        # requests fail fast while probing
+        with self.assertRaises(CircuitOpenError):
+            self.call(lambda: 1)
+        self.probe.assert_called_once()
+        self.assertEqual(self.breaker.state, circuit_breaker.CLOSED)
+        self.assertEqual(self.call(lambda: 1), 1)
+
+    def test_probe_reopens(self, mock_time):
+        mock_time.monotonic.return_value = 0
+        self.open_breaker()
+        self.probe.side_effect = fail
+        mock_time.monotonic.return_value = 30
+        with self.assertRaises(CircuitOpenError):
+            self.call(lambda: 1)
+        self.assertEqual(self.breaker.state, circuit_breaker.OPEN)
+        # the next probe is reset_timeout after the failed one
+        mock_time.monotonic.return_value = 45
+        with self.assertRaises(CircuitOpenError):
+            self.call(lambda: 1)
+        self.assertEqual(self.probe.call_count, 1)
+        self.assertEqual(self.breaker.get_stats()["opened"], 2)
+
+    def test_half_open_rejects(self, mock_time):
+        self.breaker.executor = MagicMock()  # probe still running
+        mock_time.monotonic.return_value = 0
+        self.open_breaker()
+        mock_time.monotonic.return_value = 30
+        for _ in range(3):
+            with self.assertRaises(CircuitOpenError):
+                self.call(lambda: 1)
+        self.assertEqual(self.breaker.state, circuit_breaker.HALF_OPEN)
+        self.breaker.executor.submit.assert_called_once()
+
+
+class TestGoogleMapsBreakers(unittest.TestCase):
+
+    @patch.object(google_maps, "client")
+    def test_open_breaker_skips_request(self, mock_client):
+        breaker = google_maps.breakers[google_maps.PLACES_ENDPOINT]
+        with patch.object(breaker, "state", circuit_breaker.OPEN), \
+                patch.object(breaker, "_opened",
+                             circuit_breaker.time.monotonic()):
+            with self.assertRaises(CircuitOpenError):
+                google_maps.get_places_page(Point(51.5, -0.1), 1500, "bar")
+        mock_client.get_json.assert_not_called()
+
+    @patch.object(google_maps, "single_flight", SingleFlight())
+    @patch.object(google_maps, "client")
+    def test_coalesced_failure_counted_once(self, mock_client):
+        release = threading.Event()
+
+        def failing_request(url, endpoint):
+            release.wait(5)
+            return None  # invalid response
+
+        mock_client.get_json.side_effect = failing_request
+        breaker = circuit_breaker.CircuitBreaker(
+            google_maps.PLACES_ENDPOINT, MagicMock(), MagicMock(),
+            failure_threshold=5
+        )
+        errors = []
+
+        def call():
+            try:
+                google_maps.get_places_page(Point(51.5, -0.1), 1500, "bar")
+            except ServerError as e:
+                errors.append(e)
+
+        with patch.dict(google_maps.breakers,
+                        {google_maps.PLACES_ENDPOINT: breaker}):
+            threads = [threading.Thread(target=call) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.1)
+            release.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(mock_client.get_json.call_count, 1)
+        self.assertEqual(breaker._failures, 1)
+        self.assertFalse(breaker.is_open())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -31,6 +31,13 @@ class TestDeleteEvent(unittest.TestCase):
         self.assertEqual(events.delete_event(3, 7), None)
         mock_es.delete_event.assert_called_once()
 
+    @patch.object(events, "suggestion_cache")
+    @patch.object(events, "event_store")
+    def test_delete_event_invalidates_suggestions(self, mock_es, mock_sc):
+        mock_es.get_event_by_id = fakes.get_fake_event
+        events.delete_event(3, 7)
+        mock_sc.invalidate_event.assert_called_once_with(7)
+
     @patch.object(events, "event_store")
     def test_delete_event_fail(self, mock_es):
         mock_es.get_event_by_id = fakes.get_fake_event
@@ -0,0 +1,79 @@
+import unittest
+
+from convergence.core import location
+from convergence.data.models import Event
+from convergence.utils import geo
+from convergence.utils.point import Point
+
+points_a = [
+    Point(51.449457, -0.149099),  # Balham
+    Point(51.399944, 0.016419),  # Bromley
+    Point(53.434721, -0.244350),  # Stainton le Vale
+]
+points_b = [
+    Point(54.761073, -1.564506),  # Durham
+    Point(43.360261, -0.213497),  # near Pau
+]
+
+
+class TestDistanceMatrix(unittest.TestCase):
+
+    def test_distance_matrix_shape(self):
+        matrix = geo.distance_matrix(points_a, points_b)
+        self.assertEqual(matrix.shape, (3, 2))
+        matrix = geo.distance_matrix(points_a, [])
+        self.assertEqual(matrix.shape, (3, 0))
+
+    def test_distance_matrix_matches_distance_to(self):
+        matrix = geo.distance_matrix(points_a, points_b)
+        for i, a in enumerate(points_a):
+            for j, b in enumerate(points_b):
+                self.assertAlmostEqual(matrix[i][j], a.distance_to(b),
+                                       places=4)
+
+    def test_distance_matrix_coordinate_pairs(self):
+        pairs = [(p.lat, p.long) for p in points_b]
+        self.assertTrue(
+            (geo.distance_matrix(points_a, pairs) ==
+             geo.distance_matrix(points_a, points_b)).all()
+        )
+
+    def test_distance_matrix_short_distances(self):
+        matrix = geo.distance_matrix([(51.5, -0.1)],
+                                     [(51.5, -0.1), (51.5, -0.100001)])
+        self.assertEqual(matrix[0][0], 0)
+        self.assertAlmostEqual(matrix[0][1], 0.0692, places=4)
+
+    def test_distance_matrix_antipodal(self):
+        matrix = geo.distance_matrix([(0, 0), (90, 0)], [(0, 180), (-90, 0)])
+        half_circumference = geo.EARTH_RADIUS * 3.141592653589793
+        self.assertAlmostEqual(matrix[0][0], half_circumference, places=3)
+        self.assertAlmostEqual(matrix[1][1], half_circumference, places=3)
+
+
+class TestLocationSums(unittest.TestCase):
+
+    def test_incremental_centroid(self):
+        sums = [0, 0, 0]
+        for point in points_a + points_b:
+            vector = geo.unit_vector(point.lat, point.long)
+            for idx, value in enumerate(vector):
+                sums[idx] += value
+        vector = geo.unit_vector(points_b[0].lat, points_b[0].long)
+        for idx, value in enumerate(vector):
+            sums[idx] -= value
+        expected = location.find_centroid(points_a + points_b[1:])
+        lat, long = geo.centroid_from_sums(*sums,
+                                           len(points_a + points_b) - 1)
+        self.assertAlmostEqual(lat, expected.lat, places=9)
+        self.assertAlmostEqual(long, expected.long, places=9)
+
+    def test_location_sums_delta(self):
+        self.assertIsNone(Event.location_sums_delta((None, None), 1))
+        delta = Event.location_sums_delta((51.5, -0.1), -1)
+        self.assertEqual(len(delta), 4)
+        self.assertIn(Event.location_count, delta)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,15 @@
+import sys
+import math
+import random
 import unittest
+from unittest.mock import patch
 
 from convergence.apis import google_maps
+from convergence.utils.exceptions import ServerError
+from convergence.utils.point import Point
 
 valid_json = {
+    "status": "OK",
     "results": [
         {
             "geometry": {
@@ -92,5 +99,175 @@ class TestJsonExtractPlaces(unittest.TestCase):
         self.assertEqual(places[0]["gm_rating"], 3)
 
 
+def fake_origins(n):
+    return [Point(i / 100, 0) for i in range(n)]
+
+
+def fake_destinations(n):
+    return [Point(0, j / 100) for j in range(n)]
+
+
+def fake_duration(origin, destination):
+    return round(origin.lat * 100) * 1000 + round(destination.long * 100)
+
+
+def fake_request_distance_matrix(origins, destinations, mode):
+    """Fake Distance Matrix backend enforcing the API limits"""
+    assert 0 < len(origins) <= google_maps.DISTANCE_MATRIX_MAX_ORIGINS
+    assert 0 < len(destinations) <= \
+        google_maps.DISTANCE_MATRIX_MAX_DESTINATIONS
+    assert len(origins) * len(destinations) <= \
+        google_maps.DISTANCE_MATRIX_MAX_ELEMENTS
+    return [
+        {"elements": [
+            {"status": "ZERO_RESULTS"} if fake_duration(o, d) % 7 == 0 else
+            {"status": "OK", "duration": {"value": fake_duration(o, d)}}
+            for d in destinations
+        ]}
+        for o in origins
+    ]
+
+
+class TestTileMatrix(unittest.TestCase):
+
+    def assert_valid_tiling(self, no_origins, no_destinations):
+        tiles = google_maps._tile_matrix(no_origins, no_destinations)
+        covered = [[0] * no_destinations for _ in range(no_origins)]
+        for origin_start, origin_end, dest_start, dest_end in tiles:
+            tile_origins = origin_end - origin_start
+            tile_destinations = dest_end - dest_start
+            self.assertLessEqual(tile_origins,
+                                 google_maps.DISTANCE_MATRIX_MAX_ORIGINS)
+            self.assertLessEqual(tile_destinations,
+                                 google_maps.DISTANCE_MATRIX_MAX_DESTINATIONS)
+            self.assertLessEqual(tile_origins * tile_destinations,
+                                 google_maps.DISTANCE_MATRIX_MAX_ELEMENTS)
+            for row in range(origin_start, origin_end):
+                for col in range(dest_start, dest_end):
+                    covered[row][col] += 1
+        self.assertTrue(all(count == 1 for row in covered for count in row))
+        return tiles
+
+    def test_tile_matrix_sizes(self):
+        self.assertEqual(google_maps._tile_matrix(0, 10), [])
+        self.assertEqual(google_maps._tile_matrix(10, 0), [])
+        self.assertEqual(len(self.assert_valid_tiling(10, 10)), 1)
+        self.assertEqual(len(self.assert_valid_tiling(1, 60)), 3)
+        self.assertEqual(len(self.assert_valid_tiling(60, 1)), 3)
+        self.assertEqual(len(self.assert_valid_tiling(60, 40)), 24)
+
+    def test_tile_matrix_random_sizes(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            no_origins = rng.randint(1, 80)
+            no_destinations = rng.randint(1, 80)
+            tiles = self.assert_valid_tiling(no_origins, no_destinations)
+            self.assertGreaterEqual(
+                len(tiles),
+                math.ceil(no_origins * no_destinations /
+                          google_maps.DISTANCE_MATRIX_MAX_ELEMENTS)
+            )
+
+
+class TestGetDistanceMatrix(unittest.TestCase):
+
+    def assert_matrix(self, no_origins, no_destinations):
+        origins = fake_origins(no_origins)
+        destinations = fake_destinations(no_destinations)
+        matrix = google_maps.get_distance_matrix(origins, destinations,
+                                                 "transit")
+        self.assertEqual(len(matrix), no_origins)
+        for origin, row in zip(origins, matrix):
+            self.assertEqual(len(row), no_destinations)
+            for destination, duration in zip(destinations, row):
+                expected = fake_duration(origin, destination)
+                if expected % 7 == 0:
+                    expected = sys.maxsize
+                self.assertEqual(duration, expected)
+
+    @patch.object(google_maps, "_request_distance_matrix",
+                  fake_request_distance_matrix)
+    def test_get_distance_matrix_sizes(self):
+        for size in [(1, 1), (10, 10), (25, 4), (4, 25), (60, 40), (40, 60),
+                     (101, 3), (3, 101)]:
+            self.assert_matrix(*size)
+
+    @patch.object(google_maps, "_request_distance_matrix",
+                  fake_request_distance_matrix)
+    def test_get_distance_matrix_random_sizes(self):
+        rng = random.Random(11)
+        for _ in range(25):
+            self.assert_matrix(rng.randint(1, 70), rng.randint(1, 70))
+
+    @patch.object(google_maps, "_request_distance_matrix",
+                  fake_request_distance_matrix)
+    def test_iter_distance_matrix(self):
+        origins = fake_origins(30)
+        destinations = fake_destinations(40)
+        tiles = list(google_maps.iter_distance_matrix(origins, destinations,
+                                                      "transit"))
+        self.assertEqual(len(tiles), len(google_maps._tile_matrix(30, 40)))
+        covered = set()
+        for origin_start, dest_start, durations in tiles:
+            for row_idx, row in enumerate(durations, origin_start):
+                for col_idx, duration in enumerate(row, dest_start):
+                    covered.add((row_idx, col_idx))
+                    expected = fake_duration(origins[row_idx],
+                                             destinations[col_idx])
+                    if expected % 7 == 0:
+                        expected = sys.maxsize
+                    self.assertEqual(duration, expected)
+        self.assertEqual(len(covered), 30 * 40)
+
+
+class TestGetPlaces(unittest.TestCase):
+
+    def setUp(self):
+        # keep fake responses out of the app's single flight directory
+        patcher = patch.object(google_maps.single_flight, "lock_dir", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(google_maps, "time")
+    @patch.object(google_maps, "client")
+    def test_pages(self, mock_client, mock_time):
+        point = Point(51.114, 1.1236)
+        mock_client.get_json.side_effect = [
+            dict(valid_json, next_page_token="second"),
+            dict(valid_json, next_page_token="third"),
+            valid_json
+        ]
+        places, page_token = google_maps.get_places_page(point, 1500, "bar")
+        self.assertEqual((len(places), page_token), (2, "second"))
+        remaining = google_maps.get_remaining_pages(point, 1500, "bar",
+                                                    page_token)
+        self.assertEqual(len(remaining), 4)
+        self.assertEqual(mock_time.sleep.call_count, 2)
+        self.assertTrue(mock_client.get_json.call_args[0][0]
+                        .endswith("&pagetoken=third"))
+
+    @patch.object(google_maps, "client")
+    def test_error_status(self, mock_client):
+        point = Point(51.114, 1.1236)
+        for status in ["OVER_QUERY_LIMIT", "REQUEST_DENIED",
+                       "INVALID_REQUEST"]:
+            mock_client.get_json.return_value = {"results": [],
+                                                 "status": status}
+            with self.assertRaises(ServerError):
+                google_maps.get_places_page(point, 1500, "bar")
+        mock_client.get_json.return_value = {"results": [],
+                                             "status": "ZERO_RESULTS"}
+        self.assertEqual(google_maps.get_places_page(point, 1500, "bar"),
+                         ([], None))
+
+    @patch.object(google_maps, "single_flight")
+    def test_single_flight_key(self, mock_single_flight):
+        mock_single_flight.do.return_value = valid_json
+        google_maps.get_places_page(Point(51.114, 1.1236), 1500, "bar")
+        key = mock_single_flight.do.call_args[0][0]
+        self.assertIn("type=bar", key)
+        self.assertNotIn(f"key={google_maps.GM_API_KEY}", key)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from convergence.apis import http_client
+from convergence.utils.exceptions import ServerError
+
+
+def fake_response(status_code=200, body=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = body if body is not None else {}
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError()
+    return response
+
+
+@patch.object(http_client.time, "sleep")
+class TestGetJson(unittest.TestCase):
+
+    def setUp(self):
+        self.client = http_client.HttpClient(connect_timeout=1,
+                                             read_timeout=2, max_retries=2)
+        self.client.session = MagicMock()
+
+    def test_get_json_success(self, mock_sleep):
+        self.client.session.get.return_value = fake_response(
+            body={"status": "OK", "results": []}
+        )
+        body = self.client.get_json("https://fake", "fake")
+        self.assertEqual(body["status"], "OK")
+        self.client.session.get.assert_called_once_with("https://fake",
+                                                        timeout=(1, 2))
+        mock_sleep.assert_not_called()
+        stats = self.client.get_stats()["fake"]
+        self.assertEqual((stats["requests"], stats["errors"]), (1, 0))
+
+    def test_get_json_retries_transient_errors(self, mock_sleep):
+        self.client.session.get.side_effect = [
+            requests.ConnectionError(),
+            fake_response(503),
+            fake_response(body={"status": "OK"})
+        ]
+        self.assertEqual(self.client.get_json("https://fake", "fake"),
+                         {"status": "OK"})
+        self.assertEqual(self.client.session.get.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        first, second = [call[0][0] for call in mock_sleep.call_args_list]
+        self.assertTrue(0.25 <= first <= 0.75)
+        self.assertTrue(0.5 <= second <= 1.5)
+        stats = self.client.get_stats()["fake"]
+        self.assertEqual((stats["requests"], stats["errors"],
+                          stats["retries"]), (3, 2, 2))
+
+    def test_get_json_retries_api_status(self, mock_sleep):
+        self.client.session.get.side_effect = [
+            fake_response(body={"status": "UNKNOWN_ERROR"}),
+            fake_response(body={"status": "ZERO_RESULTS"})
+        ]
+        self.assertEqual(self.client.get_json("https://fake", "fake"),
+                         {"status": "ZERO_RESULTS"})
+
+    def test_get_json_gives_up(self, mock_sleep):
+        self.client.session.get.side_effect = requests.Timeout()
+        with self.assertRaises(ServerError):
+            self.client.get_json("https://fake", "fake")
+        self.assertEqual(self.client.session.get.call_count, 3)
+
+    def test_get_json_no_retry_on_client_error(self, mock_sleep):
+        self.client.session.get.return_value = fake_response(403)
+        with self.assertRaises(ServerError):
+            self.client.get_json("https://fake", "fake")
+        self.client.session.get.assert_called_once()
+        mock_sleep.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
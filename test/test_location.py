@@ -53,9 +53,9 @@ class TestMeanDistFromCentroid(unittest.TestCase):
         point_d = point.Point(51.403266, -0.303545)  # Kingston u/t
         coordinates = [point_a, point_b, point_c, point_d]
         centroid = location.find_centroid(coordinates)
-        self.assertEqual(location.mean_dist_from_centroid(coordinates,
-                                                          centroid),
-                         9260.933838113526)
+        self.assertAlmostEqual(location.mean_dist_from_centroid(coordinates,
+                                                                centroid),
+                               9260.933838113526, places=6)
 
     def test_mean_dist_from_centroid_mid(self):
         point_a = point.Point(53.434721, -0.244350)  # Stainton le Vale
@@ -64,9 +64,9 @@ class TestMeanDistFromCentroid(unittest.TestCase):
         point_d = point.Point(55.213541, -4.518828)  # South Ayrshire
         coordinates = [point_a, point_b, point_c, point_d]
         centroid = location.find_centroid(coordinates)
-        self.assertEqual(location.mean_dist_from_centroid(coordinates,
-                                                          centroid),
-                         125240.97021434733)
+        self.assertAlmostEqual(location.mean_dist_from_centroid(coordinates,
+                                                                centroid),
+                               125240.97021434733, places=6)
 
     def test_mean_dist_from_centroid_far(self):
         point_a = point.Point(49.258071, 4.310359)  # near Reims, FR
@@ -76,9 +76,9 @@ class TestMeanDistFromCentroid(unittest.TestCase):
         point_e = point.Point(48.049537, -1.970780)  # near Rennes
         coordinates = [point_a, point_b, point_c, point_d, point_e]
         centroid = location.find_centroid(coordinates)
-        self.assertEqual(location.mean_dist_from_centroid(coordinates,
-                                                          centroid),
-                         337243.52725888294)
+        self.assertAlmostEqual(location.mean_dist_from_centroid(coordinates,
+                                                                centroid),
+                               337243.52725888294, places=6)
 
     def test_mean_dist_from_centroid_identical(self):
         point_a = point.Point(49.258071, 4.310359)  # near Reims, FR
@@ -86,9 +86,32 @@ class TestMeanDistFromCentroid(unittest.TestCase):
         point_c = point.Point(49.258071, 4.310359)  # near Reims, FR
         coordinates = [point_a, point_b, point_c]
         centroid = point.Point(45.002795, 5.631141)  # near Grenoble
-        self.assertEqual(location.mean_dist_from_centroid(coordinates,
-                                                          centroid),
-                         point_a.distance_to(centroid))
+        self.assertAlmostEqual(location.mean_dist_from_centroid(coordinates,
+                                                                centroid),
+                               point_a.distance_to(centroid), places=6)
+
+
+class TestClusterPoints(unittest.TestCase):
+
+    def test_cluster_points(self):
+        point_a = point.Point(51.449457, -0.149099)  # Balham
+        point_b = point.Point(51.449900, -0.149500)  # Balham, ~60m away
+        point_c = point.Point(51.399944, 0.016419)  # Bromley
+        point_d = point.Point(51.450457, -0.149099)  # Balham, ~110m away
+        coordinates = [point_a, point_b, point_c, point_d]
+        leaders, assignment = location.cluster_points(coordinates, 100)
+        self.assertEqual(leaders, [point_a, point_c, point_d])
+        self.assertEqual(assignment, [0, 0, 1, 2])
+        leaders, assignment = location.cluster_points(coordinates, 250)
+        self.assertEqual(leaders, [point_a, point_c])
+        self.assertEqual(assignment, [0, 0, 1, 0])
+
+    def test_cluster_points_disabled(self):
+        point_a = point.Point(51.449457, -0.149099)  # Balham
+        coordinates = [point_a, point_a]
+        self.assertEqual(location.cluster_points(coordinates, 0),
+                         (coordinates, [0, 1]))
+        self.assertEqual(location.cluster_points([], 100), ([], []))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+import unittest
+import threading
+
+from convergence.data import place_index
+from convergence.utils.point import Point
+
+
+def fake_place(gm_id, lat, long, types):
+    return {"id": None, "gm_id": gm_id, "name": gm_id, "lat": lat,
+            "long": long, "gm_price": 2, "gm_rating": 4, "gm_types": types,
+            "address": "Fake Address", "timestamp": None}
+
+
+fake_places = [
+    fake_place("balham", 51.449457, -0.149099, ["bar", "restaurant"]),
+    fake_place("clapham", 51.461856, -0.138478, ["cafe"]),
+    fake_place("bromley", 51.399944, 0.016419, ["bar"]),
+    fake_place("durham", 54.761073, -1.564506, ["bar"]),
+]
+
+
+def warm_index(places, max_places=100):
+    index = place_index.PlaceIndex(max_places=max_places)
+    index.state = place_index.LOADING
+    index.add_many(places)
+    index.state = place_index.WARM
+    return index
+
+
+class TestPlaceIndexQuery(unittest.TestCase):
+
+    def test_query_radius(self):
+        index = warm_index(fake_places)
+        centre = Point(51.449457, -0.149099)  # Balham
+        found = {p["gm_id"] for p in index.query(centre, 2000)}
+        self.assertEqual(found, {"balham", "clapham"})
+        found = {p["gm_id"] for p in index.query(centre, 20000)}
+        self.assertEqual(found, {"balham", "clapham", "bromley"})
+
+    def test_query_matches_distance_to(self):
+        index = warm_index(fake_places)
+        centre = Point(51.5, -0.1)
+        for radius in [1000, 6000, 12000, 15000, 400000]:
+            expected = {
+                p["gm_id"] for p in fake_places
+                if centre.distance_to(Point(p["lat"], p["long"])) < radius
+            }
+            found = {p["gm_id"] for p in index.query(centre, radius)}
+            self.assertEqual(found, expected)
+
+    def test_query_place_type(self):
+        index = warm_index(fake_places)
+        centre = Point(51.449457, -0.149099)
+        found = {p["gm_id"] for p in index.query(centre, 20000, "bar")}
+        self.assertEqual(found, {"balham", "bromley"})
+
+    def test_query_returns_copies(self):
+        index = warm_index(fake_places)
+        centre = Point(51.449457, -0.149099)
+        index.query(centre, 100)[0]["gm_rating"] = 1
+        self.assertEqual(index.query(centre, 100)[0]["gm_rating"], 4)
+
+    def test_add_replaces_place(self):
+        index = warm_index(fake_places)
+        index.add(fake_place("balham", 54.761073, -1.564506, ["bar"]))
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.query(Point(51.449457, -0.149099), 100), [])
+
+    def test_cold_index(self):
+        index = place_index.PlaceIndex()
+        index.add_many(fake_places)
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.query(Point(51.449457, -0.149099), 2000))
+        self.assertEqual(index.stats()["misses"], 1)
+        self.assertEqual(index.stats()["hits"], 0)
+
+    def test_concurrent_hits(self):
+        index = warm_index(fake_places)
+        centre = Point(51.449457, -0.149099)
+
+        def query():
+            for _ in range(200):
+                index.query(centre, 100)
+        threads = [threading.Thread(target=query) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(index.stats()["hits"], 1600)
+
+    def test_max_places(self):
+        index = warm_index(fake_places, max_places=4)
+        self.assertEqual(index.stats()["state"], place_index.WARM)
+        index.add(fake_place("kingston", 51.403266, -0.303545, ["bar"]))
+        self.assertEqual(index.stats()["state"], place_index.COLD)
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.query(Point(51.449457, -0.149099), 2000))
+
+
+if __name__ == "__main__":
+    unittest.main()
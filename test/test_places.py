@@ -1,5 +1,7 @@
+import random
 import unittest
 import datetime
+from unittest.mock import patch
 
 from convergence.core import places
 from convergence.data.models import Place, User
@@ -113,10 +115,318 @@ class TestGetDistanceForPlaces(unittest.TestCase):
             user_coordinates,
             places_dicts
         )
-        self.assertEqual(response[0]["travel_total"], 207304.52645943288)
-        self.assertEqual(response[1]["travel_total"], 238273.00225216942)
-        self.assertEqual(response[2]["travel_total"], 231703.34971067737)
-        self.assertEqual(response[3]["travel_total"], 254710.84480953924)
+        self.assertAlmostEqual(response[0]["travel_total"],
+                               207304.52645943288, places=6)
+        self.assertAlmostEqual(response[1]["travel_total"],
+                               238273.00225216942, places=6)
+        self.assertAlmostEqual(response[2]["travel_total"],
+                               231703.34971067737, places=6)
+        self.assertAlmostEqual(response[3]["travel_total"],
+                               254710.84480953924, places=6)
+
+
+class TestTravelTotals(unittest.TestCase):
+
+    def test_add_travel_totals(self):
+        places_dicts = [place.as_dict() for place in fake_places[:2]]
+        response = places.add_travel_totals(places_dicts,
+                                            [[100, 200], [300, 400]])
+        self.assertEqual(response[0]["travel_total"], 400)
+        self.assertEqual(response[1]["travel_total"], 600)
+
+    def test_estimate_travel_totals(self):
+        places_dicts = [place.as_dict() for place in fake_places[:2]]
+        estimates = places.estimate_travel_totals(
+            places_dicts,
+            [[100, None], [None, None], [200, 600]],
+            [0, 1]
+        )
+        self.assertEqual(estimates[0]["gm_id"], places_dicts[0]["gm_id"])
+        self.assertEqual(estimates[0]["travel_total"], 450)
+        self.assertFalse(estimates[0]["complete"])
+        self.assertEqual(estimates[1]["travel_total"], 1800)
+        estimates = places.estimate_travel_totals(
+            places_dicts, [[100, None], [200, None]], [0, 1]
+        )
+        self.assertEqual(estimates[0]["travel_total"], 300)
+        self.assertTrue(estimates[0]["complete"])
+        self.assertIsNone(estimates[1]["travel_total"])
+
+
+class TestGetTravelTimeForPlaces(unittest.TestCase):
+
+    @patch.object(places.travel_time_backends, "travel_times")
+    def test_colocated_users_share_origin(self, mock_tt):
+        users = [Point(51.5, -0.1), Point(51.6, -0.2), Point(51.5001, -0.1)]
+        places_dicts = [{"gm_id": "a"}, {"gm_id": "b"}]
+        mock_tt.get_distance_matrix.return_value = [[100, 200], [300, 400]]
+        response = places.get_travel_time_for_places(users, places_dicts,
+                                                     "walking")
+        origins = mock_tt.get_distance_matrix.call_args[0][0]
+        self.assertEqual(origins, users[:2])
+        self.assertEqual(response[0]["travel_total"], 500)
+        self.assertEqual(response[1]["travel_total"], 800)
+
+    @patch.object(places.travel_time_backends, "travel_times")
+    def test_iter_travel_times(self, mock_tt):
+        users = [Point(51.5, -0.1), Point(51.6, -0.2), Point(51.5001, -0.1)]
+        mock_tt.iter_distance_matrix.return_value = iter([
+            [(0, 0, 100)], [(1, 0, 300)]
+        ])
+        self.assertEqual(
+            list(places.iter_travel_times(users, [{"gm_id": "a"}],
+                                          "walking")),
+            [[(0, 0, 100), (2, 0, 100)], [(1, 0, 300)]]
+        )
+
+
+class TestPruneCandidates(unittest.TestCase):
+
+    def setUp(self):
+        self.users = [Point(51.5, -0.1), Point(51.52, -0.12)]
+        self.near = [{"gm_id": f"near_{i}", "lat": 51.51 + i * 0.001,
+                      "long": -0.11} for i in range(3)]
+        self.far = [{"gm_id": "far", "lat": 52.5, "long": -1.1}]
+
+    def test_prune_far_places(self):
+        candidates = self.near[:1] + self.far + self.near[1:]
+        response = places.prune_candidates(self.users, candidates,
+                                           "walking", keep=3)
+        self.assertEqual(response, self.near)
+        response = places.prune_candidates(self.users, candidates,
+                                           "walking", keep=4)
+        self.assertEqual(response, candidates)
+
+    def test_element_budget(self):
+        response = places.prune_candidates(self.users, self.near,
+                                           "transit", keep=3,
+                                           element_budget=4)
+        self.assertEqual(response, self.near[:2])
+        response = places.prune_candidates(self.users, self.near,
+                                           "transit", keep=3,
+                                           element_budget=1)
+        self.assertEqual(len(response), 1)
+
+    def test_element_budget_shared_origin(self):
+        # co-located users take a single Distance Matrix row
+        users = [self.users[0], self.users[0]]
+        response = places.prune_candidates(users, self.near, "transit",
+                                           keep=3, element_budget=2)
+        self.assertEqual(response, self.near[:2])
+
+    def test_no_pruning(self):
+        candidates = self.near + self.far
+        self.assertEqual(
+            places.prune_candidates(self.users, candidates, "distance",
+                                    keep=1),
+            candidates
+        )
+        self.assertEqual(
+            places.prune_candidates(self.users, [], "walking"), []
+        )
+
+
+def fake_google_place(gm_id, lat, long, types):
+    return {"name": gm_id, "gm_id": gm_id, "lat": lat, "long": long,
+            "address": "Fake Address", "types": types, "price_level": 2,
+            "gm_rating": 4}
+
+
+class TestGetCoveringTiles(unittest.TestCase):
+
+    def test_covering_tiles_cover_circle(self):
+        rng = random.Random(3)
+        for centre, radius in [(Point(51.449457, -0.149099), 1500),
+                               (Point(51.449457, -0.149099), 4000),
+                               (Point(-33.8688, 151.2093), 20000),
+                               (Point(64.1466, -21.9426), 60000),
+                               (Point(-17.713371, 179.99), 5000)]:
+            tiles = places.get_covering_tiles(centre, radius)
+            self.assertLessEqual(
+                len(tiles), places.MAX_PLACE_TILES if radius <= 20000 else 9
+            )
+            self.assertTrue(all(tile.radius >= min(radius, 50000)
+                                for tile in tiles))
+            radius = min(radius, 50000)  # clamped to the largest level
+            for _ in range(200):
+                # random point inside the search circle must be within
+                # the search radius of at least one tile centre
+                min_lat, max_lat, min_long, max_long = \
+                    centre.bounding_box(radius)
+                if min_long > max_long:
+                    max_long += 360
+                long = rng.uniform(min_long, max_long)
+                point = Point(rng.uniform(min_lat, max_lat),
+                              long - 360 if long > 180 else long)
+                if point.distance_to(centre) >= radius:
+                    continue
+                self.assertTrue(any(
+                    point.distance_to(tile.centre) <= tile.radius
+                    for tile in tiles
+                ))
+
+    def test_covering_tiles_large_radius(self):
+        for radius in [50000, 120000, 500000, 5000000]:
+            tiles = places.get_covering_tiles(Point(51.449457, -0.149099),
+                                              radius)
+            self.assertLessEqual(len(tiles), 9)
+            self.assertTrue(all(tile.radius == 50000 for tile in tiles))
+
+    def test_covering_tiles_stable(self):
+        tiles_a = places.get_covering_tiles(Point(51.4494, -0.1490), 1500)
+        tiles_b = places.get_covering_tiles(Point(51.4495, -0.1491), 1500)
+        self.assertEqual({tile.id for tile in tiles_a},
+                         {tile.id for tile in tiles_b})
+
+
+@patch.object(places, "place_index")
+@patch.object(places, "place_store")
+@patch.object(places, "google_maps")
+class TestGetPlacesAroundCentroid(unittest.TestCase):
+
+    centre = Point(51.449457, -0.149099)  # Balham
+
+    def test_enough_places_in_database(self, mock_gm, mock_ps, mock_pi):
+        mock_pi.query.return_value = [p.as_dict() for p in fake_places]
+        result = places.get_places_around_centroid(self.centre, 1500, "bar")
+        self.assertEqual({p["id"] for p in result}, {1, 2, 3, 4})
+        mock_pi.query.assert_called_once_with(self.centre, 1500, "bar")
+        mock_gm.get_places_page.assert_not_called()
+
+    def test_not_enough_places_of_type(self, mock_gm, mock_ps, mock_pi):
+        mock_pi.query.return_value = None
+        mock_ps.get_places_around_point.return_value = fake_places[2:]
+        mock_ps.get_fetched_tiles.return_value = set()
+        mock_gm.get_places_page.return_value = ([], None)
+        mock_ps.upsert_places.return_value = (0, 0)
+        result = places.get_places_around_centroid(self.centre, 1500, "cafe")
+        self.assertEqual({p["id"] for p in result}, {3, 4})
+        mock_ps.get_places_around_point.assert_called_once_with(
+            self.centre, 1500, "cafe"
+        )
+        mock_gm.get_places_page.assert_called()
+
+    def test_upsert_failed(self, mock_gm, mock_ps, mock_pi):
+        mock_pi.query.return_value = []
+        mock_ps.get_fetched_tiles.return_value = set()
+        mock_gm.get_places_page.return_value = (
+            [fake_google_place("near", 51.4495, -0.1491, ["cafe"])], None
+        )
+        mock_ps.upsert_places.return_value = None
+        result = places.get_places_around_centroid(self.centre, 1500, "cafe")
+        self.assertEqual([p["gm_id"] for p in result], ["near"])
+        mock_ps.add_place_fetches.assert_not_called()
+
+    def test_all_tiles_fresh(self, mock_gm, mock_ps, mock_pi):
+        mock_pi.query.return_value = []
+        mock_ps.get_fetched_tiles.side_effect = \
+            lambda tiles, *args: set(tiles)
+        result = places.get_places_around_centroid(self.centre, 1500, "cafe")
+        self.assertEqual(result, [])
+        mock_gm.get_places_page.assert_not_called()
+
+    def test_missing_tiles(self, mock_gm, mock_ps, mock_pi):
+        mock_pi.query.return_value = None
+        mock_ps.upsert_places.return_value = (3, 0)
+        mock_ps.get_places_around_point.return_value = []
+        tiles = places.get_covering_tiles(self.centre, 1500)
+        mock_ps.get_fetched_tiles.return_value = set()
+        mock_gm.get_places_page.side_effect = [
+            ([fake_google_place("near", 51.4495, -0.1491, ["cafe"]),
+              fake_google_place("bar", 51.4496, -0.1492, ["bar"]),
+              fake_google_place("far", 51.47, -0.1491, ["cafe"])], None)
+        ] + [([], None) for _ in tiles[1:]]
+        result = places.get_places_around_centroid(self.centre, 1500, "cafe")
+        self.assertEqual([p["gm_id"] for p in result], ["near"])
+        self.assertEqual(mock_gm.get_places_page.call_count, len(tiles))
+        mock_ps.upsert_places.assert_called_once()
+        self.assertEqual(len(mock_ps.upsert_places.call_args[0][0]), 3)
+        fetches = mock_ps.add_place_fetches.call_args[0][0]
+        self.assertEqual(len(fetches), len(tiles))
+        self.assertEqual(fetches[0].result_count, 3)
+        self.assertTrue(all(fetch.result_count == 0
+                            for fetch in fetches[1:]))
+
+    @patch.object(places, "pending_tiles", set())
+    @patch.object(places, "page_executor")
+    def test_remaining_pages_in_background(self, mock_pe, mock_gm, mock_ps,
+                                           mock_pi):
+        mock_pi.query.return_value = [p.as_dict() for p in fake_places[:3]]
+        mock_ps.upsert_places.return_value = (1, 0)
+        tiles = places.get_covering_tiles(self.centre, 1500)
+        mock_ps.get_fetched_tiles.return_value = {tile.id
+                                                  for tile in tiles[1:]}
+        mock_gm.get_places_page.return_value = (
+            [fake_google_place("near", 51.4495, -0.1491, ["bar"])], "token"
+        )
+        result = places.get_places_around_centroid(self.centre, 1500, "bar")
+        self.assertEqual(len(result), 4)
+        mock_gm.get_remaining_pages.assert_not_called()
+        # the tile is only recorded as fetched once all pages are in
+        self.assertEqual(mock_ps.add_place_fetches.call_args[0][0], [])
+        mock_pe.submit.assert_called_once_with(
+            places._fetch_remaining_pages, [(tiles[0], 1, "token")], "bar"
+        )
+
+        with patch.object(places, "page_store") as mock_page_store:
+            mock_gm.get_remaining_pages.return_value = [
+                fake_google_place("second", 51.4497, -0.1493, ["bar"])
+            ]
+            mock_page_store.upsert_places.return_value = (1, 0)
+            places._fetch_remaining_pages(*mock_pe.submit.call_args[0][1:])
+            mock_gm.get_remaining_pages.assert_called_once_with(
+                tiles[0].centre, tiles[0].radius, "bar", "token"
+            )
+            fetches = mock_page_store.add_place_fetches.call_args[0][0]
+            self.assertEqual([(fetch.tile, fetch.result_count)
+                              for fetch in fetches], [(tiles[0].id, 2)])
+
+    @patch.object(places, "pending_tiles", set())
+    @patch.object(places, "page_executor")
+    def test_remaining_pages_pending(self, mock_pe, mock_gm, mock_ps,
+                                     mock_pi):
+        mock_pi.query.return_value = [p.as_dict() for p in fake_places[:3]]
+        mock_ps.upsert_places.return_value = (1, 0)
+        tiles = places.get_covering_tiles(self.centre, 1500)
+        mock_ps.get_fetched_tiles.return_value = {tile.id
+                                                  for tile in tiles[1:]}
+        mock_gm.get_places_page.return_value = (
+            [fake_google_place("near", 51.4495, -0.1491, ["bar"])], "token"
+        )
+        places.get_places_around_centroid(self.centre, 1500, "bar")
+        # the tile's remaining pages are still being fetched
+        places.get_places_around_centroid(self.centre, 1500, "bar")
+        mock_gm.get_places_page.assert_called_once()
+        mock_pe.submit.assert_called_once()
+
+        with patch.object(places, "page_store") as mock_page_store:
+            mock_gm.get_remaining_pages.return_value = []
+            mock_page_store.upsert_places.return_value = (0, 0)
+            places._fetch_remaining_pages(*mock_pe.submit.call_args[0][1:])
+        self.assertEqual(places.pending_tiles, set())
+
+    @patch.object(places, "page_executor")
+    def test_remaining_pages_synchronous(self, mock_pe, mock_gm, mock_ps,
+                                         mock_pi):
+        mock_pi.query.return_value = [p.as_dict() for p in fake_places[:3]]
+        mock_ps.upsert_places.return_value = (1, 0)
+        tiles = places.get_covering_tiles(self.centre, 1500)
+        mock_ps.get_fetched_tiles.return_value = {tile.id
+                                                  for tile in tiles[1:]}
+        mock_gm.get_places_page.return_value = (
+            [fake_google_place("near", 51.4495, -0.1491, ["bar"])], "token"
+        )
+        mock_gm.get_remaining_pages.return_value = [
+            fake_google_place("second", 51.4497, -0.1493, ["bar"])
+        ]
+        result = places.get_places_around_centroid(self.centre, 1500, "bar",
+                                                   all_pages=True)
+        self.assertEqual([p["gm_id"] for p in result[3:]],
+                         ["near", "second"])
+        mock_pe.submit.assert_not_called()
+        fetches = mock_ps.add_place_fetches.call_args[0][0]
+        self.assertEqual([(fetch.tile, fetch.result_count)
+                          for fetch in fetches], [(tiles[0].id, 2)])
 
 
 if __name__ == "__main__":
@@ -69,6 +69,31 @@ class TestPointMethods(unittest.TestCase):
                          point_b.distance_to(point_a))
         self.assertEqual(point_a.distance_to(point_a), 0)
 
+    def test_bounding_box(self):
+        point = Point(51.449457, -0.149099)  # Balham
+        min_lat, max_lat, min_long, max_long = point.bounding_box(5000)
+        self.assertLess(min_lat, point.lat)
+        self.assertGreater(max_lat, point.lat)
+        self.assertLess(min_long, point.long)
+        self.assertGreater(max_long, point.long)
+        # the box must touch, but not be much larger than, the circle
+        for corner in [Point(min_lat, point.long), Point(max_lat, point.long),
+                       Point(point.lat, min_long), Point(point.lat, max_long)]:
+            self.assertAlmostEqual(point.distance_to(corner), 5000, delta=5)
+
+    def test_bounding_box_antimeridian(self):
+        point = Point(-17.713371, 179.99)  # Fiji
+        min_lat, max_lat, min_long, max_long = point.bounding_box(10000)
+        self.assertGreater(min_long, max_long)
+        self.assertGreater(min_long, 179)
+        self.assertLess(max_long, -179)
+
+    def test_bounding_box_pole(self):
+        point = Point(89.99, 10)
+        min_lat, max_lat, min_long, max_long = point.bounding_box(10000)
+        self.assertEqual(max_lat, 90)
+        self.assertEqual((min_long, max_long), (-180, 180))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,44 @@
+import time
+import unittest
+import threading
+
+from convergence.utils.rate_limiter import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_acquire_within_capacity(self):
+        bucket = TokenBucket(rate=100)
+        start = time.monotonic()
+        for _ in range(4):
+            self.assertEqual(bucket.acquire(25), 0)
+        self.assertLess(time.monotonic() - start, 0.05)
+
+    def test_acquire_waits_for_refill(self):
+        bucket = TokenBucket(rate=200, capacity=20)
+        bucket.acquire(20)
+        start = time.monotonic()
+        waited = bucket.acquire(10)  # 10 tokens at 200/s: 0.05s
+        self.assertGreater(waited, 0)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_acquire_more_than_capacity(self):
+        bucket = TokenBucket(rate=10)
+        with self.assertRaises(ValueError):
+            bucket.acquire(11)
+
+    def test_acquire_concurrently(self):
+        bucket = TokenBucket(rate=500, capacity=50)
+        threads = [threading.Thread(target=bucket.acquire, args=(25,))
+                   for _ in range(6)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 150 tokens, 50 available up front, 100 more at 500/s: 0.2s
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+
+if __name__ == "__main__":
+    unittest.main()
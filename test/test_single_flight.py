@@ -0,0 +1,112 @@
+import os
+import time
+import tempfile
+import unittest
+import threading
+
+from convergence.apis.single_flight import SingleFlight, fcntl
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def temp_dir(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        return temp_dir.name
+
+    def slow_call(self, result):
+        def call():
+            self.calls.append(result)
+            self.release.wait(5)
+            return result
+        return call
+
+    def run_threads(self, targets):
+        results = [None] * len(targets)
+
+        def run(idx, target):
+            results[idx] = target()
+        threads = [threading.Thread(target=run, args=(idx, target))
+                   for idx, target in enumerate(targets)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)  # the first thread is the first to call
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_threads_coalesced(self):
+        single_flight = SingleFlight()
+        results = self.run_threads([
+            lambda: single_flight.do("a", self.slow_call(1), "fake"),
+            lambda: single_flight.do("a", self.slow_call(2), "fake"),
+            lambda: single_flight.do("b", self.slow_call(3), "fake")
+        ])
+        self.assertEqual(results, [1, 1, 3])
+        self.assertEqual(sorted(self.calls), [1, 3])
+        self.assertEqual(single_flight.get_stats()["fake"],
+                         {"calls": 3, "coalesced": 1,
+                          "coalesced_processes": 0})
+        # nothing in flight any more
+        self.assertEqual(single_flight.do("a", lambda: 4, "fake"), 4)
+
+    def test_error_shared(self):
+        single_flight = SingleFlight()
+
+        def failing():
+            self.release.wait(5)
+            raise ValueError("upstream")
+
+        errors = []
+
+        def call():
+            try:
+                single_flight.do("a", failing, "fake")
+            except ValueError as e:
+                errors.append(e)
+        self.run_threads([call, call])
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+
+    @unittest.skipIf(fcntl is None, "no file locks")
+    def test_processes_coalesced(self):
+        lock_dir = self.temp_dir()
+        # instances sharing a lock directory behave like worker processes
+        first, second = SingleFlight(lock_dir), SingleFlight(lock_dir)
+        results = self.run_threads([
+            lambda: first.do("a", self.slow_call({"rows": [1]}), "fake"),
+            lambda: second.do("a", self.slow_call({"rows": [2]}), "fake")
+        ])
+        self.assertEqual(results, [{"rows": [1]}, {"rows": [1]}])
+        self.assertEqual(self.calls, [{"rows": [1]}])
+        self.assertEqual(second.get_stats()["fake"]["coalesced_processes"],
+                         1)
+        # results from before a call are not reused
+        self.assertEqual(second.do("a", lambda: {"rows": [3]}, "fake"),
+                         {"rows": [3]})
+
+    @unittest.skipIf(fcntl is None, "no file locks")
+    def test_private_lock_dir(self):
+        parent = self.temp_dir()
+        lock_dir = os.path.join(parent, "single-flight")
+        single_flight = SingleFlight(lock_dir)
+        self.assertEqual(single_flight.do("a", lambda: [1], "fake"), [1])
+        self.assertEqual(os.stat(lock_dir).st_mode & 0o777, 0o700)
+        for name in os.listdir(lock_dir):
+            self.assertEqual(
+                os.stat(os.path.join(lock_dir, name)).st_mode & 0o077, 0
+            )
+
+        os.chmod(lock_dir, 0o777)  # e.g. pre-created by another user
+        single_flight = SingleFlight(lock_dir)
+        self.assertEqual(single_flight.do("a", lambda: [2], "fake"), [2])
+        self.assertIsNone(single_flight.lock_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from convergence.data.models import Place
+from convergence.data.repo import EventStore, PlaceStore, TravelTimeStore
+from convergence.data.repo import place_store
+
+LocationSums = namedtuple("LocationSums",
+                          ["x_sum", "y_sum", "z_sum", "location_count"])
+
+
+class TestStoreSession(unittest.TestCase):
+
+    def test_session_per_thread(self):
+        store = TravelTimeStore()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sessions = list(executor.map(
+                lambda _: store.session(), range(2)
+            ))
+        self.assertIsNot(store.session(), sessions[0])
+        self.assertIs(store.session(), store.session())
+        # another store does not share the thread's session
+        self.assertIsNot(TravelTimeStore().session(), store.session())
+
+
+class TestEventStore(unittest.TestCase):
+
+    def test_centroid_location_count(self):
+        session = MagicMock()
+        session.query.return_value.filter.return_value.first.return_value = \
+            LocationSums(1.0, 0.0, 0.0, 1)  # (0, 0), one member
+        store = EventStore(session)
+        self.assertEqual(store.get_centroid(3), (0.0, 0.0))
+        self.assertEqual(store.get_centroid(3, 1), (0.0, 0.0))
+        # sums of an event that had members before they were maintained
+        self.assertIsNone(store.get_centroid(3, 2))
+
+
+class FakeRow(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+class TestPlaceStore(unittest.TestCase):
+
+    @patch.object(place_store, "place_index")
+    def test_upsert_indexes_stored_rows(self, mock_index):
+        session = MagicMock()
+        stored = FakeRow(id=7, gm_id="a", name="Stored Name", lat=51.5,
+                         long=-0.1, address="Address", gm_price=2,
+                         gm_rating=4, gm_types=["bar"], timestamp=None,
+                         inserted=False)
+        session.execute.return_value.fetchall.return_value = [stored]
+        store = PlaceStore(session)
+        counts = store.upsert_places([
+            Place(gm_id="a", name="New Name", lat=51.6, long=-0.2,
+                  address="Address", gm_price=3, gm_rating=5,
+                  gm_types=["bar"])
+        ])
+        self.assertEqual(counts, (0, 1))
+        place = mock_index.add.call_args[0][0]
+        self.assertEqual((place["id"], place["name"], place["lat"]),
+                         (7, "Stored Name", 51.5))
+        self.assertNotIn("inserted", place)
+
+
+if __name__ == "__main__":
+    unittest.main()
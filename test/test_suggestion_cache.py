@@ -0,0 +1,506 @@
+import unittest
+from collections import namedtuple
+from unittest.mock import patch, MagicMock
+
+from convergence.core import suggestions
+from convergence.core import suggestion_cache
+from convergence.core import travel_time_backends
+from convergence.core.suggestion_cache import SuggestionCache
+from convergence.utils import exceptions
+from convergence.utils.point import Point
+
+MemberRow = namedtuple("MemberRow", ["user_id", "latitude", "longitude"])
+
+
+class TestSuggestionCache(unittest.TestCase):
+
+    def test_make_key(self):
+        key = suggestion_cache.make_key(
+            3, "bar", "transit", [(1, 51.5, -0.1), (2, 51.6, -0.2)]
+        )
+        self.assertEqual(key, suggestion_cache.make_key(
+            3, "bar", "transit", [(2, 51.6, -0.2), (1, 51.5, -0.1)]
+        ))
+        self.assertNotEqual(key, suggestion_cache.make_key(
+            3, "bar", "transit", [(1, 51.5, -0.1), (2, 51.6, -0.3)]
+        ))
+        self.assertNotEqual(key, suggestion_cache.make_key(
+            3, "bar", "walking", [(1, 51.5, -0.1), (2, 51.6, -0.2)]
+        ))
+
+    def test_get_returns_copy(self):
+        cache = SuggestionCache(ttl=60, max_entries=10)
+        cache.put((3, "bar", "transit", "x"), [1, 2], [{"name": "A"}])
+        result = cache.get((3, "bar", "transit", "x"))
+        self.assertEqual(result, [{"name": "A"}])
+        result[0]["name"] = "B"
+        self.assertEqual(cache.get((3, "bar", "transit", "x")),
+                         [{"name": "A"}])
+
+    def test_ttl(self):
+        cache = SuggestionCache(ttl=-1, max_entries=10)
+        cache.put((3, "bar", "transit", "x"), [1], [])
+        self.assertIsNone(cache.get((3, "bar", "transit", "x")))
+
+    def test_lru_eviction(self):
+        cache = SuggestionCache(ttl=60, max_entries=2)
+        cache.put((1, "bar", "transit", "x"), [1], [1])
+        cache.put((2, "bar", "transit", "x"), [1], [2])
+        cache.get((1, "bar", "transit", "x"))
+        cache.put((3, "bar", "transit", "x"), [1], [3])
+        self.assertEqual(cache.get((1, "bar", "transit", "x")), [1])
+        self.assertIsNone(cache.get((2, "bar", "transit", "x")))
+        self.assertEqual(cache.get((3, "bar", "transit", "x")), [3])
+
+    def test_invalidate(self):
+        cache = SuggestionCache(ttl=60, max_entries=10)
+        cache.put((1, "bar", "transit", "x"), [1, 2], [1])
+        cache.put((1, "cafe", "walking", "x"), [1, 2], [2])
+        cache.put((2, "bar", "transit", "x"), [2, 3], [3])
+        cache.invalidate_event(1)
+        self.assertIsNone(cache.get((1, "bar", "transit", "x")))
+        self.assertIsNone(cache.get((1, "cafe", "walking", "x")))
+        self.assertEqual(cache.get((2, "bar", "transit", "x")), [3])
+        cache.invalidate_user(1)
+        self.assertEqual(cache.get((2, "bar", "transit", "x")), [3])
+        cache.invalidate_user(3)
+        self.assertIsNone(cache.get((2, "bar", "transit", "x")))
+
+
+class TestGetSuggestionsCached(unittest.TestCase):
+
+    def setUp(self):
+        suggestion_cache.suggestion_cache.clear()
+        suggestion_cache.suggestion_state.clear()
+        patcher = patch.object(suggestions, "event_store")
+        patcher.start().get_centroid.return_value = None
+        self.addCleanup(patcher.stop)
+
+    @patch.object(suggestions, "_compute_suggestions")
+    @patch.object(suggestions, "userevent_store")
+    def test_cached(self, mock_ues, mock_compute):
+        mock_ues.get_member_locations.return_value = [
+            MemberRow(1, 51.5, -0.1)
+        ]
+        mock_compute.return_value = [{"name": "A", "travel_total": 1}]
+
+        self.assertEqual(
+            suggestions.get_suggestions(1, 3, "bar", "distance"),
+            (mock_compute.return_value,
+             {"cached": False, "degraded": False, "stale": False})
+        )
+        self.assertEqual(
+            suggestions.get_suggestions(1, 3, "bar", "distance"),
+            (mock_compute.return_value,
+             {"cached": True, "degraded": False, "stale": False})
+        )
+        self.assertEqual(mock_compute.call_count, 1)
+
+        mock_ues.get_member_locations.return_value = [
+            MemberRow(1, 51.6, -0.1)
+        ]
+        self.assertEqual(
+            suggestions.get_suggestions(1, 3, "bar", "distance")[1],
+            {"cached": False, "degraded": False, "stale": False}
+        )
+        suggestion_cache.suggestion_cache.invalidate_user(1)
+        self.assertEqual(
+            suggestions.get_suggestions(1, 3, "bar", "distance")[1],
+            {"cached": False, "degraded": False, "stale": False}
+        )
+        self.assertEqual(mock_compute.call_count, 3)
+
+
+class TestGetEventUsers(unittest.TestCase):
+
+    @patch.object(suggestions, "userevent_store")
+    def test_get_event_users(self, mock_ues):
+        mock_ues.get_member_locations.return_value = [
+            MemberRow(1, 51.5, -0.1),
+            MemberRow(2, None, None),
+            MemberRow(3, 51.52, -0.12)
+        ]
+        ids, members = suggestions._get_event_users(1, 3)
+        mock_ues.get_member_locations.assert_called_once_with(1, 3)
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual([member.id for member in members], [1, 3])
+        self.assertEqual(members[1].get_location(), (51.52, -0.12))
+
+    @patch.object(suggestions, "userevent_store")
+    def test_get_event_users_fail(self, mock_ues):
+        mock_ues.get_member_locations.return_value = []
+        with self.assertRaises(exceptions.NotFoundError):
+            suggestions._get_event_users(9, 3)
+        mock_ues.get_member_locations.return_value = [
+            MemberRow(1, None, None)
+        ]
+        with self.assertRaises(exceptions.InvalidRequestError):
+            suggestions._get_event_users(1, 3)
+
+
+class TestStreamSuggestions(unittest.TestCase):
+
+    def setUp(self):
+        suggestion_cache.suggestion_cache.clear()
+        suggestion_cache.suggestion_state.clear()
+        patcher = patch.object(suggestions, "event_store")
+        patcher.start().get_centroid.return_value = None
+        self.addCleanup(patcher.stop)
+
+    @patch.object(travel_time_backends, "travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    @patch.object(suggestions, "userevent_store")
+    def test_stream(self, mock_ues, mock_places, mock_tt):
+        mock_ues.get_member_locations.return_value = [
+            MemberRow(1, 51.5, -0.1),
+            MemberRow(2, 51.52, -0.12)
+        ]
+        mock_places.return_value = [
+            {"gm_id": "a", "lat": 51.51, "long": -0.11},
+            {"gm_id": "b", "lat": 51.6, "long": -0.2},
+        ]
+        mock_tt.iter_distance_matrix.return_value = iter([
+            [],
+            [(0, 1, 100), (1, 1, 200)],
+            [(0, 0, 600), (1, 0, 700)],
+        ])
+
+        stream = list(suggestions.stream_suggestions(1, 3, "bar", "transit"))
+        self.assertEqual([event for event, _ in stream],
+                         ["ranking", "travel_times", "travel_times",
+                          "result"])
+        self.assertEqual([place["gm_id"] for place in stream[0][1]["data"]],
+                         ["a", "b"])
+        self.assertEqual(stream[1][1]["data"], [
+            {"gm_id": "b", "travel_total": 300, "complete": True}
+        ])
+        self.assertEqual(
+            [(place["gm_id"], place["travel_total"])
+             for place in stream[3][1]["data"]],
+            [("b", 300), ("a", 1300)]
+        )
+        self.assertFalse(stream[3][1]["cached"])
+
+        stream = list(suggestions.stream_suggestions(1, 3, "bar", "transit"))
+        self.assertEqual(stream[0][0], "result")
+        self.assertTrue(stream[0][1]["cached"])
+        self.assertEqual(
+            stream[0][1]["data"],
+            suggestions.get_suggestions(1, 3, "bar", "transit")[0]
+        )
+
+
+class TestCompareSuggestions(unittest.TestCase):
+
+    def setUp(self):
+        suggestion_cache.suggestion_cache.clear()
+        suggestion_cache.suggestion_state.clear()
+        patcher = patch.object(suggestions, "event_store")
+        patcher.start().get_centroid.return_value = None
+        self.addCleanup(patcher.stop)
+
+    @patch.object(suggestions.places, "get_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    @patch.object(suggestions, "userevent_store")
+    def test_compare(self, mock_ues, mock_places, mock_tt):
+        mock_ues.get_member_locations.return_value = [
+            MemberRow(1, 51.5, -0.1)
+        ]
+        mock_places.return_value = [
+            {"gm_id": "a", "lat": 51.51, "long": -0.11},
+            {"gm_id": "b", "lat": 51.6, "long": -0.2},
+            {"gm_id": "c", "lat": 51.55, "long": -0.15},
+        ]
+        totals = {
+            "walking": {"a": 300, "b": 100, "c": 200},
+            "transit": {"a": 100, "b": 300, "c": 200},
+            "bicycling": {"a": 100, "b": 200, "c": 300},
+        }
+
+        def fake_travel_time(user_coordinates, candidates, mode, backend):
+            return [[totals[mode][place["gm_id"]] for place in candidates]]
+
+        mock_tt.side_effect = fake_travel_time
+        result, meta = suggestions.compare_suggestions(
+            1, 3, "bar", ["walking", "transit", "bicycling"]
+        )
+        mock_places.assert_called_once()
+        self.assertEqual(mock_tt.call_count, 3)
+        self.assertEqual(
+            [place["gm_id"] for place in result["modes"]["walking"]],
+            ["b", "c", "a"]
+        )
+        self.assertEqual(
+            [place["gm_id"] for place in result["combined"]],
+            ["a", "b", "c"]
+        )
+        self.assertEqual(result["combined"][0]["ranks"],
+                         {"walking": 3, "transit": 1, "bicycling": 1})
+        self.assertEqual(result["combined"][0]["travel_totals"]["walking"],
+                         300)
+        self.assertEqual(meta["cached"], {"walking": False,
+                                          "transit": False,
+                                          "bicycling": False})
+
+        result, meta = suggestions.compare_suggestions(
+            1, 3, "bar", ["walking", "distance"]
+        )
+        self.assertTrue(meta["cached"]["walking"])
+        self.assertFalse(meta["cached"]["distance"])
+        self.assertEqual(mock_tt.call_count, 3)
+        self.assertEqual(
+            suggestions.get_suggestions(1, 3, "bar", "transit"),
+            ([{"gm_id": "a", "lat": 51.51, "long": -0.11,
+               "travel_total": 100},
+              {"gm_id": "c", "lat": 51.55, "long": -0.15,
+               "travel_total": 200},
+              {"gm_id": "b", "lat": 51.6, "long": -0.2,
+               "travel_total": 300}],
+             {"cached": True, "degraded": False, "stale": False})
+        )
+
+    @patch.object(suggestions, "db")
+    @patch.object(suggestions.places, "get_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    @patch.object(suggestions, "userevent_store")
+    def test_sessions_removed(self, mock_ues, mock_places, mock_tt,
+                              mock_db):
+        mock_ues.get_member_locations.return_value = [
+            MemberRow(1, 51.5, -0.1)
+        ]
+        mock_places.return_value = [{"gm_id": "a", "lat": 51.51,
+                                     "long": -0.11}]
+        mock_tt.return_value = [[100]]
+        suggestions.compare_suggestions(1, 3, "bar", ["walking", "transit"])
+        self.assertEqual(mock_db.remove_sessions.call_count, 2)
+
+
+class TestUpdateSuggestions(unittest.TestCase):
+
+    def setUp(self):
+        suggestion_cache.suggestion_state.clear()
+        patcher = patch.object(suggestions, "event_store")
+        patcher.start().get_centroid.return_value = None
+        self.addCleanup(patcher.stop)
+        self.backend = travel_time_backends.backends["google"]
+        self.members = []
+        for user_id, user_location in [(1, (51.5, -0.1)),
+                                       (2, (51.52, -0.12))]:
+            self.add_member(user_id, user_location)
+        self.candidates = [
+            {"gm_id": "a", "lat": 51.51, "long": -0.11},
+            {"gm_id": "b", "lat": 51.505, "long": -0.115},
+        ]
+
+    def add_member(self, user_id, user_location):
+        member = MagicMock(id=user_id)
+        member.get_location.return_value = user_location
+        self.members.append(member)
+        return member
+
+    @patch.object(suggestions.places, "get_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    def test_incremental_updates(self, mock_places, mock_tt):
+        mock_places.return_value = self.candidates
+        mock_tt.side_effect = lambda users, candidates, mode, backend: [
+            [100 * (idx + 1) for idx, _ in enumerate(candidates)]
+            for _ in users
+        ]
+        result = suggestions._update_suggestions(3, self.members, "bar",
+                                                 "transit", self.backend)
+        self.assertEqual([place["travel_total"] for place in result],
+                         [200, 400])
+        self.assertEqual(len(mock_tt.call_args[0][0]), 2)
+
+        # a member joins nearby: only their row is requested
+        self.add_member(3, (51.51, -0.11))
+        result = suggestions._update_suggestions(3, self.members, "bar",
+                                                 "transit", self.backend)
+        self.assertEqual([place["travel_total"] for place in result],
+                         [300, 600])
+        self.assertEqual(len(mock_tt.call_args[0][0]), 1)
+        self.assertEqual(mock_places.call_count, 1)
+
+        # a member moves slightly
+        self.members[0].get_location.return_value = (51.501, -0.1)
+        suggestions._update_suggestions(3, self.members, "bar", "transit",
+                                        self.backend)
+        self.assertEqual(mock_tt.call_args[0][0], [Point(51.501, -0.1)])
+
+        # a member leaves: nothing is requested
+        self.members.pop()
+        calls = mock_tt.call_count
+        result = suggestions._update_suggestions(3, self.members, "bar",
+                                                 "transit", self.backend)
+        self.assertEqual(mock_tt.call_count, calls)
+        self.assertEqual([place["travel_total"] for place in result],
+                         [200, 400])
+        self.assertEqual(mock_places.call_count, 1)
+
+    @patch.object(suggestions.places, "get_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    def test_stored_centroid(self, mock_places, mock_tt):
+        mock_places.return_value = []
+        suggestions.event_store.get_centroid.return_value = (51.0, 0.5)
+        suggestions._update_suggestions(3, self.members, "bar", "transit",
+                                        self.backend)
+        suggestions.event_store.get_centroid.assert_called_once_with(
+            3, len(self.members))
+        self.assertEqual(mock_places.call_args[0][0], Point(51.0, 0.5))
+
+    @patch.object(suggestions.places, "get_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    def test_full_recompute(self, mock_places, mock_tt):
+        mock_places.return_value = self.candidates
+        mock_tt.side_effect = lambda users, candidates, mode, backend: [
+            [100] * len(candidates) for _ in users
+        ]
+        suggestions._update_suggestions(3, self.members, "bar", "transit",
+                                        self.backend)
+        self.members[1].get_location.return_value = (52.5, -1.2)
+        suggestions._update_suggestions(3, self.members, "bar", "transit",
+                                        self.backend)
+        self.assertEqual(mock_places.call_count, 2)
+        self.assertEqual(len(mock_tt.call_args[0][0]), 2)
+
+    @patch.object(suggestions, "time")
+    @patch.object(suggestions.places, "get_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    def test_rows_refreshed(self, mock_places, mock_tt, mock_time):
+        mock_places.return_value = self.candidates
+        mock_tt.side_effect = lambda users, candidates, mode, backend: [
+            [100] * len(candidates) for _ in users
+        ]
+        mock_time.monotonic.return_value = 0
+        suggestions._update_suggestions(3, self.members, "bar", "transit",
+                                        self.backend)
+        mock_time.monotonic.return_value = suggestions.ROW_TTL - 1
+        suggestions._update_suggestions(3, self.members, "bar", "transit",
+                                        self.backend)
+        self.assertEqual(mock_tt.call_count, 1)
+        mock_time.monotonic.return_value = suggestions.ROW_TTL
+        suggestions._update_suggestions(3, self.members, "bar", "transit",
+                                        self.backend)
+        self.assertEqual(mock_tt.call_count, 2)
+        self.assertEqual(len(mock_tt.call_args[0][0]), 2)
+
+    @patch.object(suggestions.places, "prune_candidate_set")
+    @patch.object(suggestions.places, "get_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    def test_pruned_for_members(self, mock_places, mock_tt, mock_prune):
+        mock_places.return_value = self.candidates
+        mock_tt.side_effect = lambda users, candidates, mode, backend: [
+            [100] * len(candidates) for _ in users
+        ]
+        mock_prune.side_effect = \
+            lambda users, candidates, mode: candidates.take([0])
+        result = suggestions._update_suggestions(3, self.members, "bar",
+                                                 "transit", self.backend)
+        self.assertEqual([place["gm_id"] for place in result], ["a"])
+
+        # a member joins: pruned again, for all members
+        self.add_member(3, (51.51, -0.11))
+        mock_prune.side_effect = \
+            lambda users, candidates, mode: candidates.take([1])
+        result = suggestions._update_suggestions(3, self.members, "bar",
+                                                 "transit", self.backend)
+        self.assertEqual(len(mock_prune.call_args[0][0]), 3)
+        self.assertEqual([place["gm_id"] for place in result], ["b"])
+        self.assertEqual(len(mock_tt.call_args[0][0]), 3)
+        self.assertEqual(mock_places.call_count, 1)
+
+        # same members: not pruned again
+        suggestions._update_suggestions(3, self.members, "bar", "transit",
+                                        self.backend)
+        self.assertEqual(mock_prune.call_count, 2)
+
+
+class TestStaleSuggestions(unittest.TestCase):
+
+    def setUp(self):
+        suggestion_cache.suggestion_cache.clear()
+        suggestion_cache.suggestion_state.clear()
+        patcher = patch.object(suggestions, "event_store")
+        patcher.start().get_centroid.return_value = None
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(suggestions, "userevent_store")
+        patcher.start().get_member_locations.return_value = [
+            MemberRow(1, 51.5, -0.1),
+            MemberRow(2, 51.52, -0.12)
+        ]
+        self.addCleanup(patcher.stop)
+        self.candidates = [
+            {"gm_id": "a", "lat": 51.51, "long": -0.11},
+            {"gm_id": "b", "lat": 51.6, "long": -0.2},
+        ]
+
+    @patch.object(suggestions.places, "get_stale_travel_times")
+    @patch.object(suggestions.places, "get_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    def test_stale_travel_times(self, mock_places, mock_tt, mock_stale):
+        mock_places.return_value = self.candidates
+        mock_tt.side_effect = exceptions.CircuitOpenError("unavailable")
+        mock_stale.return_value = [[600, 100], [700, 200]]
+        result, meta = suggestions.get_suggestions(1, 3, "bar", "transit")
+        self.assertEqual(meta, {"cached": False, "degraded": False,
+                                "stale": True})
+        self.assertEqual(
+            [(place["gm_id"], place["travel_total"]) for place in result],
+            [("b", 300), ("a", 1300)]
+        )
+        self.assertTrue(mock_places.call_args[1]["cached_only"])
+        # not cached, ranked again once the API is available
+        mock_tt.side_effect = None
+        mock_tt.return_value = [[100, 600], [200, 700]]
+        result, meta = suggestions.get_suggestions(1, 3, "bar", "transit")
+        self.assertFalse(meta["stale"])
+        self.assertEqual([place["gm_id"] for place in result], ["a", "b"])
+
+    @patch.object(suggestions.places, "get_stale_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    def test_crow_flies(self, mock_places, mock_stale):
+        def fake_places(centroid, radius, place_type, cached_only=False):
+            if not cached_only:
+                raise exceptions.CircuitOpenError("unavailable")
+            return self.candidates
+
+        mock_places.side_effect = fake_places
+        mock_stale.return_value = None  # not all travel times cached
+        stream = list(suggestions.stream_suggestions(1, 3, "bar", "walking"))
+        self.assertEqual([event for event, _ in stream], ["result"])
+        self.assertTrue(stream[0][1]["stale"])
+        self.assertEqual([place["gm_id"] for place in stream[0][1]["data"]],
+                         ["a", "b"])
+
+        result, meta = suggestions.compare_suggestions(
+            1, 3, "bar", ["walking", "distance"]
+        )
+        self.assertTrue(meta["stale"])
+        self.assertEqual(
+            [place["gm_id"] for place in result["modes"]["distance"]],
+            ["a", "b"]
+        )
+
+    @patch.object(suggestions.places, "get_stale_travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    def test_degraded(self, mock_places, mock_stale):
+        def fake_places(centroid, radius, place_type, cached_only=False):
+            if not cached_only:
+                raise exceptions.CircuitOpenError("unavailable")
+            return self.candidates
+
+        mock_places.side_effect = fake_places
+        result, meta = suggestions.get_suggestions(1, 3, "bar", "walking",
+                                                   degraded=True)
+        self.assertEqual(meta, {"cached": False, "degraded": True,
+                                "stale": True})
+        mock_stale.assert_not_called()
+        estimates = travel_time_backends.backends["estimate"] \
+            .get_distance_matrix(
+                [Point(51.5, -0.1), Point(51.52, -0.12)], self.candidates,
+                "walking"
+            )
+        self.assertEqual(
+            [place["travel_total"] for place in result],
+            sorted(sum(column) for column in zip(*estimates))
+        )
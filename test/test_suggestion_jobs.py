@@ -0,0 +1,99 @@
+import unittest
+import threading
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+
+from convergence.core import suggestion_jobs
+from convergence.utils import exceptions
+
+
+class TestSuggestionJobs(unittest.TestCase):
+
+    def setUp(self):
+        suggestion_jobs.jobs.clear()
+        suggestion_jobs.active_jobs.clear()
+        self.executor = ThreadPoolExecutor(2)
+        patcher = patch.object(suggestion_jobs, "job_executor",
+                               self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(suggestion_jobs, "suggestions")
+    @patch.object(suggestion_jobs, "events")
+    def test_submit_and_poll(self, mock_events, mock_suggestions):
+        mock_suggestions.get_suggestions.return_value = (
+            [{"name": "A"}], {"cached": False}
+        )
+        job = suggestion_jobs.submit_job(1, 3, "bar", "transit")
+        self.assertIn(job["status"], ("queued", "running", "done"))
+        self.executor.shutdown(wait=True)
+        job = suggestion_jobs.get_job(1, job["job_id"])
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["result"], [{"name": "A"}])
+        self.assertEqual(job["cached"], False)
+        mock_suggestions.get_suggestions.assert_called_once_with(
+            1, 3, "bar", "transit"
+        )
+
+    @patch.object(suggestion_jobs, "suggestions")
+    @patch.object(suggestion_jobs, "events")
+    def test_duplicate_attaches_to_running_job(self, mock_events,
+                                               mock_suggestions):
+        release = threading.Event()
+
+        def slow_suggestions(*args):
+            release.wait(5)
+            return [], {"cached": False}
+
+        mock_suggestions.get_suggestions.side_effect = slow_suggestions
+        first = suggestion_jobs.submit_job(1, 3, "bar", "transit")
+        second = suggestion_jobs.submit_job(2, 3, "bar", "transit")
+        other = suggestion_jobs.submit_job(1, 3, "bar", "walking")
+        self.assertEqual(first["job_id"], second["job_id"])
+        self.assertNotEqual(first["job_id"], other["job_id"])
+        release.set()
+        self.executor.shutdown(wait=True)
+        self.assertEqual(mock_suggestions.get_suggestions.call_count, 2)
+        self.assertEqual(suggestion_jobs.active_jobs, {})
+
+    @patch.object(suggestion_jobs, "db")
+    @patch.object(suggestion_jobs, "suggestions")
+    @patch.object(suggestion_jobs, "events")
+    def test_own_sessions(self, mock_events, mock_suggestions, mock_db):
+        job_threads = []
+
+        def record_thread(*args):
+            job_threads.append(threading.get_ident())
+            return [], {"cached": False}
+
+        mock_suggestions.get_suggestions.side_effect = record_thread
+        suggestion_jobs.submit_job(1, 3, "bar", "transit")
+        self.executor.shutdown(wait=True)
+        self.assertNotIn(threading.get_ident(), job_threads)
+        mock_db.remove_sessions.assert_called_once()
+
+    @patch.object(suggestion_jobs, "suggestions")
+    @patch.object(suggestion_jobs, "events")
+    def test_failed_job(self, mock_events, mock_suggestions):
+        mock_suggestions.get_suggestions.side_effect = \
+            exceptions.ServerError("Unable to reach places.")
+        job = suggestion_jobs.submit_job(1, 3, "bar", "transit")
+        self.executor.shutdown(wait=True)
+        job = suggestion_jobs.get_job(1, job["job_id"])
+        self.assertEqual(job["status"], "failed")
+        self.assertEqual(job["error"], "Unable to reach places.")
+        self.assertNotIn("result", job)
+
+    @patch.object(suggestion_jobs, "suggestions")
+    @patch.object(suggestion_jobs, "events")
+    def test_get_job_fail(self, mock_events, mock_suggestions):
+        mock_suggestions.get_suggestions.return_value = ([], {})
+        with self.assertRaises(exceptions.NotFoundError):
+            suggestion_jobs.get_job(1, "nonexistent")
+        job = suggestion_jobs.submit_job(1, 3, "bar", "transit")
+        mock_events.get_members.side_effect = \
+            exceptions.NotFoundError("Invalid user id or event id.")
+        with self.assertRaises(exceptions.NotFoundError):
+            suggestion_jobs.get_job(9, job["job_id"])
+        with self.assertRaises(exceptions.NotFoundError):
+            suggestion_jobs.submit_job(9, 3, "bar", "transit")
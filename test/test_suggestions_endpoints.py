@@ -0,0 +1,38 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+import flask_jwt_extended
+
+from convergence import app
+from convergence.endpoints import suggestions_endpoints
+
+
+class TestSuggestionsStream(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            token = flask_jwt_extended.create_access_token(identity=1)
+        self.client.set_cookie("localhost", "access_token_cookie", token)
+
+    @patch.object(suggestions_endpoints, "suggestions")
+    def test_stream_places(self, mock_suggestions):
+        place = {"gm_id": "a", "lat": 51.51, "long": -0.11,
+                 "timestamp": datetime.datetime(2020, 5, 1, 12, 30),
+                 "travel_total": 100}
+        mock_suggestions.stream_suggestions.return_value = iter([
+            ("ranking", {"data": [place]}),
+            ("result", {"data": [place], "cached": False})
+        ])
+        response = self.client.get("/events/3/bar/walk/stream")
+        body = response.get_data(as_text=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("event: error", body)
+        self.assertIn("event: ranking", body)
+        self.assertIn("event: result", body)
+        self.assertIn("Fri, 01 May 2020 12:30:00 GMT", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from collections import namedtuple
+from unittest.mock import patch
+
+from convergence import app
+from convergence.core import suggestions
+from convergence.core import suggestion_cache
+from convergence.core import travel_time_backends
+from convergence.utils.point import Point
+
+MemberRow = namedtuple("MemberRow", ["user_id", "latitude", "longitude"])
+
+fake_places = [
+    {"gm_id": "near", "lat": 51.501, "long": -0.1},
+    {"gm_id": "mid", "lat": 51.52, "long": -0.12},
+    {"gm_id": "far", "lat": 51.7, "long": -0.4},
+]
+
+
+class TestEstimateBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = travel_time_backends.backends["estimate"]
+        self.origins = [Point(51.5, -0.1), Point(51.49, -0.08)]
+
+    def test_estimates(self):
+        for mode, (_, fastest) in app.config["TRAVEL_SPEEDS"].items():
+            dist_matrix = self.backend.get_distance_matrix(
+                self.origins, fake_places, mode
+            )
+            self.assertEqual(len(dist_matrix), 2)
+            for row, origin in zip(dist_matrix, self.origins):
+                self.assertTrue(all(isinstance(duration, int)
+                                    for duration in row))
+                self.assertEqual(row, sorted(row))
+                for duration, place in zip(row, fake_places):
+                    distance = origin.distance_to(
+                        Point(place["lat"], place["long"])
+                    )
+                    self.assertGreaterEqual(duration,
+                                            int(distance / fastest))
+
+    def test_modes_ordered(self):
+        durations = {
+            mode: self.backend.get_distance_matrix(
+                self.origins[:1], fake_places[2:], mode
+            )[0][0]
+            for mode in ["walking", "bicycling", "driving"]
+        }
+        self.assertGreater(durations["walking"], durations["bicycling"])
+        self.assertGreater(durations["bicycling"], durations["driving"])
+
+    def test_iter_distance_matrix(self):
+        updates = list(self.backend.iter_distance_matrix(
+            self.origins, fake_places[:2], "walking"
+        ))
+        dist_matrix = self.backend.get_distance_matrix(
+            self.origins, fake_places[:2], "walking"
+        )
+        self.assertEqual(updates, [[
+            (row_idx, col_idx, dist_matrix[row_idx][col_idx])
+            for row_idx in range(2) for col_idx in range(2)
+        ]])
+
+    def test_get_backend(self):
+        self.assertEqual(travel_time_backends.get_backend(True).name,
+                         "estimate")
+        self.assertEqual(travel_time_backends.get_backend().name,
+                         app.config["TRAVEL_TIME_BACKEND"])
+
+
+class TestDegradedSuggestions(unittest.TestCase):
+
+    def setUp(self):
+        suggestion_cache.suggestion_cache.clear()
+        suggestion_cache.suggestion_state.clear()
+        patcher = patch.object(suggestions, "event_store")
+        patcher.start().get_centroid.return_value = None
+        self.addCleanup(patcher.stop)
+
+    @patch.object(travel_time_backends, "travel_times")
+    @patch.object(suggestions.places, "get_places_around_centroid")
+    @patch.object(suggestions, "userevent_store")
+    def test_degraded(self, mock_ues, mock_places, mock_tt):
+        mock_ues.get_member_locations.return_value = [
+            MemberRow(1, 51.5, -0.1),
+            MemberRow(2, 51.52, -0.12)
+        ]
+        mock_places.return_value = fake_places
+        result, meta = suggestions.get_suggestions(1, 3, "bar", "walking",
+                                                   degraded=True)
+        self.assertEqual(meta, {"cached": False, "degraded": True,
+                                "stale": False})
+        self.assertEqual([place["gm_id"] for place in result],
+                         ["mid", "near", "far"])
+        mock_tt.get_distance_matrix.assert_not_called()
+
+        self.assertTrue(suggestions.get_suggestions(
+            1, 3, "bar", "walking", degraded=True
+        )[1]["cached"])
+        # estimates are not served to, or reused by, normal requests
+        mock_tt.get_distance_matrix.side_effect = \
+            lambda origins, candidates, mode: [
+                [600] * len(candidates) for _ in origins
+            ]
+        result, meta = suggestions.get_suggestions(1, 3, "bar", "walking")
+        self.assertEqual(meta, {"cached": False, "degraded": False,
+                                "stale": False})
+        self.assertEqual({place["travel_total"] for place in result},
+                         {1200})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import sys
+import unittest
+import datetime
+from unittest.mock import patch
+
+from convergence.core import travel_times
+from convergence.data.models import TravelTime
+from convergence.utils.point import Point
+
+origins = [
+    Point(51.449457, -0.149099),  # Balham
+    Point(51.449458, -0.149098),  # Balham, same cell
+    Point(51.399944, 0.016419),  # Bromley
+]
+
+places = [
+    {"gm_id": "place_a", "lat": 51.423096, "long": -0.056820},
+    {"gm_id": "place_b", "lat": 51.506007, "long": -0.252850},
+]
+
+
+def fake_travel_time(origin, gm_id, duration):
+    return TravelTime(
+        id=hash((str(origin), gm_id)),
+        origin_cell=travel_times.snap_to_cell(origin),
+        gm_id=gm_id,
+        mode="transit",
+        duration=duration,
+        timestamp=datetime.datetime.utcnow()
+    )
+
+
+class TestGetDistanceMatrix(unittest.TestCase):
+
+    def setUp(self):
+        travel_times.cache_stats.clear()
+
+    @patch.object(travel_times, "google_maps")
+    @patch.object(travel_times, "travel_time_store")
+    def test_all_cached(self, mock_tts, mock_gm):
+        mock_tts.get_travel_times.return_value = [
+            fake_travel_time(origins[0], "place_a", 100),
+            fake_travel_time(origins[0], "place_b", None),
+            fake_travel_time(origins[2], "place_a", 300),
+            fake_travel_time(origins[2], "place_b", 400),
+        ]
+        matrix = travel_times.get_distance_matrix(origins, places, "transit")
+        self.assertEqual(matrix, [[100, sys.maxsize],
+                                  [100, sys.maxsize],
+                                  [300, 400]])
+        mock_gm.get_distance_matrix.assert_not_called()
+        mock_tts.add_travel_times.assert_not_called()
+        self.assertEqual(travel_times.get_hit_rates()["transit"]["hits"], 6)
+
+    @patch.object(travel_times, "google_maps")
+    @patch.object(travel_times, "travel_time_store")
+    def test_partially_cached(self, mock_tts, mock_gm):
+        mock_tts.get_travel_times.return_value = [
+            fake_travel_time(origins[0], "place_a", 100),
+            fake_travel_time(origins[0], "place_b", 200),
+            fake_travel_time(origins[2], "place_a", 300),
+        ]
+        mock_gm.get_distance_matrix.return_value = [[400]]
+        matrix = travel_times.get_distance_matrix(origins, places, "transit")
+        self.assertEqual(matrix, [[100, 200], [100, 200], [300, 400]])
+        requested_origins, requested_places, mode = \
+            mock_gm.get_distance_matrix.call_args[0]
+        self.assertEqual(requested_origins, [origins[2]])
+        self.assertEqual(requested_places, [Point(51.506007, -0.252850)])
+        added = mock_tts.add_travel_times.call_args[0][0]
+        self.assertEqual(len(added), 1)
+        self.assertEqual(added[0]["gm_id"], "place_b")
+        self.assertEqual(added[0]["duration"], 400)
+        stats = travel_times.get_hit_rates()["transit"]
+        self.assertEqual((stats["hits"], stats["misses"]), (5, 1))
+
+    @patch.object(travel_times, "google_maps")
+    @patch.object(travel_times, "travel_time_store")
+    def test_nothing_cached(self, mock_tts, mock_gm):
+        mock_tts.get_travel_times.return_value = []
+        mock_gm.get_distance_matrix.return_value = [[100, sys.maxsize],
+                                                    [300, 400]]
+        matrix = travel_times.get_distance_matrix(origins, places, "walking")
+        self.assertEqual(matrix, [[100, sys.maxsize],
+                                  [100, sys.maxsize],
+                                  [300, 400]])
+        self.assertEqual(len(mock_gm.get_distance_matrix.call_args[0][0]), 2)
+        added = mock_tts.add_travel_times.call_args[0][0]
+        self.assertEqual(len(added), 4)
+        self.assertIn(None, [entry["duration"] for entry in added])
+        self.assertEqual(
+            travel_times.get_hit_rates()["walking"]["hit_rate"], 0
+        )
+
+    @patch.object(travel_times, "travel_time_store")
+    def test_stale(self, mock_tts):
+        mock_tts.get_travel_times.return_value = [
+            fake_travel_time(origins[0], "place_a", 100),
+            fake_travel_time(origins[0], "place_b", None),
+            fake_travel_time(origins[2], "place_a", 300),
+        ]
+        matrix = travel_times.get_stale_distance_matrix(origins, places,
+                                                        "transit")
+        self.assertEqual(matrix, [[100, sys.maxsize],
+                                  [100, sys.maxsize],
+                                  [300, None]])
+        self.assertEqual(mock_tts.get_travel_times.call_args[0][3],
+                         datetime.datetime.min)
+
+
+@patch.object(travel_times, "evict_executor")
+@patch.object(travel_times, "travel_time_store")
+class TestEviction(unittest.TestCase):
+
+    def test_scheduled_once_per_interval(self, mock_tts, mock_executor):
+        fresh = {("1:2", "place_a"): 100}
+        with patch.object(travel_times, "last_evicted", None):
+            for _ in range(3):
+                travel_times._store(fresh, "walking",
+                                    datetime.datetime.utcnow())
+        self.assertEqual(mock_tts.add_travel_times.call_count, 3)
+        mock_tts.evict_travel_times.assert_not_called()
+        mock_executor.submit.assert_called_once_with(
+            travel_times.evict_travel_times
+        )
+
+    def test_evict(self, mock_tts, mock_executor):
+        now = datetime.datetime(2020, 5, 1)
+        mock_tts.evict_travel_times.return_value = 2
+        self.assertEqual(travel_times.evict_travel_times(now), 2)
+        mock_tts.evict_travel_times.assert_called_once_with(
+            now - travel_times.CACHE_TTL, travel_times.MAX_CACHE_ENTRIES
+        )
+
+
+class TestSnapToCell(unittest.TestCase):
+
+    def test_snap_to_cell(self):
+        self.assertEqual(travel_times.snap_to_cell(origins[0]),
+                         travel_times.snap_to_cell(origins[1]))
+        self.assertNotEqual(travel_times.snap_to_cell(origins[0]),
+                            travel_times.snap_to_cell(origins[2]))
+
+
+class TestIterDistanceMatrix(unittest.TestCase):
+
+    @patch.object(travel_times, "google_maps")
+    @patch.object(travel_times, "travel_time_store")
+    def test_partially_cached(self, mock_tts, mock_gm):
+        mock_tts.get_travel_times.return_value = [
+            fake_travel_time(origins[0], "place_a", 100),
+            fake_travel_time(origins[0], "place_b", 200),
+        ]
+        mock_gm.iter_distance_matrix.return_value = iter([
+            (0, 1, [[400]]),
+            (0, 0, [[300]]),
+        ])
+        updates = list(travel_times.iter_distance_matrix(origins, places,
+                                                         "transit"))
+        self.assertEqual(sorted(updates[0]), [(0, 0, 100), (0, 1, 200),
+                                              (1, 0, 100), (1, 1, 200)])
+        self.assertEqual(updates[1:], [[(2, 1, 400)], [(2, 0, 300)]])
+        added = mock_tts.add_travel_times.call_args[0][0]
+        self.assertEqual(len(added), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -143,6 +143,22 @@ class TestUpdateLocation(unittest.TestCase):
         response = user.update_location(7, 1.14, 9.1513)
         self.assertEqual(response, (1.14, 9.1513))
 
+    @patch.object(user, "user_store")
+    def test_update_location_moves_location_sums(self, mock_us):
+        fake_user = fakes.get_fake_user_by_id(7)
+        old_location = fake_user.get_location()
+        mock_us.get_user_by_id = lambda _: fake_user
+        user.update_location(7, 1.14, 9.1513)
+        mock_us.update_location.assert_called_once_with(fake_user,
+                                                        old_location)
+
+    @patch.object(user, "suggestion_cache")
+    @patch.object(user, "user_store")
+    def test_update_location_invalidates_suggestions(self, mock_us, mock_sc):
+        mock_us.get_user_by_id = fakes.get_fake_user_by_id
+        user.update_location(7, 1.14, 9.1513)
+        mock_sc.invalidate_user.assert_called_once_with(7)
+
     @patch.object(user, "user_store")
     def test_update_location_fail(self, mock_us):
         mock_us.get_user_by_id = fakes.get_fake_user_by_id